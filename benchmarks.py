@@ -0,0 +1,361 @@
+"""
+Benchmarks for the model, search and rendering hot paths.  Run them with run_benchmarks.py.
+
+Every benchmark measures seconds per operation, so lower is always better.
+"""
+import functools
+import os
+import random
+import statistics
+import time
+from types import ModuleType
+from typing import Set, Tuple
+
+import engine
+import model
+import perft
+import save_game
+
+
+class Benchmark:
+    def __init__(self, name, setup_func, run_func, ops_per_run, repeat=5):
+        """
+        @param setup_func () -> state, called before every run and excluded from the timing
+        @param run_func (state) -> None, the timed code
+        @param ops_per_run the number of operations that one call to run_func performs
+        @param repeat the number of timed runs
+        """
+        self.name = name
+        self._setup_func = setup_func
+        self._run_func = run_func
+        self._ops_per_run = ops_per_run
+        self._repeat = repeat
+
+    def run(self):
+        """
+        @return {'seconds_per_op': best, 'median_seconds_per_op': median, 'ops_per_run': ops}
+
+        >>> benchmark = Benchmark('sum', lambda: list(range(100)), sum, ops_per_run=100, repeat=3)
+        >>> result = benchmark.run()
+        >>> sorted(result)
+        ['median_seconds_per_op', 'ops_per_run', 'seconds_per_op']
+        >>> 0 < result['seconds_per_op'] <= result['median_seconds_per_op']
+        True
+        """
+        run_times = []
+        for _ in range(self._repeat):
+            state = self._setup_func()
+            start_time = time.perf_counter()
+            self._run_func(state)
+            run_times.append(time.perf_counter() - start_time)
+        return {
+            'seconds_per_op': min(run_times) / self._ops_per_run,
+            'median_seconds_per_op': statistics.median(run_times) / self._ops_per_run,
+            'ops_per_run': self._ops_per_run,
+        }
+
+
+_GEOMETRIES = (
+    # (consecutive_pieces_to_win, (size_x, size_y))
+    (4, (7, 6)),
+    (5, (15, 12)),
+    (4, (50, 50)),
+)
+
+
+def _get_filling_columns(size):
+    """
+    @return columns that fill the board one row at a time
+
+    >>> _get_filling_columns((3, 2))
+    [0, 1, 2, 0, 1, 2]
+    """
+    size_x, size_y = size
+    return list(range(size_x)) * size_y
+
+
+def _create_half_full_model(consecutive_pieces_to_win, size):
+    game_model = model.Model(consecutive_pieces_to_win, size)
+    columns = _get_filling_columns(size)
+    for x in columns[:len(columns) // 2]:
+        game_model.drop_piece(game_model.current_player_piece, x)
+        game_model.end_turn()
+    return game_model
+
+
+def _create_drop_piece_benchmark(name, consecutive_pieces_to_win, size):
+    columns = _get_filling_columns(size)
+
+    def run(game_model):
+        piece = model.Piece.PLAYER1
+        for x in columns:
+            game_model.drop_piece(piece, x)
+            piece = 3 - piece
+
+    return Benchmark(name,
+                     lambda: model.Model(consecutive_pieces_to_win, size),
+                     run,
+                     ops_per_run=len(columns))
+
+
+def _create_check_for_win_benchmark(name, consecutive_pieces_to_win, size):
+    size_x, _ = size
+
+    def run(game_model):
+        for x in range(size_x):
+            y = game_model.get_drop_row(x) - 1
+            game_model._check_for_win(game_model.get_piece_at_opening(x, y), x, y)
+
+    return Benchmark(name,
+                     lambda: _create_half_full_model(consecutive_pieces_to_win, size),
+                     run,
+                     ops_per_run=size_x)
+
+
+def _create_get_drop_row_benchmark(name, consecutive_pieces_to_win, size):
+    size_x, _ = size
+
+    def run(game_model):
+        for x in range(size_x):
+            game_model.get_drop_row(x)
+
+    return Benchmark(name,
+                     lambda: _create_half_full_model(consecutive_pieces_to_win, size),
+                     run,
+                     ops_per_run=size_x)
+
+
+def _create_is_tie_benchmark(name, consecutive_pieces_to_win, size):
+    def setup():
+        # Only the top-left opening is empty, which is the last one scanned.
+        game_model = model.Model(consecutive_pieces_to_win, size)
+        columns = _get_filling_columns(size)
+        game_model.initialize_from_picture([model.Piece.NONE] + [model.Piece.PLAYER1] * (len(columns) - 1))
+        return game_model
+
+    return Benchmark(name,
+                     setup,
+                     lambda game_model: game_model._is_tie(),
+                     ops_per_run=1)
+
+
+def play_random_game(consecutive_pieces_to_win, size, rng):
+    """
+    Plays random legal drops until the game ends.
+    @param rng (random.Random)
+    @return the finished model
+
+    >>> game_model = play_random_game(4, (7, 6), random.Random(0))
+    >>> game_model.winning_player is not None
+    True
+    """
+    game_model = model.Model(consecutive_pieces_to_win, size)
+    open_columns = list(range(game_model.size_x))
+    while game_model.winning_player is None:
+        x = rng.choice(open_columns)
+        game_model.drop_piece(game_model.current_player_piece, x)
+        game_model.end_turn()
+        if game_model.is_column_full(x):
+            open_columns.remove(x)
+    return game_model
+
+
+def _create_random_game_benchmark(name, num_games=200):
+    def run(rng):
+        for _ in range(num_games):
+            play_random_game(4, (7, 6), rng)
+
+    return Benchmark(name,
+                     lambda: random.Random(1234),
+                     run,
+                     ops_per_run=num_games)
+
+
+def _create_perft_benchmark(name, depth):
+    """
+    Measures seconds per perft position, the inverse of positions/sec.
+    """
+    return Benchmark(name,
+                     lambda: model.Model(4, (7, 6)),
+                     lambda game_model: perft.perft(game_model, depth),
+                     ops_per_run=perft.KNOWN_COUNTS_7X6[depth])
+
+
+_ENGINE_POSITIONS = (
+    # Columns played from the empty 7x6 board.
+    (),
+    (3, 3, 2, 4),
+    (3, 2, 3, 3, 4, 2, 2, 4),
+)
+
+
+def _create_engine_benchmark(name, opening, max_depth=5):
+    """
+    Measures seconds per searched node, the inverse of nodes/sec.
+    """
+    result = {}
+
+    def setup():
+        game_model = model.Model(4, (7, 6))
+        for x in opening:
+            game_model.drop_piece(game_model.current_player_piece, x)
+            game_model.end_turn()
+        return game_model, engine.Engine(max_depth=max_depth)
+
+    def run(state):
+        game_model, search_engine = state
+        search_engine.choose_column(game_model)
+        result['nodes'] = search_engine.last_search_stats.nodes
+
+    # The node count is deterministic, so measure it once up front.
+    run(setup())
+    return Benchmark(name,
+                     setup,
+                     run,
+                     ops_per_run=result['nodes'])
+
+
+def _create_load_saved_game_benchmark(name, size):
+    """
+    Measures unpacking a save of a half full board, which should be instant even on large boards.
+    """
+    data = save_game.pack_saved_game(save_game.SavedGame(_create_half_full_model(4, size), 0, 0))
+    return Benchmark(name,
+                     lambda: data,
+                     save_game.unpack_saved_game,
+                     ops_per_run=1)
+
+
+def _create_view_draw_benchmark(name, full_redraw, size, num_frames=120):
+    """
+    @param full_redraw if True, redraws the whole screen every frame.  Otherwise only the moving cursor is redrawn.
+    """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = 'hide'
+    import view
+
+    game_view = view.View(_create_half_full_model(4, size))
+
+    def run(_):
+        for frame in range(num_frames):
+            if full_redraw:
+                game_view._dirty = True
+            game_view.draw(frame % game_view._model.size_x)
+
+    return Benchmark(name,
+                     lambda: None,
+                     run,
+                     ops_per_run=num_frames)
+
+
+def _create_view_mass_drop_benchmark(name, size, num_frames=30):
+    """
+    Starting a new game on a full board drops every piece off of it at once.  Measures the frames of that drop.
+    """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = 'hide'
+    import view
+
+    game_model = model.Model(4, size)
+    game_view = view.View(game_model)
+
+    def setup():
+        game_model.reset_game()
+        for x in _get_filling_columns(size):
+            game_model.drop_piece(game_model.current_player_piece, x)
+            game_model.end_turn()
+        # The pieces are already at rest.
+        game_view.set_last_tracked_num_drops(len(game_model.drop_history))
+        game_view.tick(elapsed_time=0)
+        game_view.draw(0)
+        game_view.drop_all_pieces_off_of_board_from_current_location()
+        game_model.reset_game()
+        game_view.reset()
+
+    def run(_):
+        for _ in range(num_frames):
+            game_view.tick(elapsed_time=1 / 60)
+            game_view.draw(0)
+
+    return Benchmark(name, setup, run, ops_per_run=num_frames)
+
+
+def _get_benchmark_factories(include_view):
+    """
+    @return [(name, () -> Benchmark), ...].  Creating a benchmark can be slow, e.g. it may run a search or create a
+        view, so benchmarks are only created once they are selected.
+    """
+    factories = []
+
+    def add(name, create_benchmark, *args):
+        factories.append((name, functools.partial(create_benchmark, name, *args)))
+
+    for consecutive_pieces_to_win, size in _GEOMETRIES:
+        size_name = '{}x{}'.format(*size)
+        add('model.drop_piece[{}]'.format(size_name), _create_drop_piece_benchmark, consecutive_pieces_to_win, size)
+        add('model._check_for_win[{}]'.format(size_name),
+            _create_check_for_win_benchmark,
+            consecutive_pieces_to_win,
+            size)
+        add('model.get_drop_row[{}]'.format(size_name), _create_get_drop_row_benchmark, consecutive_pieces_to_win, size)
+        add('model._is_tie[{}]'.format(size_name), _create_is_tie_benchmark, consecutive_pieces_to_win, size)
+    add('random_game[7x6]', _create_random_game_benchmark)
+    add('perft[7x6,5]', _create_perft_benchmark, 5)
+    for opening in _ENGINE_POSITIONS:
+        add('engine.node[{}]'.format(''.join(map(str, opening)) or 'start'), _create_engine_benchmark, opening)
+    add('save_game.load[100x100]', _create_load_saved_game_benchmark, (100, 100))
+    if include_view:
+        add('view.draw[7x6,full]', _create_view_draw_benchmark, True, (7, 6))
+        add('view.draw[7x6,cursor]', _create_view_draw_benchmark, False, (7, 6))
+        add('view.draw[50x50,full]', _create_view_draw_benchmark, True, (50, 50))
+        add('view.mass_drop[50x50]', _create_view_mass_drop_benchmark, (50, 50))
+    return factories
+
+
+def get_benchmarks(include_view=True, name_filter=''):
+    """
+    @param name_filter only benchmarks whose name contains this string are created
+    @return an iterator of Benchmark, each created when it is reached
+
+    >>> [benchmark.name for benchmark in get_benchmarks(include_view=False, name_filter='get_drop_row')]
+    ['model.get_drop_row[7x6]', 'model.get_drop_row[15x12]', 'model.get_drop_row[50x50]']
+    """
+    for name, create_benchmark in _get_benchmark_factories(include_view):
+        if name_filter in name:
+            yield create_benchmark()
+
+
+def find_regressions(results, baseline, threshold):
+    """
+    @param results,baseline {name: {'seconds_per_op': seconds, ...}, ...}
+    @param threshold the allowed relative slowdown, e.g. 0.1 for 10%
+    @return [(name, baseline_seconds_per_op, seconds_per_op), ...] for benchmarks slower than the threshold
+
+    >>> baseline = {'a': {'seconds_per_op': 1.0}, 'b': {'seconds_per_op': 1.0}, 'c': {'seconds_per_op': 1.0}}
+    >>> results = {'a': {'seconds_per_op': 1.05}, 'b': {'seconds_per_op': 1.5}, 'd': {'seconds_per_op': 9.0}}
+    >>> find_regressions(results, baseline, threshold=0.1)
+    [('b', 1.0, 1.5)]
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        baseline_seconds_per_op = baseline[name]['seconds_per_op']
+        if result['seconds_per_op'] > baseline_seconds_per_op * (1 + threshold):
+            regressions.append((name, baseline_seconds_per_op, result['seconds_per_op']))
+    return regressions
+
+
+def run_tests(headless: bool) -> Tuple[Tuple[int, int], Set[ModuleType]]:
+    """
+    @return ((failure_count, test_count), tested_modules)
+    """
+    import sys
+    import test
+    return test.run_doctests(sys.modules[__name__],
+                             module_dependencies=[engine, model, perft, save_game],
+                             headless=headless)
+
+
+if __name__ == '__main__':
+    run_tests(headless=False)
@@ -1,3 +1,9 @@
+import time
+# As early as possible, to measure the startup time.
+_START_TIME = time.perf_counter()
+
+import argparse
+import sys
 from types import ModuleType
 from typing import Set, Tuple
 
@@ -5,8 +11,59 @@ import controller
 
 
 def _main():
-    game_controller = controller.Controller()
-    game_controller.run()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--profile-frames', nargs='?', const='-', metavar='PATH',
+                        help='on quit, write per-phase frame timings to PATH (default: stdout)')
+    network_group = parser.add_mutually_exclusive_group()
+    network_group.add_argument('--connect', metavar='HOST:PORT', help='play against an opponent on a game server')
+    network_group.add_argument('--loopback', action='store_true',
+                               help='play against a random opponent on a local stand-in game server')
+    parser.add_argument('--save-file', metavar='PATH',
+                        help='resume the game saved in PATH, if any, and save the game in progress to it on quit')
+    parser.add_argument('--record-events', metavar='PATH',
+                        help='record the input events to PATH, to replay with event_recording.py')
+    parser.add_argument('--test', action='store_true', help='run the tests first, and only start if they pass')
+    parser.add_argument('--measure-startup', action='store_true',
+                        help='print the time from starting to the end of the first frame, then quit')
+    args = parser.parse_args()
+    if args.save_file and (args.connect or args.loopback):
+        parser.error('network games cannot be saved')
+    if args.record_events and (args.save_file or args.connect or args.loopback):
+        parser.error('only new local games can be recorded')
+
+    if args.test:
+        (failure_count, test_count), tested_modules = run_tests(headless=False)
+        if failure_count:
+            sys.exit(1)
+
+    network_opponent = None
+    loopback_server = None
+    if args.connect or args.loopback:
+        import network_client
+        if args.loopback:
+            loopback_server = network_client.LoopbackServer()
+            loopback_server.start()
+            host, port = '127.0.0.1', loopback_server.port
+        else:
+            host, _, port = args.connect.rpartition(':')
+        network_opponent = network_client.NetworkOpponent(host, int(port),
+                                                          on_message=controller.post_network_message_event)
+
+    game_controller = controller.Controller(frame_profile_path=args.profile_frames,
+                                            network_opponent=network_opponent,
+                                            save_path=args.save_file,
+                                            start_time=_START_TIME,
+                                            event_recording_path=args.record_events)
+    try:
+        if args.measure_startup:
+            game_controller.run(num_frames=1)
+            print('Startup: {:.1f} ms to the first frame'.format(1000 * game_controller.get_startup_time()))
+        else:
+            game_controller.run()
+    finally:
+        # Quitting closes the network opponent first.
+        if loopback_server is not None:
+            loopback_server.stop()
 
 
 def run_tests(headless: bool) -> Tuple[Tuple[int, int], Set[ModuleType]]:
@@ -14,11 +71,23 @@ def run_tests(headless: bool) -> Tuple[Tuple[int, int], Set[ModuleType]]:
     @return ((failure_count, test_count), tested_modules)
     """
     import sys
+    import benchmarks
+    import dataset
+    import game_record
+    import game_server
+    import replay_renderer
     import test
-    return test.run_doctests(sys.modules[__name__], module_dependencies=[controller], headless=headless)
+    import tournament
+    return test.run_doctests(sys.modules[__name__],
+                             module_dependencies=[benchmarks,
+                                                  controller,
+                                                  dataset,
+                                                  game_record,
+                                                  game_server,
+                                                  replay_renderer,
+                                                  tournament],
+                             headless=headless)
 
 
 if __name__ == '__main__':
-    (failure_count, test_count), tested_modules = run_tests(headless=False)
-    if failure_count == 0:
-        _main()
+    _main()
@@ -1,4 +1,5 @@
 import sys
+import time
 from types import ModuleType
 from typing import Set, Tuple
 
@@ -6,13 +7,27 @@ import os
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = 'hide'
 import pygame
 
+import frame_profiler
 import key
 import key_binding_manager
 import main_menu_controller
 import model
+import performance_overlay
 import view
 
 
+# Posted to wake up a game loop that is waiting for events.
+NETWORK_MESSAGE_EVENT = pygame.event.custom_type()
+
+
+def post_network_message_event():
+    """
+    Use as the network_client.NetworkOpponent on_message callback.  Called on the network threads.
+    """
+    if pygame.display.get_init():
+        pygame.event.post(pygame.event.Event(NETWORK_MESSAGE_EVENT))
+
+
 class Controller:
     """
     >>> controller = Controller()
@@ -20,22 +35,129 @@ class Controller:
     >>> controller._move(-1)
     >>> controller._move(1)
     >>> controller._toggle_main_menu()
+    >>> controller._handle_action(key_binding_manager.Action.TOGGLE_PERFORMANCE_OVERLAY)
+    >>> controller._performance_overlay.is_enabled()
+    True
+
+    With a save file, the game in progress is saved on quit and resumed on the next start.
+    >>> import tempfile
+    >>> save_directory = tempfile.TemporaryDirectory()
+    >>> save_path = os.path.join(save_directory.name, 'game.sav')
+    >>> controller = Controller(save_path=save_path)
+    >>> controller._toggle_main_menu()
+    >>> controller._attempt_to_drop_piece_for_current_player_at_current_location()
+    >>> controller._move(1)
+    >>> controller._save_game()
+    >>> resumed_controller = Controller(save_path=save_path)
+    >>> resumed_controller._model.drop_history, resumed_controller._drop_x
+    ([(1, 3, 0)], 4)
+    >>> resumed_controller._main_menu_controller.is_enabled()
+    False
+    >>> save_directory.cleanup()
+
+    Against a network opponent, remote moves are dropped as they arrive and local drops are sent.
+    >>> import network_client
+    >>> controller = Controller(network_opponent=network_client.NetworkOpponent('127.0.0.1', 0))
+    >>> sent_drops = []
+    >>> controller._network_opponent.send_drop = sent_drops.append
+    >>> controller._handle_network_message(network_client.Message('GAME', [0, 2, 4, 7, 6]))
+    Playing as player 2
+    >>> controller._handle_network_message(network_client.Message('MOVE', [1, 0, 0]))
+    >>> controller._attempt_to_drop_piece_for_current_player_at_current_location()
+    >>> sent_drops
+    [3]
+    >>> controller._handle_network_message(network_client.Message('MOVE', [2, 3, 0]))
+    >>> controller._model.drop_history
+    [(1, 0, 0), (2, 3, 0)]
+
+    Local drops are ignored during the opponent's turn.
+    >>> controller._attempt_to_drop_piece_for_current_player_at_current_location()
+    >>> sent_drops
+    [3]
+
+    While nothing is animating, a frame waits for the next event instead of ticking.
+    >>> controller = Controller()
+    >>> controller._view = view.View(controller._model)
+    >>> controller._run_frame()
+    >>> controller._view.is_idle()
+    True
+    >>> post_network_message_event()
+    >>> controller._wait_while_idle().type == NETWORK_MESSAGE_EVENT
+    True
+
+    Every key press in a frame is handled, with its modifiers from the event, and all of them are shown by the
+    frame's single draw.
+    >>> controller._toggle_main_menu()
+    >>> _ = pygame.event.get()
+    >>> for pressed_key in (pygame.K_RIGHT, pygame.K_RIGHT, pygame.K_LEFT, pygame.K_RIGHT):
+    ...     _ = pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=pressed_key, mod=0))
+    >>> _ = pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_F3, mod=pygame.KMOD_LSHIFT))
+    >>> controller._run_frame()
+    >>> controller._drop_x, controller._performance_overlay.is_enabled()
+    (5, False)
+    >>> profiler = controller._frame_profiler
+    >>> profiler.total_frames, len(profiler.get_durations(frame_profiler.Phase.INPUT_LATENCY))
+    (2, 1)
+
+    Recorded input replays through the same frames, with the same keys, without waiting for events.
+    >>> import event_recording
+    >>> recording_directory = tempfile.TemporaryDirectory()
+    >>> recording_path = os.path.join(recording_directory.name, 'events.jsonl')
+    >>> controller = Controller(event_recording_path=recording_path)
+    >>> _ = pygame.event.get()
+    >>> for pressed_key in (pygame.K_ESCAPE, pygame.K_RIGHT, pygame.K_DOWN):
+    ...     _ = pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=pressed_key, mod=0))
+    >>> controller.run(num_frames=30) # doctest:+ELLIPSIS
+    Menu: escape
+    ...
+    >>> controller._event_recorder.close()
+    >>> replay_controller = Controller()
+    >>> profiler = replay_controller.replay(event_recording.read_recorded_frames(recording_path))
+    >>> replay_controller._model.drop_history == controller._model.drop_history == [(1, 4, 0)]
+    True
+    >>> profiler.total_frames
+    30
+    >>> recording_directory.cleanup()
     """
+    # Only a safety net: anything that changes the view while idle posts an event.
+    _IDLE_WAIT_TIMEOUT = 1000  # milliseconds
 
     _CONSECUTIVE_PIECES_TO_WIN = 4
     _BOARD_SIZE_X = 7
     _BOARD_SIZE_Y = 6
 
-    def __init__(self):
+    def __init__(self, frame_profile_path=None, network_opponent=None, save_path=None, start_time=None,
+                 event_recording_path=None):
+        """
+        @param frame_profile_path where to dump the frame profile on quit, '-' for stdout, or None to not dump it
+        @param network_opponent (network_client.NetworkOpponent) plays the other player, or None for local play
+        @param save_path the game in progress is resumed from this file, if it exists, and saved to it on quit.
+            None to not save.
+        @param start_time (time.perf_counter()) when the program started, to measure the time to the first frame,
+            or None to not measure it
+        @param event_recording_path where to record the handled input events, for event_recording to replay, or None
+            to not record them
+        """
         self._model = model.Model(self._CONSECUTIVE_PIECES_TO_WIN, (self._BOARD_SIZE_X, self._BOARD_SIZE_Y))
         self._view = None
         self._key_binding_manager = key_binding_manager.KeyBindingManager()
         self._main_menu_controller = main_menu_controller.MainMenuController(self._key_binding_manager,
-                                                                             self._reset_game,
+                                                                             self._start_new_game,
                                                                              self._quit)
+        self._frame_profiler = frame_profiler.FrameProfiler()
+        self._frame_profile_path = frame_profile_path
+        self._performance_overlay = performance_overlay.PerformanceOverlay(self._frame_profiler)
+        self._network_opponent = network_opponent
+        self._local_piece = None
+        self._save_path = save_path
+        self._resumed_last_tracked_num_drops = None
         self._reset_game()
-
-        pygame.init()
+        self._start_time = start_time
+        self._event_recording_path = event_recording_path
+        self._event_recorder = None
+        self._has_handled_key_press = False
+        if save_path is not None and os.path.exists(save_path):
+            self._resume_game()
 
     def _reset_game(self):
         # This needs to be done before the model is reset.
@@ -47,31 +169,216 @@ class Controller:
         if self._view:
             self._view.reset()
 
-    def run(self):
+    def _start_new_game(self):
+        self._reset_game()
+        if self._network_opponent is not None:
+            # The local player's piece is assigned once the server pairs us with an opponent.
+            self._local_piece = None
+            self._network_opponent.join()
+
+    def _resume_game(self):
+        import save_game
+        saved_game = save_game.load_game(self._save_path)
+        self._model = saved_game.model
+        self._drop_x = saved_game.drop_x
+        # The view is created in run().
+        self._resumed_last_tracked_num_drops = saved_game.last_tracked_num_drops
+        if self._is_game_playing():
+            self._toggle_main_menu()
+
+    def _save_game(self):
+        if self._is_game_playing() and self._model.drop_history:
+            last_tracked_num_drops = (self._view.get_last_tracked_num_drops() if self._view
+                                      else len(self._model.drop_history))
+            import save_game
+            save_game.save_game(self._save_path, save_game.SavedGame(self._model, self._drop_x, last_tracked_num_drops))
+        elif os.path.exists(self._save_path):
+            # There is nothing to resume.
+            os.remove(self._save_path)
+
+    def run(self, num_frames=None):
+        """
+        @param num_frames the number of frames to run before returning, or None to run until quit
+        """
         self._key_binding_manager.print_controls()
+        if self._network_opponent is not None:
+            self._network_opponent.start()
+        self._create_view()
+        if self._event_recording_path is not None:
+            # Only imported when recording, to start faster.
+            import event_recording
+            self._event_recorder = event_recording.EventRecorder(self._event_recording_path)
+
+        self._run_frame()
+        if self._start_time is not None:
+            self._frame_profiler.startup_time = time.perf_counter() - self._start_time
+        frame_index = 1
+        while num_frames is None or frame_index < num_frames:
+            self._run_frame()
+            frame_index += 1
+
+    def replay(self, recorded_frames, speed=None):
+        """
+        Runs a frame for each recorded frame, with its events and elapsed time instead of the live ones.  Frames never
+        wait for events, and the replay ends early if it reaches a quit.
+        @param recorded_frames iterable(event_recording.RecordedFrame), recorded from a new Controller
+        @param speed replays at this multiple of the recorded speed, or None to replay as fast as possible.  The
+            animations advance by the recorded elapsed times either way.
+        @return (frame_profiler.FrameProfiler) the timings of the replayed frames
+        """
+        self._create_view()
+        start_time = time.perf_counter()
+        for recorded_frame in recorded_frames:
+            if speed is not None:
+                delay = start_time + recorded_frame.time / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            try:
+                self._run_frame(recorded_frame)
+            except SystemExit:
+                break
+        return self._frame_profiler
+
+    def _create_view(self):
         self._view = view.View(self._model)
+        if self._resumed_last_tracked_num_drops is not None:
+            self._view.set_last_tracked_num_drops(self._resumed_last_tracked_num_drops)
         self._view.add_layer(self._main_menu_controller)
+        self._view.add_layer(self._performance_overlay)
 
-        while True:
+    def get_startup_time(self):
+        """
+        @return (seconds) from the start time to the end of the first frame, or None if it was not measured
+        """
+        return self._frame_profiler.startup_time
+
+    def _run_frame(self, recorded_frame=None):
+        """
+        @param recorded_frame (event_recording.RecordedFrame) to replay its events and elapsed time instead of handling
+            the live ones, or None
+        """
+        profiler = self._frame_profiler
+        profiler.start_frame()
+
+        # Input is handled after waiting, right before the frame is drawn, so that input which arrives during the
+        # wait is shown this frame.  A frame woken up by input does not wait any longer.
+        start_time = time.perf_counter()
+        waited_event = None
+        if recorded_frame is None:
+            waited_event = self._wait_while_idle()
+            if waited_event is None:
+                self._view.wait_for_next_frame()
+        input_start_time = time.perf_counter()
+        profiler.record(frame_profiler.Phase.SLEEP, input_start_time - start_time)
+
+        self._has_handled_key_press = False
+        if self._event_recorder is not None:
+            self._event_recorder.start_frame()
+        if recorded_frame is None:
+            if waited_event is not None:
+                self._handle_event(waited_event)
             self._handle_events()
-            self._tick()
-            self._tick_view()
-            self._draw()
+        else:
+            for event, modified_key in recorded_frame.events:
+                self._handle_event(event, modified_key)
+        end_time = time.perf_counter()
+        profiler.record(frame_profiler.Phase.HANDLE_EVENTS, end_time - input_start_time)
+
+        start_time = end_time
+        self._tick()
+        end_time = time.perf_counter()
+        profiler.record(frame_profiler.Phase.TICK, end_time - start_time)
+
+        start_time = end_time
+        self._tick_view(None if recorded_frame is None else recorded_frame.elapsed_time)
+        end_time = time.perf_counter()
+        if self._event_recorder is not None:
+            self._event_recorder.end_frame(self._view.last_tick_elapsed_time)
+        profiler.record(frame_profiler.Phase.TICK_VIEW, end_time - start_time)
+
+        start_time = end_time
+        drew = self._draw()
+        end_time = time.perf_counter()
+        profiler.record(frame_profiler.Phase.DRAW, end_time - start_time)
+        if self._has_handled_key_press:
+            profiler.record(frame_profiler.Phase.INPUT_LATENCY, end_time - input_start_time)
+
+        profiler.end_frame(drew)
 
-    @staticmethod
-    def _quit():
+    def _wait_while_idle(self):
+        """
+        Blocks until an event arrives if the view is idle, so an idle window uses no CPU.
+        Otherwise the loop keeps ticking at the view's fixed rate.
+        @return the event that ended the wait, or None if there was no wait or it timed out
+        """
+        if not self._view.is_idle():
+            return None
+        event = pygame.event.wait(self._IDLE_WAIT_TIMEOUT)
+        return None if event.type == pygame.NOEVENT else event
+
+    def _quit(self):
+        if self._save_path is not None:
+            self._save_game()
+        if self._frame_profile_path is not None:
+            self._frame_profiler.dump(self._frame_profile_path)
+        if self._event_recorder is not None:
+            self._event_recorder.close()
+        if self._network_opponent is not None:
+            self._network_opponent.close()
         pygame.quit()
         sys.exit(0)
 
     def _handle_events(self):
         for event in pygame.event.get():
             self._handle_event(event)
+        if self._network_opponent is not None:
+            for message in self._network_opponent.poll_messages():
+                self._handle_network_message(message)
+
+    def _handle_network_message(self, message):
+        """
+        @param message (network_client.Message)
+        """
+        # Only imported for network games, to start faster.
+        import network_client
+        if message.type == network_client.MessageType.MOVE:
+            piece, x, _ = message.arguments
+            # The local player's drops were already made when they were sent.
+            if piece != self._local_piece:
+                self._attempt_to_drop_piece(piece, x)
+                self._show_main_menu_if_game_over()
+        elif message.type == network_client.MessageType.GAME:
+            self._local_piece = message.arguments[1]
+            print('Playing as player {}'.format(self._local_piece))
+        elif message.type == network_client.MessageType.END:
+            if self._is_game_playing():
+                print('The opponent left the game')
+                self._local_piece = None
+                if not self._main_menu_controller.is_enabled():
+                    self._toggle_main_menu()
+        elif message.type == network_client.MessageType.ERROR:
+            print('Server error: {}'.format(' '.join(map(str, message.arguments))))
+        elif message.type == network_client.MessageType.DISCONNECTED:
+            print('Disconnected from the server')
+            self._local_piece = None
+
+    def _handle_event(self, event, modified_key=None):
+        """
+        @param modified_key the key.ModifiedKey that a KEYDOWN event was resolved to, e.g. when replaying, or None to
+            resolve it from the event's modifiers
+        """
+        if event.type == pygame.KEYDOWN:
+            self._has_handled_key_press = True
+            if modified_key is None:
+                modified_key = key.get_modified_key(event)
+        if self._event_recorder is not None:
+            self._event_recorder.record_event(event, modified_key)
 
-    def _handle_event(self, event):
         if event.type == pygame.QUIT:
             self._quit()
+        elif event.type == pygame.VIDEORESIZE:
+            self._view.set_window_size(event.size)
         elif event.type == pygame.KEYDOWN:
-            modified_key = key.get_key_with_current_modifiers(event.key)
             self._handle_event_key_down(modified_key)
 
     def _handle_event_key_down(self, modified_key):
@@ -90,6 +397,8 @@ class Controller:
         assert(action is not None)
         if action == key_binding_manager.Action.QUIT:
             pygame.event.post(pygame.event.Event(pygame.QUIT))
+        elif action == key_binding_manager.Action.TOGGLE_PERFORMANCE_OVERLAY:
+            self._performance_overlay.toggle()
         elif self._is_game_playing():
             if action == key_binding_manager.Action.DROP_PIECE:
                 self._attempt_to_drop_piece_for_current_player_at_current_location()
@@ -101,7 +410,14 @@ class Controller:
                 self._toggle_main_menu()
 
     def _attempt_to_drop_piece_for_current_player_at_current_location(self):
-        self._attempt_to_drop_piece(self._get_current_player_piece(), self._drop_x)
+        piece = self._get_current_player_piece()
+        if self._network_opponent is not None and piece != self._local_piece:
+            return
+        if self._attempt_to_drop_piece(piece, self._drop_x) and self._network_opponent is not None:
+            self._network_opponent.send_drop(self._drop_x)
+        self._show_main_menu_if_game_over()
+
+    def _show_main_menu_if_game_over(self):
         if not self._is_game_playing():
             self._toggle_main_menu()
 
@@ -109,11 +425,13 @@ class Controller:
         """
         @param piece (model.Piece)
         @param x (Number) the column to drop the piece into
+        @return True if the piece was dropped, False if the column is full
         """
         if self._model.is_column_full(x):
-            return
+            return False
         self._model.drop_piece(piece, x)
         self._model.end_turn()
+        return True
 
     def _move(self, dx):
         self._drop_x = (self._drop_x + dx) % self._model.size_x
@@ -125,10 +443,13 @@ class Controller:
         pass
 
     def _draw(self):
-        self._view.draw(self._drop_x)
+        """
+        @return True if the view was drawn, False if the draw was skipped because nothing changed
+        """
+        return self._view.draw(self._drop_x)
 
-    def _tick_view(self):
-        self._view.tick()
+    def _tick_view(self, elapsed_time=None):
+        self._view.tick(elapsed_time)
 
     def _get_current_player_piece(self):
         return self._model.current_player_piece
@@ -142,12 +463,20 @@ def run_tests(headless: bool) -> Tuple[Tuple[int, int], Set[ModuleType]]:
     @return ((failure_count, test_count), tested_modules)
     """
     import sys
+    import event_recording
+    import network_client
+    import save_game
     import test
     return test.run_doctests(sys.modules[__name__],
-                             module_dependencies=[key,
+                             module_dependencies=[event_recording,
+                                                  frame_profiler,
+                                                  key,
                                                   key_binding_manager,
                                                   main_menu_controller,
                                                   model,
+                                                  network_client,
+                                                  performance_overlay,
+                                                  save_game,
                                                   view],
                              headless=headless)
 
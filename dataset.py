@@ -0,0 +1,282 @@
+"""
+Generates datasets of labeled positions for training evaluation models.
+
+Positions are sampled from random play or self-play and labeled with an engine search.  The dataset is a directory of
+chunks, each a set of .npy files that NumPy can memory-map, e.g. numpy.load(path, mmap_mode='r'):
+    chunk-NNNNN-boards.npy        uint8 (n, 2, size_y, size_x)  planes of PLAYER1's and PLAYER2's pieces; row 0 is
+                                                                the bottom of the board
+    chunk-NNNNN-side_to_move.npy  uint8 (n,)                    the piece of the player to move
+    chunk-NNNNN-values.npy        int8 (n,)                     1 if the player to move has a forced win within the
+                                                                search depth, -1 for a forced loss, otherwise 0
+    chunk-NNNNN-scores.npy        int32 (n,)                    the engine's score for the player to move
+    chunk-NNNNN-best_moves.npy    uint16 (n,)                   the engine's best column
+
+Chunks are streamed to disk as they are generated, in parallel, and each is seeded independently, so an interrupted
+run is resumed by running it again: completed chunks are kept.
+
+Usage:
+    python dataset.py --output positions --positions 10000000 --depth 6
+"""
+import argparse
+import ast
+import concurrent.futures
+import json
+import os
+import random
+import struct
+from types import ModuleType
+from typing import Set, Tuple
+
+import engine
+import model
+
+
+class SamplingMode:
+    RANDOM = 'random'
+    SELF_PLAY = 'self-play'
+
+
+_NPY_MAGIC = b'\x93NUMPY\x01\x00'
+_NPY_HEADER_ALIGNMENT = 64
+_MANIFEST_FILE_NAME = 'dataset.json'
+
+# (name, numpy dtype descr, struct format of one element)
+_ARRAYS = (
+    ('boards', '|u1', 'B'),
+    ('side_to_move', '|u1', 'B'),
+    ('values', '|i1', 'b'),
+    ('scores', '<i4', '<i'),
+    ('best_moves', '<u2', '<H'),
+)
+
+_SELF_PLAY_RANDOM_MOVE_PROBABILITY = 0.2
+_SELF_PLAY_MAX_DEPTH = 2
+
+
+def encode_npy_header(descr, shape):
+    """
+    @param descr the numpy dtype descr, e.g. '<i4'
+    @param shape (dimension, ...)
+    @return the header of a version 1.0 .npy file, padded so that the data is aligned
+
+    >>> header = encode_npy_header('<i4', (3,))
+    >>> len(header)
+    128
+    >>> header[10:].rstrip()
+    b"{'descr': '<i4', 'fortran_order': False, 'shape': (3,), }"
+    """
+    dictionary = "{{'descr': '{}', 'fortran_order': False, 'shape': {!r}, }}".format(descr, tuple(shape)).encode()
+    unpadded_length = len(_NPY_MAGIC) + 2 + len(dictionary) + 1
+    padding = -unpadded_length % _NPY_HEADER_ALIGNMENT
+    dictionary += b' ' * padding + b'\n'
+    return _NPY_MAGIC + struct.pack('<H', len(dictionary)) + dictionary
+
+
+def read_npy_header(path):
+    """
+    @return (descr, shape, data_offset)
+    """
+    with open(path, 'rb') as file:
+        if file.read(len(_NPY_MAGIC)) != _NPY_MAGIC:
+            raise ValueError('{} is not a version 1.0 .npy file'.format(path))
+        header_length, = struct.unpack('<H', file.read(2))
+        dictionary = ast.literal_eval(file.read(header_length).decode())
+    return dictionary['descr'], dictionary['shape'], len(_NPY_MAGIC) + 2 + header_length
+
+
+def get_chunk_path(directory, chunk_index, array_name):
+    return os.path.join(directory, 'chunk-{:05}-{}.npy'.format(chunk_index, array_name))
+
+
+def _is_chunk_complete(directory, chunk_index):
+    return all(os.path.exists(get_chunk_path(directory, chunk_index, name)) for name, _, _ in _ARRAYS)
+
+
+def _play_move(game_model, rng, sampling, play_engine):
+    open_columns = [x for x in range(game_model.size_x) if not game_model.is_column_full(x)]
+    if sampling == SamplingMode.SELF_PLAY and rng.random() >= _SELF_PLAY_RANDOM_MOVE_PROBABILITY:
+        x = play_engine.choose_column(game_model)
+    else:
+        x = rng.choice(open_columns)
+    game_model.drop_piece(game_model.current_player_piece, x)
+    game_model.end_turn()
+
+
+def _sample_position(consecutive_pieces_to_win, size, rng, sampling, play_engine):
+    """
+    Plays a game up to a uniformly chosen ply.  Games that end before that ply are discarded, so every sampled
+    position is still in progress.
+    @return (model.Model)
+    """
+    size_x, size_y = size
+    while True:
+        # Each game starts with an empty transposition table, so that it neither grows without bound over the run nor
+        # lets earlier games affect later ones.
+        play_engine.reset()
+        game_model = model.Model(consecutive_pieces_to_win, size)
+        num_plies = rng.randrange(size_x * size_y)
+        while len(game_model.drop_history) < num_plies and game_model.winning_player is None:
+            _play_move(game_model, rng, sampling, play_engine)
+        if game_model.winning_player is None:
+            return game_model
+
+
+def _encode_board(game_model):
+    size_x, size_y = game_model.size_x, game_model.size_y
+    board = bytearray(2 * size_x * size_y)
+    for piece, x, y in game_model.drop_history:
+        board[(piece - 1) * size_x * size_y + y * size_x + x] = 1
+    return board
+
+
+def _generate_chunk(arguments):
+    """
+    Writes the chunk's arrays to temporary files, then renames them once all are complete.
+    @return the chunk index
+    """
+    (directory, chunk_index, num_positions, consecutive_pieces_to_win, size, sampling, search_depth,
+     seed) = arguments
+    size_x, size_y = size
+    rng = random.Random('{}-{}'.format(seed, chunk_index))
+    play_engine = engine.Engine(max_depth=_SELF_PLAY_MAX_DEPTH)
+    search_engine = engine.Engine(max_depth=search_depth)
+
+    shapes = {'boards': (num_positions, 2, size_y, size_x)}
+    files = {}
+    try:
+        for name, descr, _ in _ARRAYS:
+            files[name] = open(get_chunk_path(directory, chunk_index, name) + '.tmp', 'wb')
+            files[name].write(encode_npy_header(descr, shapes.get(name, (num_positions,))))
+        formats = {name: struct.Struct(element_format) for name, _, element_format in _ARRAYS}
+
+        for _ in range(num_positions):
+            game_model = _sample_position(consecutive_pieces_to_win, size, rng, sampling, play_engine)
+            # Keep the transposition table from growing across positions.
+            search_engine.reset()
+            best_x = search_engine.choose_column(game_model)
+            score = search_engine.last_search_score
+            files['boards'].write(_encode_board(game_model))
+            files['side_to_move'].write(formats['side_to_move'].pack(game_model.current_player_piece))
+            files['values'].write(formats['values'].pack(search_engine.get_proven_result(score)))
+            files['scores'].write(formats['scores'].pack(score))
+            files['best_moves'].write(formats['best_moves'].pack(best_x))
+    finally:
+        for file in files.values():
+            file.close()
+
+    for name, _, _ in _ARRAYS:
+        path = get_chunk_path(directory, chunk_index, name)
+        os.replace(path + '.tmp', path)
+    return chunk_index
+
+
+def generate_dataset(directory, num_positions, consecutive_pieces_to_win=4, size=(7, 6), chunk_size=65536,
+                     sampling=SamplingMode.RANDOM, search_depth=6, seed=0, workers=None):
+    """
+    Generates the chunks that are not already complete in directory.
+    @param size (columns, rows)
+    @param sampling (SamplingMode)
+    @param search_depth the depth of the search that labels each position
+    @param workers the number of processes to generate chunks in, None for one per core, or 1 for this process
+    @return the number of chunks generated
+
+    >>> import tempfile
+    >>> directory = tempfile.TemporaryDirectory()
+    >>> generate_dataset(directory.name, 10, chunk_size=4, search_depth=2, workers=1)
+    3
+    >>> read_npy_header(get_chunk_path(directory.name, 0, 'boards'))
+    ('|u1', (4, 2, 6, 7), 128)
+    >>> read_npy_header(get_chunk_path(directory.name, 2, 'scores'))[:2]
+    ('<i4', (2,))
+
+    Every position is still in progress, with the player to move set by the number of pieces.
+    >>> _, _, offset = read_npy_header(get_chunk_path(directory.name, 0, 'side_to_move'))
+    >>> with open(get_chunk_path(directory.name, 0, 'boards'), 'rb') as file:
+    ...     boards = file.read()[128:]
+    >>> with open(get_chunk_path(directory.name, 0, 'side_to_move'), 'rb') as file:
+    ...     side_to_move = file.read()[offset:]
+    >>> board_length = 2 * 6 * 7
+    >>> all(side_to_move[index] == (1 if sum(boards[index * board_length:(index + 1) * board_length]) % 2 == 0 else 2)
+    ...     for index in range(4))
+    True
+
+    Completed chunks are kept when resuming.
+    >>> os.remove(get_chunk_path(directory.name, 1, 'values'))
+    >>> generate_dataset(directory.name, 10, chunk_size=4, search_depth=2, workers=1)
+    1
+    >>> generate_dataset(directory.name, 10, chunk_size=8, search_depth=2, workers=1)
+    Traceback (most recent call last):
+    ValueError: The existing dataset was generated with different settings
+    >>> directory.cleanup()
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest = {
+        'consecutive_pieces_to_win': consecutive_pieces_to_win,
+        'size': list(size),
+        'num_positions': num_positions,
+        'chunk_size': chunk_size,
+        'sampling': sampling,
+        'search_depth': search_depth,
+        'seed': seed,
+    }
+    manifest_path = os.path.join(directory, _MANIFEST_FILE_NAME)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as file:
+            if json.load(file) != manifest:
+                raise ValueError('The existing dataset was generated with different settings')
+    else:
+        with open(manifest_path, 'w') as file:
+            json.dump(manifest, file, indent=2)
+
+    num_chunks = -(-num_positions // chunk_size)
+    chunks = [(directory,
+               chunk_index,
+               min(chunk_size, num_positions - chunk_index * chunk_size),
+               consecutive_pieces_to_win,
+               size,
+               sampling,
+               search_depth,
+               seed)
+              for chunk_index in range(num_chunks)
+              if not _is_chunk_complete(directory, chunk_index)]
+
+    if workers == 1:
+        for chunk in chunks:
+            _generate_chunk(chunk)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            for num_generated_chunks, chunk_index in enumerate(executor.map(_generate_chunk, chunks), 1):
+                print('Generated chunk {} ({}/{})'.format(chunk_index, num_generated_chunks, len(chunks)))
+    return len(chunks)
+
+
+def _main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', required=True, help='the dataset directory; rerun to resume')
+    parser.add_argument('--positions', type=int, required=True)
+    parser.add_argument('--size', default='7x6', help='COLUMNSxROWS')
+    parser.add_argument('--connect', type=int, default=4, help='consecutive pieces to win')
+    parser.add_argument('--chunk-size', type=int, default=65536, help='positions per chunk')
+    parser.add_argument('--sampling', choices=[SamplingMode.RANDOM, SamplingMode.SELF_PLAY], default=SamplingMode.RANDOM)
+    parser.add_argument('--depth', type=int, default=6, help='the depth of the labeling search')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help='defaults to one per core')
+    args = parser.parse_args()
+
+    size = tuple(int(value) for value in args.size.split('x'))
+    num_chunks = generate_dataset(args.output, args.positions, args.connect, size, args.chunk_size, args.sampling,
+                                  args.depth, args.seed, args.workers)
+    print('Generated {} chunks in {}'.format(num_chunks, args.output))
+
+
+def run_tests(headless: bool) -> Tuple[Tuple[int, int], Set[ModuleType]]:
+    """
+    @return ((failure_count, test_count), tested_modules)
+    """
+    import sys
+    import test
+    return test.run_doctests(sys.modules[__name__], module_dependencies=[engine, model], headless=headless)
+
+
+if __name__ == '__main__':
+    _main()
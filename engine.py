@@ -0,0 +1,343 @@
+"""
+A computer player: an iterative-deepening negamax search with alpha-beta pruning and a transposition table.
+"""
+import time
+from types import ModuleType
+from typing import Set, Tuple
+
+import model
+
+
+class EngineStats:
+    """
+    Search statistics, accumulated across one or more searches.
+
+    >>> stats = EngineStats()
+    >>> stats.nodes, stats.search_time, stats.tt_lookups, stats.tt_hits = 1000, 0.5, 10, 4
+    >>> stats.moves = 2
+    >>> stats.nodes_per_second, stats.time_per_move, stats.tt_hit_rate
+    (2000.0, 0.25, 0.4)
+    """
+    def __init__(self):
+        self.nodes = 0
+        self.search_time = 0.0
+        self.depth = 0
+        self.tt_lookups = 0
+        self.tt_hits = 0
+        self.moves = 0
+
+    @property
+    def nodes_per_second(self):
+        return self.nodes / self.search_time if self.search_time > 0 else 0.0
+
+    @property
+    def time_per_move(self):
+        return self.search_time / self.moves if self.moves > 0 else 0.0
+
+    @property
+    def tt_hit_rate(self):
+        return self.tt_hits / self.tt_lookups if self.tt_lookups > 0 else 0.0
+
+    def add(self, other):
+        """
+        @param other (EngineStats) the stats to accumulate into these stats
+        """
+        self.nodes += other.nodes
+        self.search_time += other.search_time
+        self.depth = max(self.depth, other.depth)
+        self.tt_lookups += other.tt_lookups
+        self.tt_hits += other.tt_hits
+        self.moves += other.moves
+
+
+class _SearchTimeout(Exception):
+    pass
+
+
+class _Bound:
+    EXACT = 0
+    LOWER = 1
+    UPPER = 2
+
+
+class Engine:
+    """
+    >>> engine = Engine(max_depth=4)
+
+    Takes an immediate win.
+    >>> m = model.Model._create_from_picture(4, (7, 6), [
+    ... 0, 0, 0, 0, 0, 0, 0,
+    ... 0, 0, 0, 0, 0, 0, 0,
+    ... 0, 0, 0, 0, 0, 0, 0,
+    ... 0, 0, 0, 0, 0, 0, 0,
+    ... 0, 2, 2, 0, 0, 0, 0,
+    ... 0, 1, 1, 1, 2, 0, 0])
+    >>> engine.choose_column(m)
+    0
+    >>> engine.last_search_score > 0, engine.get_proven_result(engine.last_search_score)
+    (True, 1)
+
+    Blocks an immediate loss.
+    >>> m = model.Model._create_from_picture(4, (7, 6), [
+    ... 0, 0, 0, 0, 0, 0, 0,
+    ... 0, 0, 0, 0, 0, 0, 0,
+    ... 0, 0, 0, 0, 0, 0, 0,
+    ... 1, 0, 0, 0, 0, 0, 0,
+    ... 1, 0, 0, 0, 0, 2, 0,
+    ... 1, 0, 0, 0, 0, 2, 0])
+    >>> m.current_player_piece = model.Piece.PLAYER2
+    >>> engine.choose_column(m)
+    0
+
+    The searched model is left unchanged.
+    >>> print(m)
+    0000000
+    0000000
+    0000000
+    1000000
+    1000020
+    1000020
+
+    >>> engine.last_search_stats.depth
+    4
+    >>> engine.stats.moves
+    2
+    """
+    _WIN_SCORE = 1000000
+    _NODES_PER_TIMEOUT_CHECK = 1024
+
+    def __init__(self, max_depth=6, time_limit=None, use_transposition_table=True, name=None):
+        """
+        @param max_depth the maximum number of plies to search
+        @param time_limit (seconds) stops deepening the search once exceeded, or None for no limit
+        @param use_transposition_table if True, reuses search results for transposed positions
+        """
+        self.name = name or 'depth{}'.format(max_depth)
+        self.max_depth = max_depth
+        self.time_limit = time_limit
+        self.use_transposition_table = use_transposition_table
+        self.stats = EngineStats()
+        self.last_search_stats = EngineStats()
+        self.last_search_score = None  # From the perspective of the player to move in the last searched position.
+        self._transposition_table = {}
+        self._search_stats = None
+        self._deadline = None
+
+    def reset(self):
+        """
+        Clears the transposition table and statistics, e.g. between games.
+        """
+        self._transposition_table.clear()
+        self.stats = EngineStats()
+        self.last_search_stats = EngineStats()
+
+    def choose_column(self, game_model):
+        """
+        @param game_model (model.Model) a game in progress, with the engine to move as the current player
+        @return the column to drop the current player's piece into
+        """
+        search_model = game_model.copy()
+        self._search_stats = EngineStats()
+        self._search_stats.moves = 1
+        start_time = time.perf_counter()
+        self._deadline = start_time + self.time_limit if self.time_limit is not None else None
+
+        column_order = self._get_column_order(search_model)
+        best_x = next(x for x in column_order if not search_model.is_column_full(x))
+        self.last_search_score = None
+        try:
+            for depth in range(1, self.max_depth + 1):
+                best_x, self.last_search_score = self._search_root(search_model, depth, column_order, best_x)
+                self._search_stats.depth = depth
+                if self._deadline is not None and time.perf_counter() >= self._deadline:
+                    break
+        except _SearchTimeout:
+            pass
+
+        self._search_stats.search_time = time.perf_counter() - start_time
+        self.last_search_stats = self._search_stats
+        self.stats.add(self._search_stats)
+        return best_x
+
+    def _search_root(self, search_model, depth, column_order, previous_best_x):
+        piece = search_model.current_player_piece
+        alpha = -self._WIN_SCORE - 1
+        best_x = previous_best_x
+        # Search the previous iteration's best move first so it is kept if the search times out.
+        ordered_columns = [previous_best_x] + [x for x in column_order if x != previous_best_x]
+        for x in ordered_columns:
+            if search_model.is_column_full(x):
+                continue
+            score = -self._search_after_drop(search_model, piece, x, depth - 1, -self._WIN_SCORE - 1, -alpha, 1)
+            if score > alpha:
+                alpha = score
+                best_x = x
+        return best_x, alpha
+
+    def get_proven_result(self, score):
+        """
+        @param score a search score
+        @return 1 if the score is a forced win, -1 if it is a forced loss, otherwise 0 (a draw or not proven)
+        """
+        if score > self._WIN_SCORE // 2:
+            return 1
+        if score < -self._WIN_SCORE // 2:
+            return -1
+        return 0
+
+    def _search_after_drop(self, search_model, piece, x, depth, alpha, beta, ply):
+        """
+        Drops the piece, searches the resulting position from the opponent's perspective, then undoes the drop.
+        """
+        search_model.drop_piece(piece, x)
+        search_model.end_turn()
+        try:
+            return self._negamax(search_model, depth, alpha, beta, ply)
+        finally:
+            search_model.end_turn()
+            search_model.undo_drop()
+
+    def _negamax(self, search_model, depth, alpha, beta, ply):
+        """
+        @return the score of the position from the perspective of the current player
+
+        A forced win found in a transposition is scored by its distance from where it was reached.
+        >>> engine = Engine()
+        >>> engine._search_stats = EngineStats()
+        >>> m = model.Model._create_from_picture(4, (7, 6), [
+        ... 0, 0, 0, 0, 0, 0, 0,
+        ... 0, 0, 0, 0, 0, 0, 0,
+        ... 0, 0, 0, 0, 0, 0, 0,
+        ... 0, 0, 0, 0, 0, 0, 0,
+        ... 0, 2, 2, 0, 0, 0, 0,
+        ... 0, 1, 1, 1, 2, 0, 0])
+        >>> window = (-Engine._WIN_SCORE - 1, Engine._WIN_SCORE + 1)
+        >>> Engine._WIN_SCORE - engine._negamax(m, 2, *window, ply=5)
+        6
+        >>> Engine._WIN_SCORE - engine._negamax(m, 2, *window, ply=1), engine._search_stats.tt_hits
+        (2, 1)
+        """
+        stats = self._search_stats
+        stats.nodes += 1
+        if self._deadline is not None and stats.nodes % self._NODES_PER_TIMEOUT_CHECK == 0:
+            if time.perf_counter() >= self._deadline:
+                raise _SearchTimeout()
+
+        winning_player = search_model.winning_player
+        if winning_player is not None:
+            if winning_player == model.Piece.NONE:
+                return 0
+            # The previous player's drop won.
+            return -(self._WIN_SCORE - ply)
+        if depth == 0:
+            return self._evaluate(search_model)
+
+        original_alpha = alpha
+        tt_best_x = None
+        tt_key = None
+        if self.use_transposition_table:
+            tt_key = (search_model.position_key, search_model.current_player_piece)
+            stats.tt_lookups += 1
+            entry = self._transposition_table.get(tt_key)
+            if entry is not None:
+                entry_depth, entry_score, entry_bound, tt_best_x = entry
+                entry_score = self._get_score_from_table(entry_score, ply)
+                if entry_depth >= depth:
+                    stats.tt_hits += 1
+                    if entry_bound == _Bound.EXACT:
+                        return entry_score
+                    elif entry_bound == _Bound.LOWER:
+                        alpha = max(alpha, entry_score)
+                    else:
+                        beta = min(beta, entry_score)
+                    if alpha >= beta:
+                        return entry_score
+
+        piece = search_model.current_player_piece
+        best_score = -self._WIN_SCORE - 1
+        best_x = None
+        for x in self._get_ordered_columns(search_model, tt_best_x):
+            if search_model.is_column_full(x):
+                continue
+            score = -self._search_after_drop(search_model, piece, x, depth - 1, -beta, -alpha, ply + 1)
+            if score > best_score:
+                best_score = score
+                best_x = x
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+
+        if tt_key is not None:
+            if best_score <= original_alpha:
+                bound = _Bound.UPPER
+            elif best_score >= beta:
+                bound = _Bound.LOWER
+            else:
+                bound = _Bound.EXACT
+            self._transposition_table[tt_key] = (depth, self._get_score_for_table(best_score, ply), bound, best_x)
+        return best_score
+
+    def _get_score_for_table(self, score, ply):
+        """
+        @return the score with a forced result's distance counted from the position instead of from the root, since the
+            position can be reached at other plies
+        """
+        if score > self._WIN_SCORE // 2:
+            return score + ply
+        if score < -self._WIN_SCORE // 2:
+            return score - ply
+        return score
+
+    def _get_score_from_table(self, score, ply):
+        """
+        The inverse of _get_score_for_table.
+        """
+        if score > self._WIN_SCORE // 2:
+            return score - ply
+        if score < -self._WIN_SCORE // 2:
+            return score + ply
+        return score
+
+    def _get_ordered_columns(self, search_model, first_x):
+        column_order = self._get_column_order(search_model)
+        if first_x is None:
+            return column_order
+        return [first_x] + [x for x in column_order if x != first_x]
+
+    @staticmethod
+    def _get_column_order(search_model):
+        """
+        @return the columns ordered from the center outwards, since central pieces take part in more lines
+
+        >>> Engine._get_column_order(model.Model(4, (7, 6)))
+        [3, 2, 4, 1, 5, 0, 6]
+        """
+        center = (search_model.size_x - 1) / 2
+        return sorted(range(search_model.size_x), key=lambda x: (abs(x - center), x))
+
+    @staticmethod
+    def _evaluate(search_model):
+        """
+        A cheap static evaluation that rewards central pieces.
+        @return the score of the position from the perspective of the current player
+        """
+        center = (search_model.size_x - 1) / 2
+        current_player_piece = search_model.current_player_piece
+        score = 0
+        for piece, x, y in search_model.drop_history:
+            weight = int(center + 1 - abs(x - center))
+            score += weight if piece == current_player_piece else -weight
+        return score
+
+
+def run_tests(headless: bool) -> Tuple[Tuple[int, int], Set[ModuleType]]:
+    """
+    @return ((failure_count, test_count), tested_modules)
+    """
+    import sys
+    import test
+    return test.run_doctests(sys.modules[__name__], module_dependencies=[model], headless=headless)
+
+
+if __name__ == '__main__':
+    run_tests(headless=False)
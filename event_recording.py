@@ -0,0 +1,219 @@
+"""
+Records the input events that the game handles, and replays them, for repeatable performance tests of the whole UI.
+
+A recording is a JSON Lines file with one object per frame of the game loop, in order, e.g.
+    {"time": 1.25, "elapsed_time": 0.0167, "events": [{"type": "KEYDOWN", "key": 1073741903, "mod": 0,
+                                                       "modifiers": 0}]}
+time is when the frame handled its events, in seconds since the recording started, and elapsed_time is how far the
+frame advanced the animations.  modifiers is the key.Modifier bitmap that a KEYDOWN was resolved with, so a replay
+handles exactly the same key.ModifiedKey.  Only the events that the controller acts on are recorded.
+
+A replay runs each recorded frame through the game loop without a display, with the recorded events and elapsed time
+instead of live ones, so it draws the same frames as the recorded game.  It runs at the recorded speed, a multiple of
+it, or as fast as possible, then reports the frame timings.
+
+Usage:
+    python connect4.py --record-events events.jsonl
+    python event_recording.py events.jsonl --speed 0
+"""
+import argparse
+import json
+import os
+import time
+from types import ModuleType
+from typing import Set, Tuple
+
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = 'hide'
+
+import key
+
+import pygame
+
+
+_EVENT_TYPE_NAMES = {
+    pygame.QUIT: 'QUIT',
+    pygame.VIDEORESIZE: 'VIDEORESIZE',
+    pygame.KEYDOWN: 'KEYDOWN',
+}
+_EVENT_TYPES = {name: event_type for event_type, name in _EVENT_TYPE_NAMES.items()}
+
+
+class RecordedFrame:
+    def __init__(self, time, elapsed_time, events):
+        """
+        @param time (seconds) when the frame handled its events, since the recording started
+        @param elapsed_time (seconds) how far the frame advanced the animations
+        @param events [(pygame.event.Event, the key.ModifiedKey a KEYDOWN was resolved to, otherwise None), ...] in
+            the order they were handled
+        """
+        self.time = time
+        self.elapsed_time = elapsed_time
+        self.events = events
+
+
+def _encode_event(event, modified_key):
+    encoded_event = {'type': _EVENT_TYPE_NAMES[event.type]}
+    if event.type == pygame.KEYDOWN:
+        encoded_event['key'] = event.key
+        encoded_event['mod'] = getattr(event, 'mod', 0)
+        encoded_event['modifiers'] = modified_key.modifiers
+    elif event.type == pygame.VIDEORESIZE:
+        encoded_event['size'] = list(event.size)
+    return encoded_event
+
+
+def _decode_event(encoded_event):
+    """
+    @return (pygame.event.Event, key.ModifiedKey or None)
+    """
+    event_type = _EVENT_TYPES[encoded_event['type']]
+    if event_type == pygame.KEYDOWN:
+        event = pygame.event.Event(event_type, key=encoded_event['key'], mod=encoded_event['mod'])
+        return event, key.ModifiedKey(encoded_event['key'], encoded_event['modifiers'])
+    if event_type == pygame.VIDEORESIZE:
+        width, height = encoded_event['size']
+        return pygame.event.Event(event_type, size=(width, height), w=width, h=height), None
+    return pygame.event.Event(event_type), None
+
+
+def encode_frame(frame):
+    """
+    @param frame (RecordedFrame)
+    @return one line of a recording, without the newline
+
+    >>> ctrl_s = pygame.event.Event(pygame.KEYDOWN, key=pygame.K_s, mod=pygame.KMOD_LCTRL)
+    >>> resize = pygame.event.Event(pygame.VIDEORESIZE, size=(640, 480), w=640, h=480)
+    >>> frame = RecordedFrame(1.5, 0.0125, [(ctrl_s, key.ModifiedKey(pygame.K_s, key.Modifier.CTRL)), (resize, None)])
+    >>> line = encode_frame(frame)
+    >>> line == ('{"time": 1.5, "elapsed_time": 0.0125, "events": [{"type": "KEYDOWN", "key": %d, "mod": %d, '
+    ...          '"modifiers": 1}, {"type": "VIDEORESIZE", "size": [640, 480]}]}' % (pygame.K_s, pygame.KMOD_LCTRL))
+    True
+
+    >>> decoded_frame = decode_frame(line)
+    >>> decoded_frame.time, decoded_frame.elapsed_time
+    (1.5, 0.0125)
+    >>> (decoded_ctrl_s, modified_key), (decoded_resize, _) = decoded_frame.events
+    >>> decoded_ctrl_s.key == pygame.K_s, modified_key == key.ModifiedKey(pygame.K_s, key.Modifier.CTRL)
+    (True, True)
+    >>> decoded_resize.type == pygame.VIDEORESIZE, decoded_resize.size
+    (True, (640, 480))
+    """
+    return json.dumps({'time': round(frame.time, 6),
+                       'elapsed_time': round(frame.elapsed_time, 6),
+                       'events': [_encode_event(event, modified_key) for event, modified_key in frame.events]})
+
+
+def decode_frame(line):
+    """
+    @return (RecordedFrame)
+    """
+    encoded_frame = json.loads(line)
+    return RecordedFrame(encoded_frame['time'],
+                         encoded_frame['elapsed_time'],
+                         [_decode_event(encoded_event) for encoded_event in encoded_frame['events']])
+
+
+class EventRecorder:
+    """
+    Writes each frame of the game loop to a recording as it runs.
+
+    >>> import tempfile
+    >>> directory = tempfile.TemporaryDirectory()
+    >>> path = os.path.join(directory.name, 'events.jsonl')
+    >>> with EventRecorder(path) as recorder:
+    ...     recorder.start_frame()
+    ...     recorder.record_event(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_DOWN, mod=0),
+    ...                           key.ModifiedKey(pygame.K_DOWN))
+    ...     recorder.record_event(pygame.event.Event(pygame.MOUSEMOTION, pos=(1, 2)))
+    ...     recorder.end_frame(0.02)
+    ...     recorder.start_frame()
+    ...     recorder.end_frame(0.01)
+    ...     recorder.start_frame()
+    ...     recorder.record_event(pygame.event.Event(pygame.QUIT))
+    >>> [(len(frame.events), frame.elapsed_time) for frame in read_recorded_frames(path)]
+    [(1, 0.02), (0, 0.01), (1, 0.0)]
+    >>> directory.cleanup()
+    """
+    def __init__(self, path):
+        self._file = open(path, 'w')
+        self._start_time = time.perf_counter()
+        self._frame_time = 0.0
+        self._events = []
+
+    def start_frame(self):
+        """
+        Call right before the frame handles its events.
+        """
+        self._frame_time = time.perf_counter() - self._start_time
+        self._events = []
+
+    def record_event(self, event, modified_key=None):
+        """
+        Events that the controller does not act on are ignored.
+        @param modified_key the key.ModifiedKey that a KEYDOWN event was resolved to
+        """
+        if event.type in _EVENT_TYPE_NAMES:
+            self._events.append((event, modified_key))
+
+    def end_frame(self, elapsed_time):
+        """
+        @param elapsed_time (seconds) how far the frame advanced the animations
+        """
+        self._file.write(encode_frame(RecordedFrame(self._frame_time, elapsed_time, self._events)) + '\n')
+        self._events = []
+
+    def close(self):
+        """
+        Also writes the frame in progress if it handled any events, e.g. a quit.
+        """
+        if self._file.closed:
+            return
+        if self._events:
+            self.end_frame(0.0)
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_recorded_frames(path):
+    """
+    Lazily yields each RecordedFrame in the recording.
+    """
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                yield decode_frame(line)
+
+
+def _main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', help='a recording made with connect4.py --record-events')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='a multiple of the recorded speed, or 0 to replay as fast as possible')
+    parser.add_argument('--profile-frames', default='-', metavar='PATH',
+                        help='write per-phase frame timings to PATH (default: stdout)')
+    args = parser.parse_args()
+
+    # Replays never show a window.  The video driver must be chosen before pygame is initialized.
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import controller
+    game_controller = controller.Controller()
+    profiler = game_controller.replay(read_recorded_frames(args.path), speed=args.speed or None)
+    profiler.dump(args.profile_frames)
+
+
+def run_tests(headless: bool) -> Tuple[Tuple[int, int], Set[ModuleType]]:
+    """
+    @return ((failure_count, test_count), tested_modules)
+    """
+    import sys
+    import test
+    return test.run_doctests(sys.modules[__name__], module_dependencies=[key], headless=headless)
+
+
+if __name__ == '__main__':
+    _main()
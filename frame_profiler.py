@@ -0,0 +1,202 @@
+"""
+Lightweight per-phase frame timing for the game loop.
+"""
+import bisect
+import collections
+import time
+from types import ModuleType
+from typing import Set, Tuple
+
+
+class Phase:
+    HANDLE_EVENTS = 'handle_events'
+    TICK = 'tick'
+    TICK_VIEW = 'tick_view'
+    SLEEP = 'sleep'
+    DRAW = 'draw'
+    FRAME = 'frame'
+    # Only for frames that handled key presses: from taking them off the event queue to the end of the draw that
+    # shows them.  pygame events are not timestamped, so the time they spent queued is not included.
+    INPUT_LATENCY = 'input_latency'
+
+    ALL = (HANDLE_EVENTS, TICK, TICK_VIEW, SLEEP, DRAW, FRAME, INPUT_LATENCY)
+
+
+class FrameProfiler:
+    """
+    Keeps the durations of the last window_size frames for each phase.
+
+    >>> profiler = FrameProfiler(window_size=4)
+    >>> for draw_duration in (0.001, 0.002, 0.003, 0.020, 0.004):
+    ...     profiler.record(Phase.DRAW, draw_duration)
+    ...     profiler.end_frame(drew=draw_duration != 0.002)
+    >>> profiler.get_percentiles(Phase.DRAW, (50, 100))
+    [0.003, 0.02]
+    >>> profiler.total_frames, profiler.get_skipped_frame_ratio()
+    (5, 0.25)
+
+    Only the sleep of the frame itself is excluded from its busy time.
+    >>> profiler = FrameProfiler()
+    >>> profiler.start_frame()
+    >>> profiler.record(Phase.SLEEP, 1.0)
+    >>> profiler.end_frame(drew=True)
+    >>> profiler.start_frame()
+    >>> time.sleep(0.02)  # Busy, but not sleeping to cap the frame rate
+    >>> profiler.end_frame(drew=True)
+    >>> profiler.total_over_budget_frames
+    1
+    """
+    _DEFAULT_WINDOW_SIZE = 600  # 10 seconds at 60 FPS
+    _FRAME_BUDGET = 1 / 60  # seconds
+    HISTOGRAM_BUCKET_BOUNDS = (0.001, 0.002, 0.004, 0.008, 0.016, 0.033, 0.066)  # seconds
+
+    def __init__(self, window_size=_DEFAULT_WINDOW_SIZE):
+        self._durations = {phase: collections.deque(maxlen=window_size) for phase in Phase.ALL}
+        self._drew = collections.deque(maxlen=window_size)
+        self._frame_start_time = time.perf_counter()
+        self._frame_sleep_duration = 0.0  # seconds
+        self.total_frames = 0
+        self.total_skipped_frames = 0
+        self.total_over_budget_frames = 0
+        self.startup_time = None  # seconds from the start of the program to the end of the first frame, if measured
+
+    def start_frame(self):
+        self._frame_start_time = time.perf_counter()
+        self._frame_sleep_duration = 0.0
+
+    def record(self, phase, duration):
+        """
+        @param phase (Phase)
+        @param duration (seconds)
+        """
+        self._durations[phase].append(duration)
+        if phase == Phase.SLEEP:
+            self._frame_sleep_duration += duration
+
+    def end_frame(self, drew):
+        """
+        @param drew False if the draw was skipped because nothing was dirty
+        """
+        frame_duration = time.perf_counter() - self._frame_start_time
+        self._durations[Phase.FRAME].append(frame_duration)
+        self._drew.append(drew)
+        self.total_frames += 1
+        if not drew:
+            self.total_skipped_frames += 1
+        # Sleeping to cap the frame rate is not over budget.
+        if frame_duration - self._frame_sleep_duration > self._FRAME_BUDGET:
+            self.total_over_budget_frames += 1
+        self._frame_sleep_duration = 0.0
+
+    def get_durations(self, phase):
+        return self._durations[phase]
+
+    def get_percentiles(self, phase, percentiles):
+        """
+        @param percentiles [0-100, ...]
+        @return the nearest-rank duration for each percentile over the window, or None for each if there are none
+
+        >>> profiler = FrameProfiler()
+        >>> for duration in range(1, 101):
+        ...     profiler.record(Phase.TICK, duration)
+        >>> profiler.get_percentiles(Phase.TICK, (0, 50, 90, 99, 100))
+        [1, 50, 90, 99, 100]
+        >>> profiler.get_percentiles(Phase.DRAW, (50,))
+        [None]
+        """
+        durations = sorted(self._durations[phase])
+        if not durations:
+            return [None] * len(percentiles)
+        return [durations[max(0, -(-len(durations) * percentile // 100) - 1)] for percentile in percentiles]
+
+    def get_histogram(self, phase):
+        """
+        @return the number of durations in the window that fall into each bucket:
+            [< bound_0, < bound_1, ..., >= bound_last]
+
+        >>> profiler = FrameProfiler()
+        >>> for duration in (0.0005, 0.0015, 0.0016, 0.1):
+        ...     profiler.record(Phase.DRAW, duration)
+        >>> profiler.get_histogram(Phase.DRAW)
+        [1, 2, 0, 0, 0, 0, 0, 1]
+        """
+        histogram = [0] * (len(self.HISTOGRAM_BUCKET_BOUNDS) + 1)
+        for duration in self._durations[phase]:
+            histogram[bisect.bisect_right(self.HISTOGRAM_BUCKET_BOUNDS, duration)] += 1
+        return histogram
+
+    def get_skipped_frame_ratio(self):
+        """
+        @return the ratio of frames in the window whose draw was skipped
+        """
+        if not self._drew:
+            return 0.0
+        return self._drew.count(False) / len(self._drew)
+
+    def get_fps(self):
+        frame_durations = self._durations[Phase.FRAME]
+        total_duration = sum(frame_durations)
+        return len(frame_durations) / total_duration if total_duration > 0 else 0.0
+
+    def get_report_lines(self):
+        """
+        >>> profiler = FrameProfiler()
+        >>> profiler.record(Phase.DRAW, 0.0021)
+        >>> profiler.end_frame(drew=True)
+        >>> print('\\n'.join(profiler.get_report_lines()[:3]))
+        Frames: 1 (0 skipped by the dirty check, 0 over the 16.7 ms budget)
+        Phase             p50 ms   p90 ms   p99 ms   max ms
+        handle_events          -        -        -        -
+        >>> profiler.get_report_lines()[6]
+        'draw                2.10     2.10     2.10     2.10'
+
+        >>> profiler.startup_time = 0.25
+        >>> profiler.get_report_lines()[0]
+        'Startup: 250.0 ms to the first frame'
+        """
+        lines = [] if self.startup_time is None else ['Startup: {:.1f} ms to the first frame'.format(
+            1000 * self.startup_time)]
+        lines += ['Frames: {} ({} skipped by the dirty check, {} over the {:.1f} ms budget)'.format(
+                      self.total_frames,
+                      self.total_skipped_frames,
+                      self.total_over_budget_frames,
+                      1000 * self._FRAME_BUDGET),
+                  '{:<15} {:>8} {:>8} {:>8} {:>8}'.format('Phase', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms')]
+        for phase in Phase.ALL:
+            percentiles = self.get_percentiles(phase, (50, 90, 99, 100))
+            lines.append('{:<15} {:>8} {:>8} {:>8} {:>8}'.format(
+                phase,
+                *('-' if duration is None else '{:.2f}'.format(1000 * duration) for duration in percentiles)))
+
+        bucket_names = ['<{:g}'.format(1000 * bound) for bound in self.HISTOGRAM_BUCKET_BOUNDS]
+        bucket_names.append('>={:g}'.format(1000 * self.HISTOGRAM_BUCKET_BOUNDS[-1]))
+        lines.append('')
+        lines.append('{:<15} {}'.format('Histogram (ms)', ' '.join('{:>6}'.format(name) for name in bucket_names)))
+        for phase in Phase.ALL:
+            lines.append('{:<15} {}'.format(phase, ' '.join('{:>6}'.format(count)
+                                                            for count in self.get_histogram(phase))))
+        return lines
+
+    def dump(self, path):
+        """
+        @param path the file to write the report to, or '-' for stdout
+        """
+        report = '\n'.join(self.get_report_lines()) + '\n'
+        if path == '-':
+            print(report, end='')
+        else:
+            with open(path, 'w') as file:
+                file.write(report)
+
+
+def run_tests(headless: bool) -> Tuple[Tuple[int, int], Set[ModuleType]]:
+    """
+    @return ((failure_count, test_count), tested_modules)
+    """
+    import sys
+    import test
+    return test.run_doctests(sys.modules[__name__], module_dependencies=[], headless=headless)
+
+
+if __name__ == '__main__':
+    run_tests(headless=False)
@@ -0,0 +1,534 @@
+"""
+Game records: a compact, streamable file format for persisting Model.drop_history.
+
+Two encodings are supported:
+ * Binary: a file header followed by length-prefixed records.  Each drop is packed into 2 bytes, because the row of
+   each drop can be recomputed from the column heights.
+ * JSONL: one JSON object per line.  Larger, but human readable and easy to consume from other tools.
+
+Files are append-only.  GameRecordWriter buffers writes for high-rate producers, read_game_records streams records
+lazily and GameRecordIndex supports random access by game number.
+"""
+import array
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from types import ModuleType
+from typing import Set, Tuple
+
+import model
+
+
+class RecordFormat:
+    BINARY = 'binary'
+    JSONL = 'jsonl'
+
+
+_BINARY_FILE_HEADER = b'C4GR\x01'
+_RECORD_LENGTH = struct.Struct('<I')
+_RECORD_HEADER = struct.Struct('<BHHI')  # consecutive_pieces_to_win, size_x, size_y, num_drops
+_MAX_PACKED_X = (1 << 14) - 1
+
+
+class GameRecord:
+    def __init__(self, consecutive_pieces_to_win, size, drop_history):
+        """
+        @param size (columns, rows)
+        @param drop_history [(piece, x, y), ...] as recorded by Model.drop_history
+        """
+        self.consecutive_pieces_to_win = consecutive_pieces_to_win
+        self.size_x, self.size_y = size
+        self.drop_history = drop_history
+
+    @classmethod
+    def from_model(cls, game_model):
+        """
+        >>> m = model.Model(4, (7, 6))
+        >>> m.drop_piece(model.Piece.PLAYER1, 3)
+        >>> GameRecord.from_model(m)
+        GameRecord(4, (7, 6), [(1, 3, 0)])
+        """
+        return cls(game_model.consecutive_pieces_to_win,
+                   (game_model.size_x, game_model.size_y),
+                   list(game_model.drop_history))
+
+    def to_model(self):
+        """
+        Replays the record into a new Model.
+
+        >>> record = GameRecord(3, (4, 3), [(1, 0, 0), (2, 3, 0), (1, 1, 0), (2, 3, 1), (1, 2, 0)])
+        >>> m = record.to_model()
+        >>> print(m)
+        0000
+        0002
+        1112
+        >>> m.winning_player
+        1
+        >>> m.current_player_piece
+        2
+        """
+        game_model = model.Model(self.consecutive_pieces_to_win, (self.size_x, self.size_y))
+        for piece, x, y in self.drop_history:
+            game_model.drop_piece(piece, x)
+            game_model.current_player_piece = piece
+            game_model.end_turn()
+        return game_model
+
+    def __eq__(self, other):
+        return self.__dict__ == other.__dict__
+
+    def __repr__(self):
+        return 'GameRecord({}, ({}, {}), {})'.format(self.consecutive_pieces_to_win,
+                                                    self.size_x,
+                                                    self.size_y,
+                                                    self.drop_history)
+
+
+def pack_drop_history(drop_history):
+    """
+    Packs each drop into 2 bytes.  The row is not stored; use unpack_drop_history to recompute it.
+    @param drop_history [(piece, x, y), ...]
+    @return bytes
+
+    >>> pack_drop_history([(1, 3, 0), (2, 3, 1)])
+    b'\\r\\x00\\x0e\\x00'
+    """
+    packed_drops = []
+    for piece, x, _ in drop_history:
+        if not 0 <= x <= _MAX_PACKED_X:
+            raise ValueError('Cannot pack column {}'.format(x))
+        packed_drops.append((x << 2) | piece)
+    return struct.pack('<{}H'.format(len(packed_drops)), *packed_drops)
+
+
+def unpack_drop_history(size_x, data, offset=0, num_drops=None):
+    """
+    @param size_x the number of columns in the board
+    @param data bytes created by pack_drop_history
+    @param offset the offset into data at which the packed drops start
+    @param num_drops the number of drops to unpack, or None to unpack until the end of data
+    @return [(piece, x, y), ...]
+
+    >>> unpack_drop_history(7, pack_drop_history([(1, 3, 0), (2, 3, 1), (1, 0, 0)]))
+    [(1, 3, 0), (2, 3, 1), (1, 0, 0)]
+    """
+    if num_drops is None:
+        num_drops = (len(data) - offset) // 2
+    column_heights = [0] * size_x
+    drop_history = []
+    for packed_drop in struct.unpack_from('<{}H'.format(num_drops), data, offset):
+        x = packed_drop >> 2
+        y = column_heights[x]
+        column_heights[x] = y + 1
+        drop_history.append((packed_drop & 3, x, y))
+    return drop_history
+
+
+def _encode_binary(record):
+    payload = (_RECORD_HEADER.pack(record.consecutive_pieces_to_win,
+                                   record.size_x,
+                                   record.size_y,
+                                   len(record.drop_history))
+               + pack_drop_history(record.drop_history))
+    return _RECORD_LENGTH.pack(len(payload)) + payload
+
+
+def _decode_binary(payload):
+    consecutive_pieces_to_win, size_x, size_y, num_drops = _RECORD_HEADER.unpack_from(payload)
+    drop_history = unpack_drop_history(size_x, payload, _RECORD_HEADER.size, num_drops)
+    return GameRecord(consecutive_pieces_to_win, (size_x, size_y), drop_history)
+
+
+def _encode_jsonl(record):
+    line = json.dumps({'k': record.consecutive_pieces_to_win,
+                       'size': [record.size_x, record.size_y],
+                       'drops': record.drop_history},
+                      separators=(',', ':'))
+    return line.encode('utf-8') + b'\n'
+
+
+def _decode_jsonl(line):
+    data = json.loads(line)
+    return GameRecord(data['k'], tuple(data['size']), [tuple(drop) for drop in data['drops']])
+
+
+def _detect_format(path):
+    with open(path, 'rb') as file:
+        header = file.read(len(_BINARY_FILE_HEADER))
+    if header == _BINARY_FILE_HEADER:
+        return RecordFormat.BINARY
+    return RecordFormat.JSONL
+
+
+class GameRecordWriter:
+    """
+    Append-only, buffered writer.  Records are only guaranteed to be on disk after flush() or close().
+
+    >>> import tempfile
+    >>> directory = tempfile.TemporaryDirectory()
+    >>> path = os.path.join(directory.name, 'games.c4gr')
+    >>> with GameRecordWriter(path) as writer:
+    ...     writer.write(GameRecord(4, (7, 6), [(1, 3, 0)]))
+    ...     writer.write(GameRecord(4, (7, 6), []))
+
+    Reopening appends to the existing file.
+    >>> with GameRecordWriter(path) as writer:
+    ...     writer.write(GameRecord(3, (4, 3), [(1, 0, 0), (2, 0, 1)]))
+    >>> list(read_game_records(path))
+    [GameRecord(4, (7, 6), [(1, 3, 0)]), GameRecord(4, (7, 6), []), GameRecord(3, (4, 3), [(1, 0, 0), (2, 0, 1)])]
+
+    A record that was only partially written, e.g. because of a crash, is dropped before appending.
+    >>> with open(path, 'ab') as file:
+    ...     _ = file.write(_encode_binary(GameRecord(4, (7, 6), [(1, 6, 0)]))[:-1])
+    >>> with GameRecordWriter(path) as writer:
+    ...     writer.write(GameRecord(4, (7, 6), [(2, 5, 0)]))
+    >>> [record.drop_history for record in read_game_records(path)]
+    [[(1, 3, 0)], [], [(1, 0, 0), (2, 0, 1)], [(2, 5, 0)]]
+
+    Appending with a different format is an error.
+    >>> GameRecordWriter(path, RecordFormat.JSONL)
+    Traceback (most recent call last):
+    ValueError: Cannot append jsonl records to a binary file
+    >>> directory.cleanup()
+    """
+    _DEFAULT_BUFFER_SIZE = 1 << 20
+
+    def __init__(self, path, record_format=RecordFormat.BINARY, buffer_size=_DEFAULT_BUFFER_SIZE):
+        """
+        @param record_format (RecordFormat)
+        @param buffer_size the number of buffered bytes that triggers a write to the file
+        """
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            existing_format = _detect_format(path)
+            if existing_format != record_format:
+                raise ValueError('Cannot append {} records to a {} file'.format(record_format, existing_format))
+            _truncate_partial_record(path, record_format)
+        self._encode = _encode_binary if record_format == RecordFormat.BINARY else _encode_jsonl
+        self._buffer_size = buffer_size
+        self._buffer = bytearray()
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0 and record_format == RecordFormat.BINARY:
+            self._buffer += _BINARY_FILE_HEADER
+
+    def write(self, record):
+        """
+        @param record (GameRecord)
+        """
+        self._buffer += self._encode(record)
+        if len(self._buffer) >= self._buffer_size:
+            self.flush()
+
+    def write_model(self, game_model):
+        self.write(GameRecord.from_model(game_model))
+
+    def flush(self):
+        self._file.write(self._buffer)
+        self._buffer.clear()
+        self._file.flush()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_game_records(path):
+    """
+    Lazily yields each GameRecord in the file, without loading the whole file into memory.
+
+    >>> import tempfile
+    >>> directory = tempfile.TemporaryDirectory()
+    >>> path = os.path.join(directory.name, 'games.jsonl')
+    >>> with GameRecordWriter(path, RecordFormat.JSONL) as writer:
+    ...     writer.write(GameRecord(4, (7, 6), [(1, 3, 0), (2, 3, 1)]))
+    >>> open(path).read()
+    '{"k":4,"size":[7,6],"drops":[[1,3,0],[2,3,1]]}\\n'
+    >>> list(read_game_records(path))
+    [GameRecord(4, (7, 6), [(1, 3, 0), (2, 3, 1)])]
+    >>> directory.cleanup()
+    """
+    if _detect_format(path) == RecordFormat.BINARY:
+        yield from _read_binary_records(path)
+    else:
+        yield from _read_jsonl_records(path)
+
+
+def _read_binary_records(path):
+    """
+    Stops at a partially written record at the end of the file, as GameRecordIndex does.
+
+    >>> import tempfile
+    >>> directory = tempfile.TemporaryDirectory()
+    >>> path = os.path.join(directory.name, 'games.c4gr')
+    >>> with GameRecordWriter(path) as writer:
+    ...     writer.write(GameRecord(4, (7, 6), [(1, 3, 0)]))
+    ...     writer.write(GameRecord(4, (7, 6), [(1, 2, 0), (2, 2, 1)]))
+    >>> with open(path, 'r+b') as file:
+    ...     _ = file.truncate(os.path.getsize(path) - 1)
+    >>> list(read_game_records(path))
+    [GameRecord(4, (7, 6), [(1, 3, 0)])]
+    >>> directory.cleanup()
+    """
+    with open(path, 'rb') as file:
+        file.seek(len(_BINARY_FILE_HEADER))
+        while True:
+            length_bytes = file.read(_RECORD_LENGTH.size)
+            if len(length_bytes) < _RECORD_LENGTH.size:
+                return
+            length, = _RECORD_LENGTH.unpack(length_bytes)
+            payload = file.read(length)
+            if len(payload) < length:
+                # Partially written record
+                return
+            yield _decode_binary(payload)
+
+
+def _read_jsonl_records(path):
+    with open(path, 'rb') as file:
+        for line in file:
+            if not line.endswith(b'\n'):
+                # Partially written record
+                return
+            if line.strip():
+                yield _decode_jsonl(line)
+
+
+def _scan_records(file, record_format, offset, file_size):
+    """
+    @param file the record file, opened in binary mode
+    @param offset where to start scanning, at the start of a record or at the end of the file header
+    @param file_size the size of the file
+    @return an iterator of (offset, end offset) of each complete record from the offset.  It stops at a partially
+        written record at the end of the file.
+    """
+    if record_format == RecordFormat.BINARY:
+        offset = max(offset, len(_BINARY_FILE_HEADER))
+        while offset + _RECORD_LENGTH.size <= file_size:
+            file.seek(offset)
+            length, = _RECORD_LENGTH.unpack(file.read(_RECORD_LENGTH.size))
+            end_offset = offset + _RECORD_LENGTH.size + length
+            if end_offset > file_size:
+                # Partially written record
+                return
+            yield offset, end_offset
+            offset = end_offset
+    else:
+        file.seek(offset)
+        for line in file:
+            if not line.endswith(b'\n'):
+                # Partially written record
+                return
+            end_offset = offset + len(line)
+            if line.strip():
+                yield offset, end_offset
+            offset = end_offset
+
+
+def _truncate_partial_record(path, record_format):
+    """
+    Truncates the file after its last complete record, e.g. after a crash while writing, so that the records appended
+    after it can be read.
+    """
+    file_size = os.path.getsize(path)
+    with open(path, 'r+b') as file:
+        complete_size = len(_BINARY_FILE_HEADER) if record_format == RecordFormat.BINARY else 0
+        for _, complete_size in _scan_records(file, record_format, 0, file_size):
+            pass
+        if complete_size < file_size:
+            file.truncate(complete_size)
+
+
+class GameRecordIndex:
+    """
+    Random access to the records in a file by game number.
+
+    The record offsets are persisted in a sidecar file (path + '.idx'), which is memory-mapped rather than loaded, so
+    the index of a file of hundreds of millions of games does not need to fit in memory.  Because record files are
+    append-only, refreshing appends only the offsets of the newly appended records to the index file.
+
+    >>> import tempfile
+    >>> directory = tempfile.TemporaryDirectory()
+    >>> path = os.path.join(directory.name, 'games.c4gr')
+    >>> with GameRecordWriter(path) as writer:
+    ...     for x in range(5):
+    ...         writer.write(GameRecord(4, (7, 6), [(1, x, 0)]))
+    >>> with GameRecordIndex(path) as index:
+    ...     len(index), index[2], index[-1]
+    (5, GameRecord(4, (7, 6), [(1, 2, 0)]), GameRecord(4, (7, 6), [(1, 4, 0)]))
+
+    >>> index_size = os.path.getsize(path + '.idx')
+    >>> with GameRecordWriter(path) as writer:
+    ...     writer.write(GameRecord(4, (7, 6), [(2, 6, 0)]))
+    >>> with GameRecordIndex(path) as index:
+    ...     len(index), index[5]
+    (6, GameRecord(4, (7, 6), [(2, 6, 0)]))
+    >>> os.path.getsize(path + '.idx') - index_size
+    8
+
+    >>> GameRecordIndex(path)[6]
+    Traceback (most recent call last):
+    IndexError: Game number 6 is out of range
+
+    An index that does not match the record file is rebuilt, whether the file was replaced by a smaller or a larger one.
+    >>> with GameRecordWriter(path + '.new') as writer:
+    ...     writer.write(GameRecord(4, (7, 6), []))
+    >>> os.replace(path + '.new', path)
+    >>> with GameRecordIndex(path) as index:
+    ...     len(index), index[0]
+    (1, GameRecord(4, (7, 6), []))
+    >>> with GameRecordWriter(path + '.new') as writer:
+    ...     writer.write(GameRecord(4, (7, 6), [(1, 0, 0)]))
+    ...     writer.write(GameRecord(4, (7, 6), [(1, 1, 0)]))
+    >>> os.replace(path + '.new', path)
+    >>> with GameRecordIndex(path) as index:
+    ...     len(index), index[0]
+    (2, GameRecord(4, (7, 6), [(1, 0, 0)]))
+    >>> directory.cleanup()
+    """
+    _INDEX_MAGIC = b'C4GRIDX3'
+    # magic, number of bytes of the record file covered by the index, number of offsets, fingerprint of those bytes
+    _INDEX_HEADER = struct.Struct('<8sQQ16s')
+    _FINGERPRINT_SAMPLE_SIZE = 4096  # bytes from each end of the covered part of the record file
+    _OFFSET = struct.Struct('<Q')
+    _APPEND_BATCH_SIZE = 1 << 16  # offsets
+
+    def __init__(self, path):
+        self._path = path
+        self._index_path = path + '.idx'
+        self._format = _detect_format(path)
+        self._num_offsets = 0
+        self._indexed_size = 0
+        self._file = open(path, 'rb')
+        self._index_file = None
+        self._index_map = None
+        self._open_index()
+        self.refresh()
+
+    def _open_index(self):
+        """
+        Opens the index file, and starts it over if it is missing or does not match the record file.
+        """
+        self._index_file = open(self._index_path, 'r+b' if os.path.exists(self._index_path) else 'w+b')
+        header = self._index_file.read(self._INDEX_HEADER.size)
+        if len(header) == self._INDEX_HEADER.size:
+            magic, indexed_size, num_offsets, fingerprint = self._INDEX_HEADER.unpack(header)
+            index_size = self._INDEX_HEADER.size + num_offsets * self._OFFSET.size
+            # Otherwise the record file was replaced, or the index was written by another version.
+            if (magic == self._INDEX_MAGIC
+                    and indexed_size <= os.path.getsize(self._path)
+                    and index_size <= os.path.getsize(self._index_path)
+                    and fingerprint == self._get_fingerprint(indexed_size)):
+                self._indexed_size = indexed_size
+                self._num_offsets = num_offsets
+        # Drops any offsets that an interrupted refresh appended without updating the header.
+        self._index_file.truncate(self._INDEX_HEADER.size + self._num_offsets * self._OFFSET.size)
+        self._write_index_header()
+        self._map_index()
+
+    def _get_fingerprint(self, indexed_size):
+        """
+        @return a hash of the start and the end of the first indexed_size bytes of the record file, to tell whether the
+            file was replaced since they were indexed
+        """
+        sample_size = min(indexed_size, self._FINGERPRINT_SAMPLE_SIZE)
+        self._file.seek(0)
+        head = self._file.read(sample_size)
+        self._file.seek(indexed_size - sample_size)
+        tail = self._file.read(sample_size)
+        return hashlib.sha256(head + tail).digest()[:16]
+
+    def _write_index_header(self):
+        self._index_file.seek(0)
+        self._index_file.write(self._INDEX_HEADER.pack(self._INDEX_MAGIC,
+                                                       self._indexed_size,
+                                                       self._num_offsets,
+                                                       self._get_fingerprint(self._indexed_size)))
+        self._index_file.flush()
+
+    def _map_index(self):
+        if self._index_map is not None:
+            self._index_map.close()
+        self._index_map = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def refresh(self):
+        """
+        Indexes any records appended since the index was last updated.
+        """
+        file_size = os.path.getsize(self._path)
+        if file_size == self._indexed_size:
+            return
+        self._index_file.seek(self._INDEX_HEADER.size + self._num_offsets * self._OFFSET.size)
+        offsets = array.array('Q')
+        for offset, end_offset in _scan_records(self._file, self._format, self._indexed_size, file_size):
+            offsets.append(offset)
+            self._indexed_size = end_offset
+            if len(offsets) == self._APPEND_BATCH_SIZE:
+                self._append_offsets(offsets)
+                offsets = array.array('Q')
+        self._append_offsets(offsets)
+        # The header is written last, so an interrupted refresh leaves the index as it was.
+        self._index_file.flush()
+        self._write_index_header()
+        self._map_index()
+
+    def _append_offsets(self, offsets):
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+        self._index_file.write(offsets.tobytes())
+        self._num_offsets += len(offsets)
+
+    def __len__(self):
+        return self._num_offsets
+
+    def __getitem__(self, game_number):
+        """
+        @return the GameRecord with the game number
+        """
+        if not -self._num_offsets <= game_number < self._num_offsets:
+            raise IndexError('Game number {} is out of range'.format(game_number))
+        if game_number < 0:
+            game_number += self._num_offsets
+        offset, = self._OFFSET.unpack_from(self._index_map,
+                                           self._INDEX_HEADER.size + game_number * self._OFFSET.size)
+        self._file.seek(offset)
+        if self._format == RecordFormat.BINARY:
+            length, = _RECORD_LENGTH.unpack(self._file.read(_RECORD_LENGTH.size))
+            return _decode_binary(self._file.read(length))
+        else:
+            return _decode_jsonl(self._file.readline())
+
+    def close(self):
+        if self._index_map is not None:
+            self._index_map.close()
+            self._index_map = None
+        self._index_file.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def run_tests(headless: bool) -> Tuple[Tuple[int, int], Set[ModuleType]]:
+    """
+    @return ((failure_count, test_count), tested_modules)
+    """
+    import sys
+    import test
+    return test.run_doctests(sys.modules[__name__], module_dependencies=[model], headless=headless)
+
+
+if __name__ == '__main__':
+    run_tests(headless=False)
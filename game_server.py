@@ -0,0 +1,447 @@
+"""
+A server that hosts many simultaneous games on a single asyncio event loop.
+
+Clients connect over TCP and speak a line-based protocol.
+
+Client to server:
+    JOIN                    Waits for an opponent, then starts a game.  Forfeits the current game, if any.
+    DROP <x>                Drops the client's piece into column x.
+    WATCH <game_id>         Spectates a game.
+
+Server to client:
+    GAME <game_id> <piece> <consecutive_pieces_to_win> <size_x> <size_y>
+                            A game started; the client plays the piece.
+    MOVE <piece> <x> <y>    A piece was dropped (sent to both players).
+    END <winning_piece>     The game ended; 0 is a tie.
+    ERROR <message>         The last command was invalid.
+    BOARD <game_id> <current_piece> <consecutive_pieces_to_win> <size_x> <size_y> <pieces>
+                            A spectated game's keyframe.  pieces has one digit per opening, ordered as for
+                            Model.initialize_from_picture.  MOVE deltas since the keyframe follow, then live ones.
+
+Usage:
+    python game_server.py serve --port 4004
+    python game_server.py load-test --games 10000
+"""
+import argparse
+import asyncio
+from types import ModuleType
+from typing import Set, Tuple
+
+import model
+
+
+class _Game:
+    __slots__ = ('game_id', 'model', 'players', 'spectator_feed')
+
+    def __init__(self, game_id, game_model, players):
+        """
+        @param players {piece: _ClientConnection, ...}
+        """
+        self.game_id = game_id
+        self.model = game_model
+        self.players = players
+        self.spectator_feed = None  # Created when the first spectator joins.
+
+
+class _ClientConnection(asyncio.Protocol):
+    __slots__ = ('_server', 'transport', 'game', 'piece', 'watched_feed', '_read_buffer', 'write_buffer')
+
+    def __init__(self, server):
+        self._server = server
+        self.transport = None
+        self.game = None
+        self.piece = model.Piece.NONE
+        self.watched_feed = None
+        self._read_buffer = b''
+        self.write_buffer = bytearray()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self._server.handle_connect(self)
+
+    def data_received(self, data):
+        lines = (self._read_buffer + data).split(b'\n')
+        self._read_buffer = lines.pop()
+        for line in lines:
+            self._server.handle_command(self, line.split())
+
+    def connection_lost(self, exc):
+        self._server.handle_disconnect(self)
+
+
+class SpectatorFeed:
+    """
+    Streams a game to its spectators as move deltas.
+
+    Each message is encoded once and the same bytes are queued for every spectator, through the same send as the
+    players' messages.  A keyframe of the whole board is encoded every keyframe_interval moves, so a late joiner only
+    needs it and the few deltas since.
+
+    >>> class Spectator:
+    ...     def __init__(self): self.data, self.watched_feed = b'', None
+    >>> def send(connection, message):
+    ...     connection.data += message
+    >>> game_model = model.Model(4, (4, 4))
+    >>> def drop(x):
+    ...     game_model.drop_piece(game_model.current_player_piece, x)
+    ...     game_model.end_turn()
+    ...     feed.publish_move(encode_move(*game_model.drop_history[-1]))
+    >>> feed = SpectatorFeed(7, game_model, send, keyframe_interval=2)
+    >>> early_spectator = Spectator()
+    >>> feed.subscribe(early_spectator)
+    >>> for x in (0, 1, 1):
+    ...     drop(x)
+    >>> print(early_spectator.data.decode(), end='')
+    BOARD 7 1 4 4 4 0000000000000000
+    MOVE 1 0 0
+    MOVE 2 1 0
+    MOVE 1 1 1
+
+    A late joiner starts from the last keyframe.
+    >>> late_spectator = Spectator()
+    >>> feed.subscribe(late_spectator)
+    >>> print(late_spectator.data.decode(), end='')
+    BOARD 7 1 4 4 4 0000000000001200
+    MOVE 1 1 1
+
+    >>> feed.publish(b'END 0\\n')
+    >>> feed.close()
+    >>> late_spectator.data.endswith(b'END 0\\n'), late_spectator.watched_feed
+    (True, None)
+    """
+    __slots__ = ('_game_id', '_model', '_send', '_keyframe_interval', '_keyframe', '_deltas_since_keyframe',
+                 '_spectators')
+
+    _DEFAULT_KEYFRAME_INTERVAL = 8  # moves
+
+    def __init__(self, game_id, game_model, send, keyframe_interval=_DEFAULT_KEYFRAME_INTERVAL):
+        """
+        @param send (connection, message bytes) -> None, queues the message for the connection
+        """
+        self._game_id = game_id
+        self._model = game_model
+        self._send = send
+        self._keyframe_interval = keyframe_interval
+        self._keyframe = self._encode_keyframe()
+        self._deltas_since_keyframe = []
+        self._spectators = set()
+
+    @property
+    def num_spectators(self):
+        return len(self._spectators)
+
+    def _encode_keyframe(self):
+        game_model = self._model
+        pieces = ''.join(str(game_model.get_piece_at_opening(x, y))
+                         for y in range(game_model.size_y - 1, -1, -1)
+                         for x in range(game_model.size_x))
+        return 'BOARD {} {} {} {} {} {}\n'.format(self._game_id,
+                                                  game_model.current_player_piece,
+                                                  game_model.consecutive_pieces_to_win,
+                                                  game_model.size_x,
+                                                  game_model.size_y,
+                                                  pieces).encode()
+
+    def subscribe(self, connection):
+        """
+        Sends the connection the latest keyframe and the deltas since, then every later message.
+        """
+        connection.watched_feed = self
+        self._spectators.add(connection)
+        self._send(connection, b''.join([self._keyframe] + self._deltas_since_keyframe))
+
+    def unsubscribe(self, connection):
+        connection.watched_feed = None
+        self._spectators.discard(connection)
+
+    def publish_move(self, message):
+        """
+        @param message (bytes) the encoded MOVE, already applied to the model
+        """
+        self.publish(message)
+        self._deltas_since_keyframe.append(message)
+        if len(self._deltas_since_keyframe) >= self._keyframe_interval:
+            self._keyframe = self._encode_keyframe()
+            self._deltas_since_keyframe.clear()
+
+    def publish(self, message):
+        """
+        @param message (bytes) queued as is for every spectator
+        """
+        for connection in self._spectators:
+            self._send(connection, message)
+
+    def close(self):
+        for connection in self._spectators:
+            connection.watched_feed = None
+        self._spectators.clear()
+
+
+def encode_move(piece, x, y):
+    """
+    >>> encode_move(1, 3, 0)
+    b'MOVE 1 3 0\\n'
+    """
+    return 'MOVE {} {} {}\n'.format(piece, x, y).encode()
+
+
+class GameServer:
+    """
+    >>> import game_server_load_test
+    >>> loop = asyncio.new_event_loop()
+    >>> server = GameServer(4, (7, 6))
+    >>> asyncio_server = loop.run_until_complete(server.start('127.0.0.1', 0))
+    >>> port = asyncio_server.sockets[0].getsockname()[1]
+    >>> result = loop.run_until_complete(game_server_load_test.run_load_test('127.0.0.1', port, num_games=50))
+    >>> result.num_finished_games, result.num_errors
+    (50, 0)
+    >>> server.num_active_games
+    0
+
+    Spectators join mid-game with WATCH.
+    >>> async def watch_game():
+    ...     players = [await asyncio.open_connection('127.0.0.1', port) for _ in range(2)]
+    ...     for _, writer in players:
+    ...         writer.write(b'JOIN\\n')
+    ...     game_id = int((await players[0][0].readline()).split()[1])
+    ...     players[0][1].write(b'DROP 3\\n')
+    ...     await players[0][0].readline()
+    ...     spectator_reader, spectator_writer = await asyncio.open_connection('127.0.0.1', port)
+    ...     spectator_writer.write('WATCH {}\\n'.format(game_id).encode())
+    ...     keyframe = await spectator_reader.readline()
+    ...     players[0][1].close()
+    ...     lines = [keyframe.split()[1:3], await spectator_reader.readline()]
+    ...     spectator_writer.close()
+    ...     players[1][1].close()
+    ...     return lines
+    >>> loop.run_until_complete(watch_game())
+    [[b'50', b'2'], b'END 2\\n']
+    >>> asyncio_server.close()
+    >>> loop.run_until_complete(asyncio_server.wait_closed())
+    >>> loop.close()
+    """
+    _BACKLOG = 4096
+
+    def __init__(self, consecutive_pieces_to_win, size):
+        self._consecutive_pieces_to_win = consecutive_pieces_to_win
+        self._size = size
+        self._games = {}
+        self._next_game_id = 0
+        self._waiting_connection = None
+        self._connections = set()
+        self._connections_to_flush = set()
+        self._is_flush_scheduled = False
+
+    @property
+    def num_active_games(self):
+        return len(self._games)
+
+    async def start(self, host, port):
+        """
+        @return (asyncio.AbstractServer)
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.create_server(lambda: _ClientConnection(self), host, port, backlog=self._BACKLOG)
+
+    def close_connections(self):
+        """
+        Closes every client connection, e.g. when shutting down after closing the asyncio server.
+        """
+        for connection in list(self._connections):
+            connection.transport.close()
+
+    def handle_connect(self, connection):
+        self._connections.add(connection)
+
+    def handle_command(self, connection, arguments):
+        """
+        @param arguments the command's words, as bytes
+        """
+        if not arguments:
+            return
+        command = arguments[0]
+        if command == b'DROP' and len(arguments) == 2:
+            self._handle_drop(connection, arguments[1])
+        elif command == b'JOIN' and len(arguments) == 1:
+            self._handle_join(connection)
+        elif command == b'WATCH' and len(arguments) == 2:
+            self._handle_watch(connection, arguments[1])
+        else:
+            self._send(connection, b'ERROR unknown command\n')
+
+    def _handle_join(self, connection):
+        if connection is self._waiting_connection:
+            self._send(connection, b'ERROR already joined\n')
+            return
+        if connection.game is not None:
+            # Joining a new game forfeits the current one.
+            self._end_game(connection.game, self._get_opponent_piece(connection.piece))
+        if self._waiting_connection is None:
+            self._waiting_connection = connection
+            return
+
+        game_model = model.Model(self._consecutive_pieces_to_win, self._size)
+        players = {model.Piece.PLAYER1: self._waiting_connection, model.Piece.PLAYER2: connection}
+        game = _Game(self._next_game_id, game_model, players)
+        self._next_game_id += 1
+        self._games[game.game_id] = game
+        self._waiting_connection = None
+
+        for piece, player in players.items():
+            player.game = game
+            player.piece = piece
+            self._send(player, 'GAME {} {} {} {} {}\n'.format(game.game_id,
+                                                              piece,
+                                                              game_model.consecutive_pieces_to_win,
+                                                              game_model.size_x,
+                                                              game_model.size_y).encode())
+
+    def _handle_drop(self, connection, x_argument):
+        game = connection.game
+        if game is None:
+            self._send(connection, b'ERROR not in a game\n')
+            return
+        game_model = game.model
+        if game_model.current_player_piece != connection.piece:
+            self._send(connection, b'ERROR not your turn\n')
+            return
+        try:
+            x = int(x_argument)
+        except ValueError:
+            x = -1
+        if not 0 <= x < game_model.size_x or game_model.is_column_full(x):
+            self._send(connection, b'ERROR invalid column\n')
+            return
+
+        game_model.drop_piece(connection.piece, x)
+        game_model.end_turn()
+        message = encode_move(*game_model.drop_history[-1])
+        self._broadcast(game, message)
+        if game.spectator_feed is not None:
+            game.spectator_feed.publish_move(message)
+        if game_model.winning_player is not None:
+            self._end_game(game, game_model.winning_player)
+
+    def _handle_watch(self, connection, game_id_argument):
+        try:
+            game = self._games.get(int(game_id_argument))
+        except ValueError:
+            game = None
+        if game is None:
+            self._send(connection, b'ERROR no such game\n')
+            return
+        if connection.watched_feed is not None:
+            connection.watched_feed.unsubscribe(connection)
+        if game.spectator_feed is None:
+            game.spectator_feed = SpectatorFeed(game.game_id, game.model, self._send)
+        # The keyframe is queued after anything already queued for this connection, so it arrives in order.
+        game.spectator_feed.subscribe(connection)
+
+    def handle_disconnect(self, connection):
+        self._connections.discard(connection)
+        self._connections_to_flush.discard(connection)
+        if connection.watched_feed is not None:
+            connection.watched_feed.unsubscribe(connection)
+        if connection is self._waiting_connection:
+            self._waiting_connection = None
+        game = connection.game
+        if game is not None and game.game_id in self._games:
+            # The remaining player wins by forfeit.
+            self._end_game(game, self._get_opponent_piece(connection.piece))
+
+    @staticmethod
+    def _get_opponent_piece(piece):
+        return model.Piece.PLAYER2 if piece == model.Piece.PLAYER1 else model.Piece.PLAYER1
+
+    def _end_game(self, game, winning_piece):
+        message = 'END {}\n'.format(winning_piece).encode()
+        self._broadcast(game, message)
+        if game.spectator_feed is not None:
+            game.spectator_feed.publish(message)
+            game.spectator_feed.close()
+        del self._games[game.game_id]
+        for player in game.players.values():
+            player.game = None
+
+    def _broadcast(self, game, message):
+        """
+        @param message (bytes) encoded once and queued for every player
+        """
+        for player in game.players.values():
+            self._send(player, message)
+
+    def _send(self, connection, message):
+        """
+        Queues the message.  All queued messages are written together once the current batch of events has been
+        handled, so a connection that receives several messages only costs one write.
+        """
+        if connection.transport.is_closing():
+            return
+        connection.write_buffer += message
+        self._connections_to_flush.add(connection)
+        if not self._is_flush_scheduled:
+            self._is_flush_scheduled = True
+            asyncio.get_event_loop().call_soon(self._flush)
+
+    def _flush(self):
+        self._is_flush_scheduled = False
+        for connection in self._connections_to_flush:
+            if not connection.transport.is_closing():
+                connection.transport.write(bytes(connection.write_buffer))
+            connection.write_buffer.clear()
+        self._connections_to_flush.clear()
+
+
+def _main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+    serve_parser = subparsers.add_parser('serve')
+    load_test_parser = subparsers.add_parser('load-test', help='run a local server and load test it')
+    for subparser in (serve_parser, load_test_parser):
+        subparser.add_argument('--host', default='127.0.0.1')
+        subparser.add_argument('--port', type=int, default=4004)
+        subparser.add_argument('--size', default='7x6', help='COLUMNSxROWS')
+        subparser.add_argument('--connect', type=int, default=4, help='consecutive pieces to win')
+    load_test_parser.add_argument('--games', type=int, default=10000, help='the number of concurrent games')
+    load_test_parser.add_argument('--think-time', type=float, default=2.0,
+                                  help='average seconds each player waits before dropping; 0 floods the server')
+    load_test_parser.add_argument('--external', action='store_true',
+                                  help='load test an already running server instead of starting one')
+    args = parser.parse_args()
+
+    size = tuple(int(value) for value in args.size.split('x'))
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server = GameServer(args.connect, size)
+    if args.command == 'serve':
+        loop.run_until_complete(server.start(args.host, args.port))
+        print('Serving on {}:{}'.format(args.host, args.port))
+        loop.run_forever()
+    else:
+        import game_server_load_test
+        if not args.external:
+            # The server's end of every connection is also open in this process.
+            game_server_load_test.ensure_open_file_limit(4 * args.games)
+            loop.run_until_complete(server.start(args.host, args.port))
+        result = loop.run_until_complete(game_server_load_test.run_load_test(args.host,
+                                                                                     args.port,
+                                                                                     args.games,
+                                                                                     args.think_time))
+        print('\n'.join(result.get_report_lines()))
+
+
+def run_tests(headless: bool) -> Tuple[Tuple[int, int], Set[ModuleType]]:
+    """
+    @return ((failure_count, test_count), tested_modules)
+    """
+    import sys
+    import test
+    import game_server_load_test
+    return test.run_doctests(sys.modules[__name__],
+                             module_dependencies=[game_server_load_test, model],
+                             headless=headless)
+
+
+if __name__ == '__main__':
+    _main()
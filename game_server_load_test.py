@@ -0,0 +1,204 @@
+"""
+A load-test client for game_server.  Plays many concurrent games of random legal drops and measures the latency
+from sending each DROP to receiving its MOVE.
+"""
+import asyncio
+import random
+import time
+from types import ModuleType
+from typing import Set, Tuple
+
+
+class LoadTestResult:
+    def __init__(self, num_finished_games, num_moves, num_errors, latencies, duration):
+        """
+        @param latencies [seconds, ...] from sending each DROP to receiving its MOVE
+        @param duration (seconds)
+        """
+        self.num_finished_games = num_finished_games
+        self.num_moves = num_moves
+        self.num_errors = num_errors
+        self.latencies = latencies
+        self.duration = duration
+
+    def get_latency_percentile(self, percentile):
+        """
+        >>> LoadTestResult(0, 0, 0, [0.004, 0.001, 0.003, 0.002], 1).get_latency_percentile(50)
+        0.002
+        """
+        if not self.latencies:
+            return 0.0
+        latencies = sorted(self.latencies)
+        return latencies[max(0, -(-len(latencies) * percentile // 100) - 1)]
+
+    def get_report_lines(self):
+        """
+        >>> result = LoadTestResult(10, 300, 0, [0.001] * 300, 2.0)
+        >>> print('\\n'.join(result.get_report_lines()))
+        Finished games: 10 (0 errors) in 2.0 s
+        Moves: 300 (150 moves/s)
+        Move latency p50/p99/max: 1.0/1.0/1.0 ms
+        """
+        return [
+            'Finished games: {} ({} errors) in {:.1f} s'.format(self.num_finished_games, self.num_errors, self.duration),
+            'Moves: {} ({:.0f} moves/s)'.format(self.num_moves, self.num_moves / self.duration),
+            'Move latency p50/p99/max: {:.1f}/{:.1f}/{:.1f} ms'.format(1000 * self.get_latency_percentile(50),
+                                                                      1000 * self.get_latency_percentile(99),
+                                                                      1000 * self.get_latency_percentile(100)),
+        ]
+
+
+class RandomPlayerClient(asyncio.Protocol):
+    """
+    Joins one game and plays random legal drops until it ends.
+    """
+    def __init__(self, rng, latencies, on_finished, think_time):
+        """
+        @param on_finished (is_error) -> None, called once the client's game ends
+        @param think_time (seconds) how long to wait before each drop
+        """
+        self._rng = rng
+        self._think_time = think_time
+        self._latencies = latencies
+        self._on_finished = on_finished
+        self._transport = None
+        self._read_buffer = b''
+        self._piece = 0
+        self._column_heights = None
+        self._size_y = 0
+        self._drop_time = None
+        self.num_moves = 0
+
+    def connection_made(self, transport):
+        self._transport = transport
+        transport.write(b'JOIN\n')
+
+    def data_received(self, data):
+        lines = (self._read_buffer + data).split(b'\n')
+        self._read_buffer = lines.pop()
+        for line in lines:
+            self._handle_message(line.split())
+
+    def _handle_message(self, arguments):
+        message = arguments[0]
+        if message == b'MOVE':
+            piece, x = int(arguments[1]), int(arguments[2])
+            self._column_heights[x] += 1
+            if piece == self._piece:
+                self._latencies.append(time.perf_counter() - self._drop_time)
+                self.num_moves += 1
+            else:
+                self._schedule_drop()
+        elif message == b'GAME':
+            self._piece = int(arguments[2])
+            size_x, self._size_y = int(arguments[4]), int(arguments[5])
+            self._column_heights = [0] * size_x
+            if self._piece == 1:
+                self._schedule_drop()
+        elif message == b'END':
+            self._finish(is_error=False)
+        else:
+            self._finish(is_error=True)
+
+    def connection_lost(self, exc):
+        # Connections that are lost before the game ends are errors.
+        if self._on_finished is not None:
+            self._on_finished(True)
+            self._on_finished = None
+
+    def _schedule_drop(self):
+        if self._think_time > 0:
+            asyncio.get_event_loop().call_later(self._think_time * (0.5 + self._rng.random()), self._drop)
+        else:
+            self._drop()
+
+    def _drop(self):
+        if self._transport.is_closing():
+            return
+        open_columns = [x for x, height in enumerate(self._column_heights) if height < self._size_y]
+        if not open_columns:
+            # The board is full, so the game is about to end in a tie.
+            return
+        self._drop_time = time.perf_counter()
+        self._transport.write('DROP {}\n'.format(self._rng.choice(open_columns)).encode())
+
+    def _finish(self, is_error):
+        if self._on_finished is not None:
+            self._on_finished(is_error)
+            self._on_finished = None
+        self._transport.close()
+
+
+_RESERVED_OPEN_FILES = 64
+
+
+def ensure_open_file_limit(num_connections):
+    """
+    Raises this process's open-file limit as far as allowed, since every connection is an open file.
+    @param num_connections the number of connections the process must hold open at once
+    """
+    try:
+        import resource
+    except ImportError:
+        return
+    required_limit = num_connections + _RESERVED_OPEN_FILES
+    soft_limit, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft_limit >= required_limit:
+        return
+    if hard_limit != resource.RLIM_INFINITY and hard_limit < required_limit:
+        raise RuntimeError('{} connections need an open-file limit of {}, but the hard limit is {}; '
+                           'raise it with `ulimit -n` or test fewer games'.format(num_connections,
+                                                                                  required_limit,
+                                                                                  hard_limit))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (required_limit, hard_limit))
+
+
+async def run_load_test(host, port, num_games, think_time=0.0, connect_batch_size=500, seed=0):
+    """
+    Opens two connections per game, plays every game to the end, and measures move latency.
+    @param think_time (seconds) the average time each client waits before a drop; 0 drops as fast as possible
+    @param connect_batch_size the number of connections to open at a time
+    @return (LoadTestResult)
+    """
+    num_clients = 2 * num_games
+    ensure_open_file_limit(num_clients)
+    loop = asyncio.get_event_loop()
+    rng = random.Random(seed)
+    latencies = []
+    all_finished = loop.create_future()
+    finished = {'clients': 0, 'errors': 0}
+
+    def on_finished(is_error):
+        finished['clients'] += 1
+        finished['errors'] += is_error
+        if finished['clients'] == num_clients and not all_finished.done():
+            all_finished.set_result(None)
+
+    start_time = time.perf_counter()
+    clients = []
+    for batch_start in range(0, num_clients, connect_batch_size):
+        batch_size = min(connect_batch_size, num_clients - batch_start)
+        connections = await asyncio.gather(*(
+            loop.create_connection(lambda: RandomPlayerClient(rng, latencies, on_finished, think_time), host, port)
+            for _ in range(batch_size)))
+        clients.extend(client for _, client in connections)
+    await all_finished
+
+    return LoadTestResult(num_finished_games=(finished['clients'] - finished['errors']) // 2,
+                          num_moves=sum(client.num_moves for client in clients),
+                          num_errors=finished['errors'],
+                          latencies=latencies,
+                          duration=time.perf_counter() - start_time)
+
+
+def run_tests(headless: bool) -> Tuple[Tuple[int, int], Set[ModuleType]]:
+    """
+    @return ((failure_count, test_count), tested_modules)
+    """
+    import sys
+    import test
+    return test.run_doctests(sys.modules[__name__], module_dependencies=[], headless=headless)
+
+
+if __name__ == '__main__':
+    run_tests(headless=False)
@@ -70,20 +70,31 @@ class ModifiedKey:
         return modifier_str + pygame.key.name(self.key)
 
 
-def get_key_with_current_modifiers(key):
+def get_modified_key(event):
     """
-    @return ModifiedKey
+    @param event a KEYDOWN pygame.event.Event
+    @return ModifiedKey with the modifiers that were held when the key was pressed, from the event itself
+
+    >>> ctrl_s = pygame.event.Event(pygame.KEYDOWN, key=pygame.K_s, mod=pygame.KMOD_LCTRL | pygame.KMOD_NUM)
+    >>> get_modified_key(ctrl_s) == ModifiedKey(pygame.K_s, Modifier.CTRL)
+    True
+    >>> alt_shift_k = pygame.event.Event(pygame.KEYDOWN, key=pygame.K_k, mod=pygame.KMOD_RALT | pygame.KMOD_LSHIFT)
+    >>> get_modified_key(alt_shift_k) == ModifiedKey(pygame.K_k, Modifier.ALT | Modifier.SHIFT)
+    True
+
+    Posted events may not have modifiers.
+    >>> get_modified_key(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_a)) == ModifiedKey(pygame.K_a)
+    True
     """
+    mod = getattr(event, 'mod', 0)
     modifiers = 0
-    pressed = pygame.key.get_pressed()
-    if pressed[pygame.K_LCTRL] or pressed[pygame.K_RCTRL]:
+    if mod & pygame.KMOD_CTRL:
         modifiers |= Modifier.CTRL
-    if pressed[pygame.K_LALT] or pressed[pygame.K_RALT]:
+    if mod & pygame.KMOD_ALT:
         modifiers |= Modifier.ALT
-    if pressed[pygame.K_LSHIFT] or pressed[pygame.K_RSHIFT]:
+    if mod & pygame.KMOD_SHIFT:
         modifiers |= Modifier.SHIFT
-
-    return ModifiedKey(key, modifiers)
+    return ModifiedKey(event.key, modifiers)
 
 
 def run_tests(headless: bool) -> Tuple[Tuple[int, int], Set[ModuleType]]:
@@ -12,6 +12,7 @@ class Action:
     MOVE_LEFT = 2
     MOVE_RIGHT = 3
     TOGGLE_MAIN_MENU = 4
+    TOGGLE_PERFORMANCE_OVERLAY = 5
 
 
 class KeyBindingManager:
@@ -20,6 +21,7 @@ class KeyBindingManager:
     _KEY_MOVE_LEFT = key.ModifiedKey(pygame.K_LEFT)
     _KEY_MOVE_RIGHT = key.ModifiedKey(pygame.K_RIGHT)
     _KEY_TOGGLE_MAIN_MENU = key.ModifiedKey(pygame.K_ESCAPE)
+    _KEY_TOGGLE_PERFORMANCE_OVERLAY = key.ModifiedKey(pygame.K_F3)
 
     def __init__(self):
         self._action_to_key_map = {
@@ -28,6 +30,7 @@ class KeyBindingManager:
             Action.MOVE_LEFT: self._KEY_MOVE_LEFT,
             Action.MOVE_RIGHT: self._KEY_MOVE_RIGHT,
             Action.TOGGLE_MAIN_MENU: self._KEY_TOGGLE_MAIN_MENU,
+            Action.TOGGLE_PERFORMANCE_OVERLAY: self._KEY_TOGGLE_PERFORMANCE_OVERLAY,
         }
         self._on_action_to_key_map_changed()
 
@@ -66,6 +69,7 @@ class KeyBindingManager:
             'Menu: {}'.format(self.get_key(Action.TOGGLE_MAIN_MENU)),
             'Drop: {}'.format(self.get_key(Action.DROP_PIECE)),
             'Move: {}/{}'.format(self.get_key(Action.MOVE_LEFT), self.get_key(Action.MOVE_RIGHT)),
+            'Stats: {}'.format(self.get_key(Action.TOGGLE_PERFORMANCE_OVERLAY)),
         )
 
     def print_controls(self):
@@ -58,9 +58,15 @@ class MainMenuController:
         self._view.draw(surface, self.is_enabled())
         self._is_dirty = False
 
+    def get_rect(self, surface):
+        return self._view.get_rect(self.is_enabled())
+
     def is_dirty(self):
         return self._is_dirty or self._view.is_dirty()
 
+    def is_animating(self):
+        return self._view.is_dirty()
+
     def tick(self):
         self._view.tick()
 
@@ -73,9 +79,10 @@ class MainMenuController:
         if not self.is_enabled():
             return False
 
-        # Pass through TOGGLE_MAIN_MENU and QUIT.
+        # Pass through TOGGLE_MAIN_MENU, TOGGLE_PERFORMANCE_OVERLAY and QUIT.
         game_action = self._get_game_action(modified_key)
         if (game_action == key_binding_manager.Action.TOGGLE_MAIN_MENU
+                or game_action == key_binding_manager.Action.TOGGLE_PERFORMANCE_OVERLAY
                 or game_action == key_binding_manager.Action.QUIT):
             self._is_dirty = True
             return False
@@ -3,6 +3,8 @@ from typing import Set, Tuple
 
 import pygame
 
+import text_cache
+
 
 class FadeAnimation:
     def __init__(self):
@@ -30,13 +32,24 @@ class MainMenuView:
     def __init__(self, model):
         self._model = model
 
-        pygame.init()
-        self._font = pygame.font.Font(None, self._FONT_SIZE)
-        self._controls_font = pygame.font.Font(None, self._CONTROLS_FONT_SIZE)
-
-        self._entries_size_x = self._calculate_entries_size_x()
+        # The fonts are loaded, and the sizes measured with them, when the menu is first drawn.
+        self._font = None
+        self._controls_font = None
+        self._entries_size_x = None
+        self._right_area_width = None
         self._fade_animation = None
         self._is_right_area_enabled = False
+        # {(current_index, is_right_area_enabled): Surface}
+        self._menu_surfaces = {}
+        # {current_index: Surface}
+        self._fade_surfaces = {}
+
+    def _load_fonts(self):
+        if self._font is not None:
+            return
+        self._font = text_cache.get_font(self._FONT_SIZE)
+        self._controls_font = text_cache.get_font(self._CONTROLS_FONT_SIZE)
+        self._entries_size_x = self._calculate_entries_size_x()
         self._right_area_width = self._calculate_controls_size_x()
 
     def _calculate_entries_size_x(self):
@@ -47,18 +60,87 @@ class MainMenuView:
         return max_entry_size_x + 2*self._ENTRY_TEXT_PADDING_X
 
     def draw(self, screen, is_enabled):
+        """
+        The menu is composited once per selection and right area state, so drawing it is a single blit.
+
+        >>> import main_menu_model
+        >>> class KeyBindingManager:
+        ...     def get_control_lines(self):
+        ...         return ['Drop: Space']
+        >>> entries = [main_menu_model.Entry(text, None, None, None, does_close_menu=True) for text in ('A', 'B')]
+        >>> menu_model = main_menu_model.MainMenuModel(entries, KeyBindingManager())
+        >>> menu_view = MainMenuView(menu_model)
+        >>> screen = pygame.Surface((640, 480))
+        >>> menu_view.draw(screen, is_enabled=True)
+        >>> menu_surface = menu_view._get_menu_surface()
+        >>> menu_view.draw(screen, is_enabled=True)
+        >>> menu_view._get_menu_surface() is menu_surface
+        True
+        >>> menu_model.change_current_index(1)
+        >>> menu_view._get_menu_surface() is menu_surface
+        False
+
+        The fade only changes the alpha of its cached surface.
+        >>> menu_view.on_menu_item_selected()
+        >>> menu_view.draw(screen, is_enabled=False)
+        >>> fade_surface = menu_view._get_fade_surface()
+        >>> menu_view.tick()
+        >>> menu_view.draw(screen, is_enabled=False)
+        >>> menu_view._get_fade_surface() is fade_surface, fade_surface.get_alpha()
+        (True, 250)
+        """
+        self._load_fonts()
         if is_enabled:
-            background_surface = self._create_background()
+            screen.blit(self._get_menu_surface(), self._POSITION)
 
-            self._draw_selection(background_surface, self._get_current_entry_position())
-            self._draw_entries(background_surface)
+        if self._fade_animation:
+            fade_surface = self._get_fade_surface()
+            fade_surface.set_alpha(self._fade_animation.alpha)
+            fade_surface_position = [a+b for a, b in zip(self._POSITION, self._get_current_entry_position())]
+            screen.blit(fade_surface, fade_surface_position)
+
+    def _get_menu_surface(self):
+        key = (self._model.current_index, self._is_right_area_enabled)
+        surface = self._menu_surfaces.get(key)
+        if surface is None:
+            surface = self._create_background()
+            self._draw_selection(surface, self._get_current_entry_position())
+            self._draw_entries(surface)
             if self._is_right_area_enabled:
-                self._draw_right_area(background_surface)
+                self._draw_right_area(surface)
+            self._menu_surfaces[key] = surface
+        return surface
 
-            screen.blit(background_surface, self._POSITION)
+    def _get_fade_surface(self):
+        surface = self._fade_surfaces.get(self._model.current_index)
+        if surface is None:
+            surface = pygame.Surface(self._get_selection_size())
+            surface.fill(self._BACKGROUND_COLOR)
+            self._draw_selection(surface, self._get_entry_position(0))
+            self._draw_entry(surface, self._model.current_index, self._get_entry_text_position(0))
+            self._fade_surfaces[self._model.current_index] = surface
+        return surface
 
+    def get_rect(self, is_enabled):
+        """
+        @return the Rect that draw() covers on the screen
+        """
+        self._load_fonts()
+        rect = pygame.Rect(self._POSITION, (0, 0))
+        if is_enabled:
+            width = self._entries_size_x
+            if self._is_right_area_enabled:
+                width += self._right_area_width
+            rect.size = (width, len(self._model.entries) * self._get_entry_height() - 1)
         if self._fade_animation:
-            self._draw_fade_animation(screen)
+            fade_x, fade_y = self._get_current_entry_position()
+            fade_rect = pygame.Rect((self._POSITION[0] + fade_x, self._POSITION[1] + fade_y),
+                                    self._get_selection_size())
+            rect = fade_rect.union(rect) if rect.width else fade_rect
+        if rect.width:
+            # Round the fractional entry heights outwards.
+            rect.inflate_ip(2, 2)
+        return rect
 
     def _create_background(self):
         width = self._entries_size_x
@@ -83,7 +165,7 @@ class MainMenuView:
             background_color = self._BACKGROUND_COLOR
 
         entry = self._model.entries[index]
-        message_surface = self._font.render(entry.text, True, color, background_color)
+        message_surface = text_cache.render(self._font, entry.text, True, color, background_color)
         screen.blit(message_surface, position)
 
     def _get_entry_text_position(self, entry_index):
@@ -92,9 +174,7 @@ class MainMenuView:
                 entry_position_y + 0.1*self._font.get_linesize())
 
     def _draw_selection(self, screen, position):
-        surface = pygame.Surface(self._get_selection_size())
-        surface.fill(self._SELECTION_COLOR)
-        screen.blit(surface, position)
+        screen.fill(self._SELECTION_COLOR, pygame.Rect(position, self._get_selection_size()))
 
     def _get_selection_size(self):
         return self._entries_size_x, self._get_entry_height()
@@ -105,7 +185,8 @@ class MainMenuView:
         screen.fill(background_color, right_area_rect)
 
         for control_index, control_line in enumerate(self._model.get_control_lines()):
-            message_surface = self._controls_font.render(control_line, True, self._FONT_HOVER_COLOR, background_color)
+            message_surface = text_cache.render(self._controls_font, control_line, True, self._FONT_HOVER_COLOR,
+                                                background_color)
             controls_text_position = (
                 self._entries_size_x + self._ENTRY_TEXT_PADDING_X,
                 self._ENTRY_TEXT_PADDING_X + control_index * 1.1 * self._controls_font.get_linesize()
@@ -119,17 +200,6 @@ class MainMenuView:
             max_size_x = max(max_size_x, size_x)
         return max_size_x + 2*self._ENTRY_TEXT_PADDING_X
 
-    def _draw_fade_animation(self, screen):
-        animation_surface = pygame.Surface(self._get_selection_size())
-        animation_surface.fill(self._BACKGROUND_COLOR)
-        animation_surface.set_alpha(self._fade_animation.alpha)
-
-        self._draw_selection(animation_surface, self._get_entry_position(0))
-        self._draw_entry(animation_surface, self._model.current_index, self._get_entry_text_position(0))
-
-        animation_surface_position = [a+b for a, b in zip(self._POSITION, self._get_current_entry_position())]
-        screen.blit(animation_surface, animation_surface_position)
-
     def _get_entry_position(self, entry_index):
         return 0, entry_index * self._get_entry_height()
 
@@ -161,7 +231,7 @@ def run_tests(headless: bool) -> Tuple[Tuple[int, int], Set[ModuleType]]:
     """
     import sys
     import test
-    return test.run_doctests(sys.modules[__name__], module_dependencies=[], headless=headless)
+    return test.run_doctests(sys.modules[__name__], module_dependencies=[text_cache], headless=headless)
 
 
 if __name__ == '__main__':
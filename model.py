@@ -1,3 +1,4 @@
+import random
 from types import ModuleType
 from typing import Set, Tuple
 
@@ -8,6 +9,32 @@ class Piece:
     PLAYER2 = 2
 
 
+_zobrist_keys = {}  # {(columns, rows): [[(0, player 1 key, player 2 key) for each row] for each column], ...}
+
+
+def _get_zobrist_keys(size):
+    """
+    @param size (columns, rows)
+    @return a random 64-bit key for each piece in each opening, indexed [x][y][piece], with 0 for Piece.NONE.  The keys
+        are built once per board size and shared by all models of that size.
+
+    >>> keys = _get_zobrist_keys((2, 3))
+    >>> keys is _get_zobrist_keys((2, 3)), len(keys), len(keys[0]), keys[1][2][Piece.NONE]
+    (True, 2, 3, 0)
+    >>> 0 < keys[1][2][Piece.PLAYER1] < 2**64
+    True
+    """
+    keys = _zobrist_keys.get(size)
+    if keys is None:
+        size_x, size_y = size
+        # Seeded by the size, so that keys are the same in every process.
+        generator = random.Random('{}x{}'.format(size_x, size_y))
+        keys = [[(0, generator.getrandbits(64), generator.getrandbits(64)) for _ in range(size_y)]
+                for _ in range(size_x)]
+        _zobrist_keys[size] = keys
+    return keys
+
+
 class Model:
     def __init__(self, consecutive_pieces_to_win, size):
         """
@@ -15,6 +42,7 @@ class Model:
         """
         self.consecutive_pieces_to_win = consecutive_pieces_to_win
         self.size_x, self.size_y = size
+        self._zobrist_keys = _get_zobrist_keys((self.size_x, self.size_y))
         self.reset_game()
 
     def reset_game(self):
@@ -26,6 +54,72 @@ class Model:
 
     def _initialize_board(self):
         self._openings = [[Piece.NONE for _ in range(self.size_y)] for _ in range(self.size_x)]
+        self.position_key = 0
+
+    def copy(self):
+        """
+        @return an independent copy of the model
+
+        >>> m = Model(4, (3, 3))
+        >>> m.drop_piece(Piece.PLAYER1, 1)
+        >>> m.end_turn()
+        >>> m_copy = m.copy()
+        >>> m_copy.drop_piece(Piece.PLAYER2, 1)
+        >>> print(m)
+        000
+        000
+        010
+        >>> print(m_copy)
+        000
+        020
+        010
+        >>> m_copy.current_player_piece
+        2
+        """
+        model_copy = Model(self.consecutive_pieces_to_win, (self.size_x, self.size_y))
+        model_copy.current_player_piece = self.current_player_piece
+        model_copy.winning_player = self.winning_player
+        model_copy.winning_piece_positions = self.winning_piece_positions
+        model_copy.drop_history = list(self.drop_history)
+        model_copy._openings = [list(column) for column in self._openings]
+        model_copy.position_key = self.position_key
+        return model_copy
+
+    @classmethod
+    def restore(cls, consecutive_pieces_to_win, size, drop_history, current_player_piece, winning_player,
+                winning_piece_positions):
+        """
+        Rebuilds a model from saved state.  Unlike replaying drop_history, the win check is not run for each drop.
+        @param size (columns, rows)
+        @param drop_history [(piece, x, y), ...]
+
+        >>> m = Model(2, (3, 2))
+        >>> for x in (0, 1, 0):
+        ...     m.drop_piece(m.current_player_piece, x)
+        ...     m.end_turn()
+        >>> restored_model = Model.restore(2, (3, 2), list(m.drop_history), m.current_player_piece,
+        ...                                m.winning_player, m.winning_piece_positions)
+        >>> print(restored_model)
+        100
+        120
+        >>> restored_model.position_key == m.position_key
+        True
+        >>> restored_model.winning_player, restored_model.winning_piece_positions, restored_model.current_player_piece
+        (1, [(0, 0), (0, 1)], 2)
+        """
+        restored_model = cls(consecutive_pieces_to_win, size)
+        openings = restored_model._openings
+        zobrist_keys = restored_model._zobrist_keys
+        position_key = 0
+        for piece, x, y in drop_history:
+            openings[x][y] = piece
+            position_key ^= zobrist_keys[x][y][piece]
+        restored_model.position_key = position_key
+        restored_model.drop_history = drop_history
+        restored_model.current_player_piece = current_player_piece
+        restored_model.winning_player = winning_player
+        restored_model.winning_piece_positions = winning_piece_positions
+        return restored_model
 
     def initialize_from_picture(self, pieces):
         """
@@ -186,6 +280,38 @@ class Model:
         if self._is_tie():
             self._on_tie()
 
+    def undo_drop(self):
+        """
+        Removes the last dropped piece.  The game is assumed to have been in progress before that drop.
+        This does not change the current player.
+
+        >>> m = Model(2, (2, 2))
+        >>> empty_position_key = m.position_key
+        >>> m.drop_piece(Piece.PLAYER1, 0)
+        >>> m.drop_piece(Piece.PLAYER1, 1)
+        >>> m.winning_player
+        1
+        >>> m.undo_drop()
+        >>> m.undo_drop()
+        >>> print(m)
+        00
+        00
+        >>> m.winning_player, m.winning_piece_positions, m.drop_history
+        (None, None, [])
+        >>> m.position_key == empty_position_key
+        True
+
+        >>> m.undo_drop()
+        Traceback (most recent call last):
+        RuntimeError: There are no drops to undo.
+        """
+        if not self.drop_history:
+            raise RuntimeError('There are no drops to undo.')
+        piece, x, y = self.drop_history.pop()
+        self._set_piece_at_opening(Piece.NONE, x, y)
+        self.winning_player = None
+        self.winning_piece_positions = None
+
     def get_drop_row(self, x):
         """
         @return the y-location that the piece would end up at, or -1 if the column is full
@@ -198,10 +324,41 @@ class Model:
     def _set_piece_at_opening(self, piece, x, y):
         """
         @param piece (Piece)
+
+        The position key is a Zobrist hash of the board: the XOR of the keys of the pieces in their openings.
+        >>> m = Model(4, (2, 2))
+        >>> m._set_piece_at_opening(Piece.PLAYER2, 0, 1)
+        >>> m.position_key == m._zobrist_keys[0][1][Piece.PLAYER2]
+        True
+        >>> m._set_piece_at_opening(Piece.PLAYER1, 0, 1)
+        >>> m.position_key == m._zobrist_keys[0][1][Piece.PLAYER1]
+        True
+        >>> m._set_piece_at_opening(Piece.NONE, 0, 1)
+        >>> m.position_key
+        0
         """
         self._validate_opening(x, y)
+        opening_keys = self._zobrist_keys[x][y]
+        self.position_key ^= opening_keys[self._openings[x][y]] ^ opening_keys[piece]
         self._openings[x][y] = piece
 
+    def get_exact_position_key(self):
+        """
+        Unlike position_key, which is a hash, this is unique to the board, but it is slow to compute on large boards.
+        @return the board as a base-3 number, with a digit per opening
+
+        >>> m = Model(4, (2, 2))
+        >>> m._set_piece_at_opening(Piece.PLAYER2, 0, 1)
+        >>> m._set_piece_at_opening(Piece.PLAYER1, 1, 0)
+        >>> m.get_exact_position_key()
+        15
+        """
+        position_key = 0
+        for column in reversed(self._openings):
+            for piece in reversed(column):
+                position_key = position_key * 3 + piece
+        return position_key
+
     def _is_valid_opening(self, x, y):
         return 0 <= x < self.size_x and 0 <= y < self.size_y
 
@@ -0,0 +1,326 @@
+"""
+Play against a remote opponent through a game_server.
+
+All socket I/O happens on background threads.  The game loop only touches thread-safe queues, so network latency
+can never stall a frame.
+"""
+import asyncio
+import errno
+import os
+import queue
+import random
+import select
+import socket
+import threading
+from types import ModuleType
+from typing import Set, Tuple
+
+import game_server
+import game_server_load_test
+
+
+class MessageType:
+    GAME = 'GAME'
+    MOVE = 'MOVE'
+    END = 'END'
+    ERROR = 'ERROR'
+    BOARD = 'BOARD'
+    DISCONNECTED = 'DISCONNECTED'
+
+
+class Message:
+    def __init__(self, message_type, arguments):
+        """
+        @param message_type (MessageType)
+        @param arguments the message's arguments, as ints where possible
+        """
+        self.type = message_type
+        self.arguments = arguments
+
+    @classmethod
+    def parse(cls, line):
+        """
+        >>> message = Message.parse('MOVE 1 3 0')
+        >>> message.type, message.arguments
+        ('MOVE', [1, 3, 0])
+        >>> Message.parse('ERROR not your turn').arguments
+        ['not', 'your', 'turn']
+        >>> Message.parse('BOARD 3 1 4 2 2 0012').arguments
+        [3, 1, 4, 2, 2, '0012']
+        """
+        words = line.split()
+        arguments = [int(word) if word.isdigit() else word for word in words[1:]]
+        if words[0] == MessageType.BOARD:
+            # The pieces keep their leading zeros.
+            arguments[-1] = words[-1]
+        return cls(words[0], arguments)
+
+    def __repr__(self):
+        return 'Message({!r}, {!r})'.format(self.type, self.arguments)
+
+
+class NetworkOpponent:
+    """
+    >>> server = LoopbackServer(think_time=0)
+    >>> server.start()
+    >>> opponent = NetworkOpponent('127.0.0.1', server.port)
+    >>> opponent.start()
+    >>> opponent.join()
+
+    The loopback opponent was waiting first, so it moves first.
+    >>> messages = opponent.poll_messages(timeout=5)
+    >>> while len(messages) < 2:
+    ...     messages += opponent.poll_messages(timeout=5)
+    >>> messages[0]
+    Message('GAME', [0, 2, 4, 7, 6])
+    >>> messages[1].type, messages[1].arguments[0]
+    ('MOVE', 1)
+
+    >>> opponent_x = messages[1].arguments[1]
+    >>> x = 0 if opponent_x != 0 else 1
+    >>> opponent.send_drop(x)
+    >>> opponent.poll_messages(timeout=5)[0].arguments == [2, x, 0]
+    True
+
+    >>> opponent.close()
+    >>> server.stop()
+
+    Closing interrupts a connection that is still in progress, e.g. to a server whose accept backlog is full.
+    >>> import time
+    >>> listener = socket.socket()
+    >>> listener.bind(('127.0.0.1', 0))
+    >>> listener.listen(0)
+    >>> backlog = [socket.socket() for _ in range(4)]
+    >>> for backlog_socket in backlog:
+    ...     backlog_socket.setblocking(False)
+    ...     _ = backlog_socket.connect_ex(listener.getsockname())
+    >>> opponent = NetworkOpponent(*listener.getsockname())
+    >>> opponent.start()
+    >>> start_time = time.perf_counter()
+    >>> opponent.close()
+    >>> time.perf_counter() - start_time < 1
+    True
+    >>> for open_socket in backlog + [listener]:
+    ...     open_socket.close()
+    """
+    def __init__(self, host, port, on_message=None):
+        """
+        @param on_message () -> None, called on the network thread whenever a message arrives, e.g. to wake up
+            the game loop.  Must be thread-safe.
+        """
+        self._address = (host, port)
+        self._on_message = on_message
+        self._received_messages = queue.Queue()
+        self._lines_to_send = queue.Queue()
+        self._socket = None
+        self._threads = []
+        # Guards _socket and _is_closed, so that a connection completing during close is shut down too.
+        self._lock = threading.Lock()
+        self._is_closed = False
+        # Written to by close, to interrupt a connection in progress.
+        self._close_receiver, self._close_sender = socket.socketpair()
+
+    def start(self):
+        """
+        Connects in the background.  Commands sent before the connection completes are queued.
+        """
+        reader_thread = threading.Thread(target=self._run_reader, name='network-reader', daemon=True)
+        self._threads.append(reader_thread)
+        reader_thread.start()
+
+    def join(self):
+        """
+        Requests a new game.  A MessageType.GAME message is received once it starts.
+        """
+        self._lines_to_send.put('JOIN')
+
+    def send_drop(self, x):
+        self._lines_to_send.put('DROP {}'.format(x))
+
+    def poll_messages(self, timeout=0):
+        """
+        @param timeout (seconds) how long to wait for the first message; 0 never blocks
+        @return [Message, ...] every message received since the last poll
+        """
+        messages = []
+        try:
+            if timeout > 0:
+                messages.append(self._received_messages.get(timeout=timeout))
+            while True:
+                messages.append(self._received_messages.get_nowait())
+        except queue.Empty:
+            pass
+        return messages
+
+    def close(self):
+        """
+        Disconnects, or stops connecting, and waits for the network threads to finish.
+        """
+        with self._lock:
+            if self._is_closed:
+                return
+            self._is_closed = True
+            connected_socket = self._socket
+        self._lines_to_send.put(None)
+        self._close_sender.send(b'\0')
+        if connected_socket is not None:
+            try:
+                connected_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        for thread in self._threads:
+            thread.join()
+        self._close_sender.close()
+        self._close_receiver.close()
+
+    def _connect(self):
+        """
+        Same as socket.create_connection, except that close interrupts it.
+        @return the connected socket, or None if closed first
+        """
+        host, port = self._address
+        error = OSError('No addresses for {}'.format(host))
+        for family, socket_type, protocol, _, address in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM):
+            connecting_socket = socket.socket(family, socket_type, protocol)
+            try:
+                connecting_socket.setblocking(False)
+                result = connecting_socket.connect_ex(address)
+                if result in (errno.EINPROGRESS, errno.EWOULDBLOCK):
+                    # Connection failures are reported as exceptional on Windows.
+                    readable, _, _ = select.select([self._close_receiver], [connecting_socket], [connecting_socket])
+                    if readable:
+                        connecting_socket.close()
+                        return None
+                    result = connecting_socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if result != 0:
+                    raise OSError(result, os.strerror(result))
+                connecting_socket.setblocking(True)
+                return connecting_socket
+            except OSError as connect_error:
+                connecting_socket.close()
+                error = connect_error
+        raise error
+
+    def _run_reader(self):
+        try:
+            connected_socket = self._connect()
+        except OSError as error:
+            self._receive(Message(MessageType.DISCONNECTED, [str(error)]))
+            return
+        with self._lock:
+            if connected_socket is None or self._is_closed:
+                if connected_socket is not None:
+                    connected_socket.close()
+                return
+            self._socket = connected_socket
+        writer_thread = threading.Thread(target=self._run_writer, name='network-writer', daemon=True)
+        self._threads.append(writer_thread)
+        writer_thread.start()
+
+        with self._socket, self._socket.makefile('r', encoding='ascii', newline='\n') as lines:
+            try:
+                for line in lines:
+                    if line.strip():
+                        self._receive(Message.parse(line))
+            except OSError:
+                pass
+        self._receive(Message(MessageType.DISCONNECTED, []))
+
+    def _run_writer(self):
+        while True:
+            line = self._lines_to_send.get()
+            if line is None:
+                return
+            try:
+                self._socket.sendall((line + '\n').encode('ascii'))
+            except OSError:
+                return
+
+    def _receive(self, message):
+        self._received_messages.put(message)
+        if self._on_message is not None:
+            self._on_message()
+
+
+class LoopbackServer:
+    """
+    A local stand-in for a remote server, for testing: a game_server on a background thread with an opponent that
+    is always waiting to play random drops.
+    """
+    def __init__(self, consecutive_pieces_to_win=4, size=(7, 6), think_time=0.5):
+        """
+        @param think_time (seconds) the opponent's average time before each drop
+        """
+        self._server = game_server.GameServer(consecutive_pieces_to_win, size)
+        self._think_time = think_time
+        self._rng = random.Random()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='loopback-server', daemon=True)
+        self._asyncio_server = None
+        self._opponent_transports = set()
+        self._is_stopping = False
+        self.port = None
+
+    def start(self):
+        self._thread.start()
+        future = asyncio.run_coroutine_threadsafe(self._start(), self._loop)
+        self.port = future.result()
+
+    async def _start(self):
+        self._asyncio_server = await self._server.start('127.0.0.1', 0)
+        await self._add_opponent()
+        return self._asyncio_server.sockets[0].getsockname()[1]
+
+    async def _add_opponent(self):
+        port = self._asyncio_server.sockets[0].getsockname()[1]
+        transport, _ = await self._loop.create_connection(
+            lambda: game_server_load_test.RandomPlayerClient(self._rng, [], self._on_game_finished, self._think_time),
+            '127.0.0.1',
+            port)
+        self._opponent_transports = {transport for transport in self._opponent_transports
+                                     if not transport.is_closing()}
+        self._opponent_transports.add(transport)
+
+    def _on_game_finished(self, is_error):
+        if not self._is_stopping:
+            self._loop.create_task(self._add_opponent())
+
+    def stop(self):
+        """
+        Closes the server and its opponents' connections, finishes the pending tasks, then closes the loop.
+        """
+        self._is_stopping = True
+        asyncio.run_coroutine_threadsafe(self._stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    async def _stop(self):
+        self._asyncio_server.close()
+        self._server.close_connections()
+        for transport in self._opponent_transports:
+            transport.close()
+        # asyncio.all_tasks and asyncio.current_task are new in Python 3.7.
+        all_tasks = getattr(asyncio, 'all_tasks', None) or asyncio.Task.all_tasks
+        current_task = getattr(asyncio, 'current_task', None) or asyncio.Task.current_task
+        tasks = [task for task in all_tasks(self._loop) if task is not current_task(self._loop)]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Lets the closed transports finish closing.
+        await asyncio.sleep(0)
+
+
+def run_tests(headless: bool) -> Tuple[Tuple[int, int], Set[ModuleType]]:
+    """
+    @return ((failure_count, test_count), tested_modules)
+    """
+    import sys
+    import test
+    return test.run_doctests(sys.modules[__name__],
+                             module_dependencies=[game_server, game_server_load_test],
+                             headless=headless)
+
+
+if __name__ == '__main__':
+    run_tests(headless=False)
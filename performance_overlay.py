@@ -0,0 +1,172 @@
+import time
+from types import ModuleType
+from typing import Set, Tuple
+
+import frame_profiler
+import text_cache
+
+import pygame
+
+
+class PerformanceOverlay:
+    """
+    A view layer that shows frame timings and, if an engine is set, its search statistics.
+
+    The text is only re-rendered when a value changes, so drawing is a single blit of a cached panel.
+
+    >>> pygame.init() # doctest:+ELLIPSIS
+    (...)
+
+    >>> import engine
+    >>> import model
+    >>> profiler = frame_profiler.FrameProfiler()
+    >>> profiler.record(frame_profiler.Phase.DRAW, 0.002)
+    >>> profiler.end_frame(drew=True)
+    >>> overlay = PerformanceOverlay(profiler)
+    >>> overlay.is_dirty()
+    False
+
+    >>> overlay.toggle()
+    >>> overlay.is_dirty()
+    True
+    >>> overlay.get_lines()[2:]
+    ['draw p50/p99: 2.0/2.0 ms', 'input p50/p99: 0.0/0.0 ms', 'dirty frames: 100%']
+
+    >>> search_engine = engine.Engine(max_depth=2)
+    >>> _ = search_engine.choose_column(model.Model(4, (7, 6)))
+    >>> overlay.set_engine(search_engine)
+    >>> overlay.get_lines()[5].startswith('engine: depth 2, ')
+    True
+
+    >>> surface = pygame.Surface((800, 700))
+    >>> overlay.draw(surface)
+    >>> overlay.is_dirty()
+    False
+    >>> overlay.get_rect(surface).topright
+    (795, 5)
+    """
+    _FONT_SIZE = 22
+    _FONT_COLOR = pygame.Color(255, 255, 255)
+    _BACKGROUND_COLOR = pygame.Color(0, 0, 0)
+    _MARGIN = 5
+    _UPDATE_INTERVAL = 0.25  # seconds
+
+    def __init__(self, profiler, engine=None):
+        """
+        @param profiler (frame_profiler.FrameProfiler)
+        @param engine (engine.Engine) the engine whose search statistics to show, or None
+        """
+        self._profiler = profiler
+        self._engine = engine
+        self._is_enabled = False
+        self._is_dirty = False
+        self._font = None
+        self._line_surfaces = []  # [(text, Surface), ...]
+        self._panel_surface = None
+        self._last_update_time = 0
+
+    def set_engine(self, engine):
+        self._engine = engine
+
+    def is_enabled(self):
+        return self._is_enabled
+
+    def toggle(self):
+        self._is_enabled = not self._is_enabled
+        self._last_update_time = 0
+        self._is_dirty = True
+
+    def is_dirty(self):
+        return self._is_dirty
+
+    def is_animating(self):
+        # The timings are refreshed periodically while shown.
+        return self._is_enabled
+
+    def tick(self):
+        if not self._is_enabled:
+            return
+        current_time = time.perf_counter()
+        if current_time - self._last_update_time < self._UPDATE_INTERVAL:
+            return
+        self._last_update_time = current_time
+        self._update_panel(self.get_lines())
+
+    def get_lines(self):
+        profiler = self._profiler
+        frame_p50, frame_p99 = self._get_percentiles_ms(frame_profiler.Phase.FRAME)
+        draw_p50, draw_p99 = self._get_percentiles_ms(frame_profiler.Phase.DRAW)
+        input_p50, input_p99 = self._get_percentiles_ms(frame_profiler.Phase.INPUT_LATENCY)
+        lines = [
+            'FPS: {:.0f}'.format(profiler.get_fps()),
+            'frame p50/p99: {:.1f}/{:.1f} ms'.format(frame_p50, frame_p99),
+            'draw p50/p99: {:.1f}/{:.1f} ms'.format(draw_p50, draw_p99),
+            'input p50/p99: {:.1f}/{:.1f} ms'.format(input_p50, input_p99),
+            'dirty frames: {:.0%}'.format(1 - profiler.get_skipped_frame_ratio()),
+        ]
+        if self._engine is not None:
+            stats = self._engine.last_search_stats
+            lines.append('engine: depth {}, {:.0f} nodes/s, TT hits {:.0%}'.format(stats.depth,
+                                                                                   stats.nodes_per_second,
+                                                                                   stats.tt_hit_rate))
+        return lines
+
+    def _get_percentiles_ms(self, phase):
+        return [1000 * (duration or 0) for duration in self._profiler.get_percentiles(phase, (50, 99))]
+
+    def _update_panel(self, lines):
+        """
+        Re-renders only the lines whose text changed, then recomposes the panel if any did.
+        """
+        if self._font is None:
+            self._font = text_cache.get_font(self._FONT_SIZE)
+
+        is_changed = len(lines) != len(self._line_surfaces)
+        line_surfaces = []
+        for index, line in enumerate(lines):
+            if index < len(self._line_surfaces) and self._line_surfaces[index][0] == line:
+                line_surfaces.append(self._line_surfaces[index])
+            else:
+                line_surfaces.append((line, self._font.render(line, True, self._FONT_COLOR, self._BACKGROUND_COLOR)))
+                is_changed = True
+        self._line_surfaces = line_surfaces
+        if not is_changed:
+            return
+
+        width = 2*self._MARGIN + max(surface.get_width() for _, surface in line_surfaces)
+        height = self._MARGIN + sum(surface.get_height() + self._MARGIN for _, surface in line_surfaces)
+        if self._panel_surface is None or self._panel_surface.get_size() != (width, height):
+            self._panel_surface = pygame.Surface((width, height))
+        self._panel_surface.fill(self._BACKGROUND_COLOR)
+        y = self._MARGIN
+        for _, surface in line_surfaces:
+            self._panel_surface.blit(surface, (self._MARGIN, y))
+            y += surface.get_height() + self._MARGIN
+        self._is_dirty = True
+
+    def get_rect(self, surface):
+        if not self._is_enabled or self._panel_surface is None:
+            return pygame.Rect(0, 0, 0, 0)
+        return self._panel_surface.get_rect(topright=(surface.get_width() - self._MARGIN, self._MARGIN))
+
+    def draw(self, surface):
+        self._is_dirty = False
+        if not self._is_enabled:
+            return
+        if self._panel_surface is None:
+            self._update_panel(self.get_lines())
+            self._is_dirty = False
+        surface.blit(self._panel_surface, self.get_rect(surface))
+
+
+def run_tests(headless: bool) -> Tuple[Tuple[int, int], Set[ModuleType]]:
+    """
+    @return ((failure_count, test_count), tested_modules)
+    """
+    import sys
+    import test
+    return test.run_doctests(sys.modules[__name__], module_dependencies=[frame_profiler, text_cache], headless=headless)
+
+
+if __name__ == '__main__':
+    run_tests(headless=False)
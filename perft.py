@@ -0,0 +1,176 @@
+"""
+Perft: counts the legal drop sequences of a given length from a position.
+
+Wins and full boards end a sequence early, exactly as Model.drop_piece reports them, so the counts check the model's
+move generation and end-of-game detection.  Any board implementation with the same interface must produce the same
+counts, and the nodes per second make a simple throughput benchmark.
+
+Usage:
+    python perft.py --depth 8
+"""
+import argparse
+import concurrent.futures
+import os
+import time
+from types import ModuleType
+from typing import Set, Tuple
+
+import model
+
+
+# Perft counts from the empty board, by depth.
+KNOWN_COUNTS_7X6 = {
+    1: 7,
+    2: 49,
+    3: 343,
+    4: 2401,
+    5: 16807,
+    6: 117649,
+    7: 823536,
+    8: 5673234,
+}
+
+
+def perft(game_model, depth):
+    """
+    @param game_model (model.Model) the position to count from.  It is modified during the count, then restored.
+    @return the number of positions reached by exactly depth drops
+
+    >>> m = model.Model(4, (7, 6))
+    >>> [perft(m, depth) for depth in range(1, 6)] == [KNOWN_COUNTS_7X6[depth] for depth in range(1, 6)]
+    True
+    >>> m.drop_history
+    []
+
+    Sequences end at a win: both drops win here.
+    >>> m = model.Model._create_from_picture(2, (2, 2), [
+    ... 0, 0,
+    ... 1, 0])
+    >>> perft(m, 1), perft(m, 2)
+    (2, 0)
+    """
+    if depth == 0:
+        return 1
+    if game_model.winning_player is not None:
+        return 0
+    piece = game_model.current_player_piece
+    count = 0
+    for x in range(game_model.size_x):
+        if game_model.is_column_full(x):
+            continue
+        if depth == 1:
+            count += 1
+            continue
+        game_model.drop_piece(piece, x)
+        game_model.end_turn()
+        count += perft(game_model, depth - 1)
+        game_model.end_turn()
+        game_model.undo_drop()
+    return count
+
+
+def perft_divide(game_model, depth):
+    """
+    @return {x: the perft count after dropping into column x, ...}, to locate a disagreement between two boards
+
+    >>> perft_divide(model.Model(4, (3, 3)), 4)
+    {0: 26, 1: 26, 2: 26}
+    """
+    counts = {}
+    piece = game_model.current_player_piece
+    for x in range(game_model.size_x):
+        if game_model.is_column_full(x):
+            continue
+        game_model.drop_piece(piece, x)
+        game_model.end_turn()
+        counts[x] = perft(game_model, depth - 1)
+        game_model.end_turn()
+        game_model.undo_drop()
+    return counts
+
+
+def _perft_after_drops(arguments):
+    game_model, columns, depth = arguments
+    # Tasks in the same batch share one unpickled model.
+    game_model = game_model.copy()
+    for x in columns:
+        game_model.drop_piece(game_model.current_player_piece, x)
+        game_model.end_turn()
+    return perft(game_model, depth)
+
+
+def _get_prefixes(game_model, num_plies):
+    """
+    @return [[x, ...], ...] every sequence of num_plies drops from the position, or a shorter one if it ends the game
+    """
+    if num_plies == 0 or game_model.winning_player is not None:
+        return [[]]
+    prefixes = []
+    piece = game_model.current_player_piece
+    for x in range(game_model.size_x):
+        if game_model.is_column_full(x):
+            continue
+        game_model.drop_piece(piece, x)
+        game_model.end_turn()
+        prefixes.extend([x] + prefix for prefix in _get_prefixes(game_model, num_plies - 1))
+        game_model.end_turn()
+        game_model.undo_drop()
+    return prefixes
+
+
+def parallel_perft(game_model, depth, workers=None, split_plies=2):
+    """
+    Splits the count into subtrees after split_plies drops and counts them in a process pool.
+    @param workers the number of processes, or None for one per core
+
+    >>> parallel_perft(model.Model(4, (7, 6)), 6, workers=2) == KNOWN_COUNTS_7X6[6]
+    True
+    """
+    workers = workers or os.cpu_count()
+    split_plies = min(split_plies, depth)
+    tasks = []
+    for prefix in _get_prefixes(game_model, split_plies):
+        # A prefix that ended the game early only counts if it is exactly depth drops long.
+        remaining_depth = depth - len(prefix)
+        if len(prefix) < split_plies and remaining_depth > 0:
+            continue
+        tasks.append((game_model, prefix, remaining_depth))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(_perft_after_drops, tasks, chunksize=max(1, len(tasks) // (4 * workers))))
+
+
+def _main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--depth', type=int, required=True)
+    parser.add_argument('--size', default='7x6', help='COLUMNSxROWS')
+    parser.add_argument('--connect', type=int, default=4, help='consecutive pieces to win')
+    parser.add_argument('--workers', type=int, default=1, help='0 for one per core')
+    args = parser.parse_args()
+
+    size = tuple(int(value) for value in args.size.split('x'))
+    game_model = model.Model(args.connect, size)
+    start_time = time.perf_counter()
+    if args.workers == 1:
+        count = perft(game_model, args.depth)
+    else:
+        count = parallel_perft(game_model, args.depth, args.workers or None)
+    elapsed_time = time.perf_counter() - start_time
+    print('perft({}) = {} in {:.2f} s ({:.0f} positions/s)'.format(args.depth, count, elapsed_time,
+                                                                   count / elapsed_time))
+    if size == (7, 6) and args.connect == 4 and args.depth in KNOWN_COUNTS_7X6:
+        if count != KNOWN_COUNTS_7X6[args.depth]:
+            print('Expected {}'.format(KNOWN_COUNTS_7X6[args.depth]))
+            raise SystemExit(1)
+
+
+def run_tests(headless: bool) -> Tuple[Tuple[int, int], Set[ModuleType]]:
+    """
+    @return ((failure_count, test_count), tested_modules)
+    """
+    import sys
+    import test
+    return test.run_doctests(sys.modules[__name__], module_dependencies=[model], headless=headless)
+
+
+if __name__ == '__main__':
+    _main()
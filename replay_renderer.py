@@ -0,0 +1,200 @@
+"""
+Renders recorded games into image frames without a display, e.g. to make replay clips in bulk on headless servers.
+
+The replay is drawn by View onto an offscreen Surface, without initializing a display, so it shows the same drop
+animations, bounces and winning line as the game.  Each game is written as either:
+    png  a directory of frame-NNNNN.png images
+    rgb  a raw stream of 8-bit RGB frames, e.g. for
+         ffmpeg -f rawvideo -pixel_format rgb24 -video_size 800x700 -framerate 30 -i game-00000.rgb game-00000.mp4
+
+Usage:
+    python replay_renderer.py --records games.c4gr --output clips --format rgb
+"""
+import argparse
+import collections
+import concurrent.futures
+import os
+from types import ModuleType
+from typing import Set, Tuple
+
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = 'hide'
+
+import game_record
+import model
+import view
+
+import pygame
+
+
+class FrameFormat:
+    PNG = 'png'
+    RGB = 'rgb'
+
+
+def render_frames(record, fps=30, frame_size=(800, 700), seconds_between_drops=0.25, end_seconds=1.0):
+    """
+    Replays the record, one frame at a time.  The cursor moves to each column before the piece is dropped into it.
+    @param record (game_record.GameRecord)
+    @param frame_size (width, height)
+    @param end_seconds how long to show the final position
+    @return an iterator of the frames.  The same Surface is redrawn for each frame, so copy it to keep it.
+
+    >>> record = game_record.GameRecord(2, (3, 2), [(1, 0, 0), (2, 1, 0), (1, 0, 1)])
+    >>> num_frames = 0
+    >>> for frame in render_frames(record, fps=30, frame_size=(400, 300)):
+    ...     num_frames += 1
+    >>> num_frames
+    82
+
+    The last frame shows the winning line through the winning pieces.
+    >>> frame.get_at((44, 64))
+    (30, 200, 30, 255)
+    """
+    game_model = model.Model(record.consecutive_pieces_to_win, (record.size_x, record.size_y))
+    surface = pygame.Surface(frame_size)
+    game_view = view.View(game_model, surface)
+    frame_time = 1 / fps
+
+    def draw_frame(drop_x, elapsed_time=frame_time):
+        game_view.tick(elapsed_time=elapsed_time)
+        game_view.draw(drop_x)
+        return surface
+
+    drop_x = record.drop_history[0][1] if record.drop_history else record.size_x // 2
+    yield draw_frame(drop_x, elapsed_time=0)
+    for piece, x, _ in record.drop_history:
+        drop_x = x
+        for _ in range(round(seconds_between_drops * fps)):
+            yield draw_frame(drop_x)
+        game_model.drop_piece(piece, x)
+        game_model.current_player_piece = piece
+        game_model.end_turn()
+        yield draw_frame(drop_x)
+        while not game_view.is_idle():
+            yield draw_frame(drop_x)
+    for _ in range(round(end_seconds * fps)):
+        yield draw_frame(drop_x)
+
+
+def render_replay(record, path, frame_format=FrameFormat.PNG, **kwargs):
+    """
+    Writes the frames of the replay to path: a directory for FrameFormat.PNG, or a file for FrameFormat.RGB.
+    @param kwargs passed to render_frames
+    @return the number of frames written
+
+    >>> import tempfile
+    >>> directory = tempfile.TemporaryDirectory()
+    >>> record = game_record.GameRecord(4, (7, 6), [(1, 3, 0)])
+    >>> path = os.path.join(directory.name, 'replay.rgb')
+    >>> num_frames = render_replay(record, path, FrameFormat.RGB, frame_size=(80, 70), end_seconds=0)
+    >>> os.path.getsize(path) == num_frames * 80 * 70 * 3
+    True
+    >>> path = os.path.join(directory.name, 'replay')
+    >>> render_replay(record, path, FrameFormat.PNG, frame_size=(80, 70), end_seconds=0) == num_frames
+    True
+    >>> sorted(os.listdir(path))[:2]
+    ['frame-00000.png', 'frame-00001.png']
+    >>> directory.cleanup()
+    """
+    num_frames = 0
+    if frame_format == FrameFormat.PNG:
+        os.makedirs(path, exist_ok=True)
+        for num_frames, frame in enumerate(render_frames(record, **kwargs), 1):
+            pygame.image.save(frame, os.path.join(path, 'frame-{:05}.png'.format(num_frames - 1)))
+    else:
+        with open(path, 'wb') as file:
+            for num_frames, frame in enumerate(render_frames(record, **kwargs), 1):
+                file.write(pygame.image.tostring(frame, 'RGB'))
+    return num_frames
+
+
+def _render_replay_task(arguments):
+    record, path, frame_format, kwargs = arguments
+    return render_replay(record, path, frame_format, **kwargs)
+
+
+def _map_in_order(executor, function, iterable, max_pending):
+    """
+    Same as executor.map, except that it only takes the next item from iterable once fewer than max_pending are in
+    progress, so a long iterable is not read into memory up front.
+    @return an iterator of the results, in order
+
+    >>> taken = []
+    >>> def take_items():
+    ...     for item in range(10):
+    ...         taken.append(item)
+    ...         yield item
+    >>> with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+    ...     results = _map_in_order(executor, lambda item: item * item, take_items(), max_pending=4)
+    ...     first_result = next(results)
+    ...     num_taken = len(taken)
+    ...     first_result, num_taken, list(results)
+    (0, 4, [1, 4, 9, 16, 25, 36, 49, 64, 81])
+    """
+    futures = collections.deque()
+    for item in iterable:
+        futures.append(executor.submit(function, item))
+        if len(futures) >= max_pending:
+            yield futures.popleft().result()
+    while futures:
+        yield futures.popleft().result()
+
+
+def render_replays(records_path, directory, frame_format=FrameFormat.PNG, workers=None, **kwargs):
+    """
+    Renders every game in a game_record file into directory, as game-NNNNN (PNG) or game-NNNNN.rgb (RGB).
+    @param workers the number of processes to render in, None for one per core, or 1 for this process
+    @param kwargs passed to render_frames
+    @return the number of games rendered
+
+    >>> import tempfile
+    >>> directory = tempfile.TemporaryDirectory()
+    >>> records_path = os.path.join(directory.name, 'games.jsonl')
+    >>> with game_record.GameRecordWriter(records_path, game_record.RecordFormat.JSONL) as writer:
+    ...     writer.write(game_record.GameRecord(4, (7, 6), [(1, 3, 0)]))
+    ...     writer.write(game_record.GameRecord(4, (7, 6), [(1, 2, 0), (2, 2, 1)]))
+    >>> output_directory = os.path.join(directory.name, 'clips')
+    >>> render_replays(records_path, output_directory, FrameFormat.RGB, workers=2, frame_size=(80, 70))
+    2
+    >>> sorted(os.listdir(output_directory))
+    ['game-00000.rgb', 'game-00001.rgb']
+    >>> directory.cleanup()
+    """
+    os.makedirs(directory, exist_ok=True)
+    extension = '.rgb' if frame_format == FrameFormat.RGB else ''
+    tasks = ((record, os.path.join(directory, 'game-{:05}{}'.format(index, extension)), frame_format, kwargs)
+             for index, record in enumerate(game_record.read_game_records(records_path)))
+    if workers == 1:
+        return sum(1 for _ in map(_render_replay_task, tasks))
+    workers = workers or os.cpu_count()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        return sum(1 for _ in _map_in_order(executor, _render_replay_task, tasks, max_pending=2 * workers))
+
+
+def _main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', required=True, help='a game_record file')
+    parser.add_argument('--output', required=True, help='the directory to write the replays to')
+    parser.add_argument('--format', choices=[FrameFormat.PNG, FrameFormat.RGB], default=FrameFormat.PNG)
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--frame-size', default='800x700', help='WIDTHxHEIGHT')
+    parser.add_argument('--workers', type=int, default=None, help='defaults to one per core')
+    args = parser.parse_args()
+
+    frame_size = tuple(int(value) for value in args.frame_size.split('x'))
+    num_games = render_replays(args.records, args.output, args.format, args.workers, fps=args.fps,
+                               frame_size=frame_size)
+    print('Rendered {} games into {}'.format(num_games, args.output))
+
+
+def run_tests(headless: bool) -> Tuple[Tuple[int, int], Set[ModuleType]]:
+    """
+    @return ((failure_count, test_count), tested_modules)
+    """
+    import sys
+    import test
+    return test.run_doctests(sys.modules[__name__], module_dependencies=[game_record, model, view], headless=headless)
+
+
+if __name__ == '__main__':
+    _main()
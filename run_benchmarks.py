@@ -0,0 +1,45 @@
+import argparse
+import json
+import platform
+import sys
+
+import benchmarks
+
+
+def _main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', default='benchmark_results.json', help='where to write the results as JSON')
+    parser.add_argument('--baseline', help='results JSON to compare against; regressions fail the run')
+    parser.add_argument('--threshold', type=float, default=0.1, help='allowed relative slowdown (default: 10%%)')
+    parser.add_argument('--filter', default='', help='only run benchmarks whose name contains this string')
+    parser.add_argument('--no-view', action='store_true', help='skip the rendering benchmarks')
+    args = parser.parse_args()
+
+    results = {}
+    for benchmark in benchmarks.get_benchmarks(include_view=not args.no_view, name_filter=args.filter):
+        result = benchmark.run()
+        results[benchmark.name] = result
+        print('{:<40} {:>12.3f} us/op'.format(benchmark.name, 1e6 * result['seconds_per_op']))
+
+    with open(args.output, 'w') as output_file:
+        json.dump({'python': platform.python_version(), 'platform': platform.platform(), 'results': results},
+                  output_file,
+                  indent=2,
+                  sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        regressions = benchmarks.find_regressions(results, baseline, args.threshold)
+        for name, baseline_seconds_per_op, seconds_per_op in regressions:
+            print('REGRESSION {}: {:.3f} us/op -> {:.3f} us/op ({:+.1%})'.format(
+                name,
+                1e6 * baseline_seconds_per_op,
+                1e6 * seconds_per_op,
+                seconds_per_op / baseline_seconds_per_op - 1))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    _main()
@@ -2,13 +2,19 @@ import argparse
 import sys
 
 import connect4
+import test
 
 
 def _main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--headless', action='store_true')
+    parser.add_argument('--workers', type=int, default=None, help='processes to test in; defaults to one per core')
+    parser.add_argument('--no-cache', action='store_true', help='test every module, even those that passed before')
     args = parser.parse_args()
-    (failure_count, test_count), tested_modules = connect4.run_tests(args.headless)
+    (failure_count, test_count), tested_modules = test.run_module_tree(connect4,
+                                                                       args.headless,
+                                                                       workers=args.workers,
+                                                                       use_cache=not args.no_cache)
     if failure_count:
         sys.exit(1)
 
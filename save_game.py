@@ -0,0 +1,150 @@
+"""
+Saving and resuming an in-progress game.
+
+A save file holds the model (board, current player, history and result) and the view state in a compact binary
+form.  The drops are packed as by game_record, and the board is rebuilt directly from them with Model.restore,
+so resuming never replays the drops through the win check.
+"""
+import os
+import struct
+from types import ModuleType
+from typing import Set, Tuple
+
+import game_record
+import model
+
+
+_SAVE_FILE_HEADER = b'C4SV\x01'
+# consecutive_pieces_to_win, size_x, size_y, current_player_piece, winning_player, drop_x, last_tracked_num_drops,
+# num_drops, num_winning_piece_positions
+_SAVE_STATE = struct.Struct('<BHHBBHIIH')
+_NO_WINNING_PLAYER = 0xFF
+
+
+class SavedGame:
+    def __init__(self, game_model, drop_x, last_tracked_num_drops):
+        """
+        @param drop_x the column of the drop cursor
+        @param last_tracked_num_drops the number of drops the view has already animated
+        """
+        self.model = game_model
+        self.drop_x = drop_x
+        self.last_tracked_num_drops = last_tracked_num_drops
+
+
+def pack_saved_game(saved_game):
+    """
+    @return bytes
+
+    >>> m = model.Model(4, (7, 6))
+    >>> m.drop_piece(model.Piece.PLAYER1, 3)
+    >>> m.end_turn()
+    >>> data = pack_saved_game(SavedGame(m, drop_x=5, last_tracked_num_drops=1))
+    >>> len(data)
+    26
+    >>> saved_game = unpack_saved_game(data)
+    >>> print(saved_game.model)
+    0000000
+    0000000
+    0000000
+    0000000
+    0000000
+    0001000
+    >>> saved_game.model.current_player_piece, saved_game.drop_x, saved_game.last_tracked_num_drops
+    (2, 5, 1)
+    """
+    game_model = saved_game.model
+    winning_player = _NO_WINNING_PLAYER if game_model.winning_player is None else game_model.winning_player
+    winning_piece_positions = game_model.winning_piece_positions or []
+    return b''.join([_SAVE_FILE_HEADER,
+                     _SAVE_STATE.pack(game_model.consecutive_pieces_to_win,
+                                      game_model.size_x,
+                                      game_model.size_y,
+                                      game_model.current_player_piece,
+                                      winning_player,
+                                      saved_game.drop_x,
+                                      saved_game.last_tracked_num_drops,
+                                      len(game_model.drop_history),
+                                      len(winning_piece_positions)),
+                     game_record.pack_drop_history(game_model.drop_history),
+                     struct.pack('<{}H'.format(2 * len(winning_piece_positions)),
+                                 *(coordinate for position in winning_piece_positions for coordinate in position))])
+
+
+def unpack_saved_game(data):
+    """
+    @param data bytes created by pack_saved_game
+    @return SavedGame
+
+    A finished game keeps its result.
+    >>> m = model.Model(2, (3, 2))
+    >>> for x in (0, 1, 0):
+    ...     m.drop_piece(m.current_player_piece, x)
+    ...     m.end_turn()
+    >>> restored_model = unpack_saved_game(pack_saved_game(SavedGame(m, 0, 3))).model
+    >>> restored_model.winning_player, restored_model.winning_piece_positions
+    (1, [(0, 0), (0, 1)])
+    >>> restored_model.drop_history == m.drop_history and restored_model.position_key == m.position_key
+    True
+
+    >>> unpack_saved_game(b'C4GR\\x01')
+    Traceback (most recent call last):
+    ValueError: Not a save file
+    """
+    if not data.startswith(_SAVE_FILE_HEADER):
+        raise ValueError('Not a save file')
+    offset = len(_SAVE_FILE_HEADER)
+    (consecutive_pieces_to_win, size_x, size_y, current_player_piece, winning_player, drop_x, last_tracked_num_drops,
+     num_drops, num_winning_piece_positions) = _SAVE_STATE.unpack_from(data, offset)
+    offset += _SAVE_STATE.size
+
+    drop_history = game_record.unpack_drop_history(size_x, data, offset, num_drops)
+    offset += 2 * num_drops
+    coordinates = struct.unpack_from('<{}H'.format(2 * num_winning_piece_positions), data, offset)
+    winning_piece_positions = list(zip(coordinates[::2], coordinates[1::2])) or None
+
+    game_model = model.Model.restore(consecutive_pieces_to_win,
+                                     (size_x, size_y),
+                                     drop_history,
+                                     current_player_piece,
+                                     None if winning_player == _NO_WINNING_PLAYER else winning_player,
+                                     winning_piece_positions)
+    return SavedGame(game_model, drop_x, last_tracked_num_drops)
+
+
+def save_game(path, saved_game):
+    """
+    Writes to a temporary file first, so an interrupted save never corrupts an existing one.
+    """
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as file:
+        file.write(pack_saved_game(saved_game))
+    os.replace(temporary_path, path)
+
+
+def load_game(path):
+    """
+    @return SavedGame
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as directory:
+    ...     path = os.path.join(directory, 'game.sav')
+    ...     save_game(path, SavedGame(model.Model(4, (7, 6)), 3, 0))
+    ...     load_game(path).drop_x
+    3
+    """
+    with open(path, 'rb') as file:
+        return unpack_saved_game(file.read())
+
+
+def run_tests(headless: bool) -> Tuple[Tuple[int, int], Set[ModuleType]]:
+    """
+    @return ((failure_count, test_count), tested_modules)
+    """
+    import sys
+    import test
+    return test.run_doctests(sys.modules[__name__], module_dependencies=[game_record, model], headless=headless)
+
+
+if __name__ == '__main__':
+    run_tests(headless=False)
@@ -1,19 +1,43 @@
 """
-TODO: Currently it's possible for run_doctests to call run_doctests on a dependency more than
-once.
+Runs the doctests of a module and of everything it depends on.
 
-e.g.
+Each module's run_tests function declares its dependencies through run_doctests.  The whole dependency graph is
+collected first, so that a module shared by several others is tested exactly once, e.g. D here:
     A
-   / \
+   / \\
   B   C
-   \ /
+   \\ /
     D
-Here D's run_tests function is called twice: once each for B and C.
+The modules are then tested in parallel processes.  Results are cached in _CACHE_PATH, keyed by a hash of the
+source of each module and of every module of this repository that it imports, directly or not, including the imports
+in its doctests.  Modules that have not changed since they last passed are skipped.  A change to this file, or to the
+Python or pygame version, retests everything.
+
+Headless runs select SDL's dummy video driver in the processes that test, so the tests that draw still run without a
+display.  Modules that cannot be tested headless, e.g. key, skip themselves in run_tests.
 """
+import ast
+import concurrent.futures
+import contextlib
+import doctest
+import hashlib
+import importlib
+import io
+import json
+import os
+import sys
 from types import ModuleType
 from typing import Set, Tuple
 
 
+_SOURCE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+_CACHE_PATH = os.path.join(_SOURCE_DIRECTORY, '.doctest_cache.json')
+
+# {module: [dependency module, ...] or None if it has no doctests to run, ...} while collecting the dependency graph,
+# otherwise None
+_collected_dependencies = None
+
+
 def run_doctests(module, module_dependencies, headless: bool) -> Tuple[Tuple[int, int], Set[ModuleType]]:
     """
     @param module the module to test
@@ -21,20 +45,213 @@ def run_doctests(module, module_dependencies, headless: bool) -> Tuple[Tuple[int
     @param headless If running in headless mode
     @return ((failure_count, test_count), tested_modules)
     """
-    import doctest
+    global _collected_dependencies
+    if _collected_dependencies is not None:
+        _collected_dependencies[module] = list(module_dependencies)
+        for dependency in module_dependencies:
+            if dependency not in _collected_dependencies:
+                dependency.run_tests(headless)
+                # e.g. modules that cannot be tested when headless
+                _collected_dependencies.setdefault(dependency, None)
+        return (0, 0), {module}
+
+    return run_module_tree(module, headless)
+
+
+def run_module_tree(module, headless: bool, workers=None, use_cache=True) -> Tuple[Tuple[int, int], Set[ModuleType]]:
+    """
+    Same as module.run_tests(headless), with control over how the tests run.
+    @param workers the number of processes to test in, None for one per core, or 1 for this process
+    @param use_cache if False, every module is tested even if it passed before
+    """
+    global _collected_dependencies
+    _collected_dependencies = {}
+    try:
+        module.run_tests(headless)
+        # Only the modules with doctests to run, and their dependencies that do.
+        dependencies = {module: [dependency for dependency in module_dependencies
+                                 if _collected_dependencies[dependency] is not None]
+                        for module, module_dependencies in _collected_dependencies.items()
+                        if module_dependencies is not None}
+    finally:
+        _collected_dependencies = None
+    return _run_module_graph(dependencies, headless, workers, use_cache)
+
+
+def _get_module_name(module):
+    if module.__name__ == '__main__':
+        return os.path.splitext(os.path.basename(module.__file__))[0]
+    return module.__name__
+
+
+def _get_imported_module_names(source):
+    """
+    @return {name, ...} of the top-level modules that the source imports anywhere, including in its doctests
+    """
+    trees = [ast.parse(source)]
+    parser = doctest.DocTestParser()
+    for node in ast.walk(trees[0]):
+        if isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            docstring = ast.get_docstring(node, clean=False)
+            for example in parser.get_examples(docstring or ''):
+                try:
+                    trees.append(ast.parse(example.source))
+                except SyntaxError:
+                    pass
+
+    module_names = set()
+    for tree in trees:
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                module_names.update(alias.name.split('.')[0] for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.level == 0:
+                module_names.add(node.module.split('.')[0])
+    return module_names
+
+
+def _get_environment_key(headless):
+    """
+    @return a hash of what, besides the sources under test, the results depend on
+    """
+    try:
+        import pygame
+        pygame_version = pygame.version.ver
+    except ImportError:
+        pygame_version = None
+    with open(os.path.abspath(__file__), 'rb') as file:
+        test_source_hash = hashlib.sha256(file.read()).hexdigest()
+    key_source = ' '.join([test_source_hash, sys.version, str(pygame_version), str(headless)])
+    return hashlib.sha256(key_source.encode()).hexdigest()
+
+
+def _get_cache_keys(dependencies, headless):
+    """
+    @return {module: a hash of its source and of the sources of everything it imports, ...}
+    """
+    source_hashes = {}
+    imported_paths = {}
+
+    def read_source(path):
+        with open(path, 'rb') as file:
+            source = file.read()
+        source_hashes[path] = hashlib.sha256(source).hexdigest()
+        imported_paths[path] = set()
+        for module_name in _get_imported_module_names(source):
+            imported_path = os.path.join(_SOURCE_DIRECTORY, module_name + '.py')
+            if os.path.isfile(imported_path):
+                imported_paths[path].add(imported_path)
+
+    def get_import_closure(path):
+        closure = set()
+        paths_to_visit = [path]
+        while paths_to_visit:
+            path = paths_to_visit.pop()
+            if path not in closure:
+                closure.add(path)
+                if path not in source_hashes:
+                    read_source(path)
+                paths_to_visit.extend(imported_paths[path])
+        return closure
+
+    environment_key = _get_environment_key(headless)
+    cache_keys = {}
+    for module in dependencies:
+        # Declared dependencies are included even if they are only reached through attributes of other modules.
+        paths = set()
+        for closure_module in [module] + dependencies[module]:
+            paths |= get_import_closure(os.path.abspath(closure_module.__file__))
+        key_source = ' '.join([environment_key] + sorted(source_hashes[path] for path in paths))
+        cache_keys[module] = hashlib.sha256(key_source.encode()).hexdigest()
+    return cache_keys
+
+
+def _load_cache():
+    try:
+        with open(_CACHE_PATH) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(cache):
+    temporary_path = _CACHE_PATH + '.tmp'
+    try:
+        with open(temporary_path, 'w') as file:
+            json.dump(cache, file, indent=2, sort_keys=True)
+        os.replace(temporary_path, _CACHE_PATH)
+    except OSError:
+        pass
+
+
+@contextlib.contextmanager
+def _select_dummy_video_driver(headless):
+    """
+    Selects SDL's dummy video driver while headless, then restores the previous one, since this may run in the
+    caller's process.
+    """
+    previous_video_driver = os.environ.get('SDL_VIDEODRIVER')
+    if headless:
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    try:
+        yield
+    finally:
+        if previous_video_driver is None:
+            os.environ.pop('SDL_VIDEODRIVER', None)
+        else:
+            os.environ['SDL_VIDEODRIVER'] = previous_video_driver
+
+
+def _test_module(module_name, headless):
+    """
+    @return (failure_count, test_count, output)
+    """
+    # Before pygame initializes the display.
+    with _select_dummy_video_driver(headless):
+        module = importlib.import_module(module_name)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            failure_count, test_count = doctest.testmod(module)
+    return failure_count, test_count, output.getvalue()
+
+
+def _run_module_graph(dependencies, headless, workers=None, use_cache=True):
+    """
+    @param dependencies {module: [dependency module, ...], ...} for every module to test
+    @return ((failure_count, test_count), tested_modules)
+    """
+    cache_keys = _get_cache_keys(dependencies, headless)
+    cache = _load_cache() if use_cache else {}
+    module_names = {module: _get_module_name(module) for module in dependencies}
 
-    tested_modules = {module}
+    failure_count = 0
+    test_count = 0
+    modules_to_test = []
+    for module in dependencies:
+        cached_result = cache.get(module_names[module])
+        if cached_result is not None and cached_result['key'] == cache_keys[module]:
+            test_count += cached_result['test_count']
+        else:
+            modules_to_test.append(module)
 
-    # Test self
-    test_results = doctest.testmod(module)
+    if workers == 1 or len(modules_to_test) <= 1:
+        results = [_test_module(module_names[module], headless) for module in modules_to_test]
+    else:
+        # Workers import the modules by name, so this works whether they are forked or spawned, e.g. on Windows and
+        # macOS.
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            results = list(executor.map(_test_module,
+                                        [module_names[module] for module in modules_to_test],
+                                        [headless] * len(modules_to_test)))
 
-    # Test other modules
-    if module_dependencies:
-        for module in module_dependencies:
-            if module in tested_modules:
-                continue
-            current_test_results, current_tested_modules = module.run_tests(headless)
-            test_results = tuple(x + y for x, y in zip(test_results, current_test_results))
-            tested_modules.update(current_tested_modules)
+    for module, (module_failure_count, module_test_count, output) in zip(modules_to_test, results):
+        sys.stdout.write(output)
+        failure_count += module_failure_count
+        test_count += module_test_count
+        if module_failure_count == 0:
+            cache[module_names[module]] = {'key': cache_keys[module], 'test_count': module_test_count}
+        else:
+            cache.pop(module_names[module], None)
+    if use_cache and modules_to_test:
+        _save_cache(cache)
 
-    return test_results, tested_modules
+    return (failure_count, test_count), set(dependencies)
@@ -0,0 +1,93 @@
+import collections
+from types import ModuleType
+from typing import Set, Tuple
+
+import pygame
+
+
+class TextCache:
+    """
+    Rendered text surfaces, since the views draw the same strings frame after frame.
+    Least recently used surfaces are evicted once max_size is reached.
+
+    >>> pygame.init() # doctest:+ELLIPSIS
+    (...)
+    >>> font = pygame.font.Font(None, 36)
+    >>> white, black = pygame.Color(255, 255, 255), pygame.Color(0, 0, 0)
+    >>> cache = TextCache(max_size=2)
+    >>> surface = cache.render(font, 'Player 1 Won!', True, white)
+    >>> cache.render(font, 'Player 1 Won!', True, white) is surface
+    True
+    >>> cache.render(font, 'Player 1 Won!', True, white, black) is surface
+    False
+
+    >>> _ = cache.render(font, 'Tie Game!', True, white)
+    >>> len(cache), cache.render(font, 'Player 1 Won!', True, white) is surface
+    (2, False)
+    """
+    _DEFAULT_MAX_SIZE = 256
+
+    def __init__(self, max_size=_DEFAULT_MAX_SIZE):
+        self._max_size = max_size
+        self._surfaces = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._surfaces)
+
+    def render(self, font, text, antialias, color, background=None):
+        """
+        Same as font.render, but returns the cached surface if the text was rendered before.
+        The returned surface is shared, so it must not be modified.
+        """
+        key = (font, text, antialias, tuple(color), None if background is None else tuple(background))
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self._surfaces.move_to_end(key)
+            return surface
+        if background is None:
+            surface = font.render(text, antialias, color)
+        else:
+            surface = font.render(text, antialias, color, background)
+        self._surfaces[key] = surface
+        if len(self._surfaces) > self._max_size:
+            self._surfaces.popitem(last=False)
+        return surface
+
+
+_shared_text_cache = TextCache()
+_fonts = {}  # {size: Font, ...}
+
+
+def get_font(size):
+    """
+    @return the default font at the size.  Fonts are loaded when first used and shared by all views.
+
+    >>> get_font(36) is get_font(36)
+    True
+    """
+    font = _fonts.get(size)
+    if font is None:
+        pygame.font.init()
+        font = pygame.font.Font(None, size)
+        _fonts[size] = font
+    return font
+
+
+def render(font, text, antialias, color, background=None):
+    """
+    Renders the text through the cache shared by all views.
+    """
+    return _shared_text_cache.render(font, text, antialias, color, background)
+
+
+def run_tests(headless: bool) -> Tuple[Tuple[int, int], Set[ModuleType]]:
+    """
+    @return ((failure_count, test_count), tested_modules)
+    """
+    import sys
+    import test
+    return test.run_doctests(sys.modules[__name__], module_dependencies=[], headless=headless)
+
+
+if __name__ == '__main__':
+    run_tests(headless=False)
@@ -0,0 +1,349 @@
+"""
+Plays matches between engine configurations and estimates their relative strength.
+
+Each pairing plays every balanced opening twice, once with each engine moving first, so neither engine benefits
+from the choice of openings or from moving first.  Games are played concurrently across processes.
+
+Usage:
+    python tournament.py --engine fast:max_depth=4 --engine slow:max_depth=6 --opening-plies 2
+"""
+import argparse
+import concurrent.futures
+import itertools
+import math
+import os
+from types import ModuleType
+from typing import Set, Tuple
+
+import engine
+import model
+
+
+class TournamentMode:
+    ROUND_ROBIN = 'round-robin'
+    GAUNTLET = 'gauntlet'
+
+
+class EngineConfig:
+    def __init__(self, name, **engine_kwargs):
+        """
+        @param engine_kwargs keyword arguments for engine.Engine
+        """
+        self.name = name
+        self.engine_kwargs = engine_kwargs
+
+    @classmethod
+    def parse(cls, spec):
+        """
+        @param spec 'name:key=value,key=value'
+
+        >>> config = EngineConfig.parse('fast:max_depth=4,time_limit=0.5,use_transposition_table=false')
+        >>> config.name, sorted(config.engine_kwargs.items())
+        ('fast', [('max_depth', 4), ('time_limit', 0.5), ('use_transposition_table', False)])
+
+        >>> EngineConfig.parse('fast:depth=4')
+        Traceback (most recent call last):
+        ValueError: Unknown engine option 'depth'
+        """
+        name, _, options = spec.partition(':')
+        engine_kwargs = {}
+        for option in filter(None, options.split(',')):
+            key, _, value = option.partition('=')
+            if key not in cls._OPTION_PARSERS:
+                raise ValueError('Unknown engine option {!r}'.format(key))
+            engine_kwargs[key] = cls._OPTION_PARSERS[key](value)
+        return cls(name, **engine_kwargs)
+
+    _OPTION_PARSERS = {
+        'max_depth': int,
+        'time_limit': float,
+        'use_transposition_table': lambda value: value.lower() in ('1', 'true', 'yes'),
+    }
+
+    def create_engine(self):
+        return engine.Engine(name=self.name, **self.engine_kwargs)
+
+
+class GameResult:
+    def __init__(self, first_name, second_name, first_score, first_stats, second_stats):
+        """
+        @param first_score 1 if the first engine won, 0.5 for a tie and 0 if it lost
+        @param first_stats,second_stats (engine.EngineStats)
+        """
+        self.first_name = first_name
+        self.second_name = second_name
+        self.first_score = first_score
+        self.first_stats = first_stats
+        self.second_stats = second_stats
+
+
+def generate_openings(consecutive_pieces_to_win, size, num_plies):
+    """
+    @return every sequence of num_plies columns that does not end the game, without mirror-image duplicates
+
+    >>> len(generate_openings(4, (7, 6), 1))
+    4
+    >>> generate_openings(4, (7, 6), 2)[:5]
+    [(0, 0), (0, 1), (0, 2), (0, 3), (0, 4)]
+    >>> len(generate_openings(4, (7, 6), 2))
+    25
+    """
+    size_x, _ = size
+    openings = []
+    seen = set()
+    for columns in itertools.product(range(size_x), repeat=num_plies):
+        mirrored_columns = tuple(size_x - 1 - x for x in columns)
+        if mirrored_columns in seen:
+            continue
+        if _play_opening(consecutive_pieces_to_win, size, columns) is None:
+            continue
+        seen.add(columns)
+        openings.append(columns)
+    return openings
+
+
+def _play_opening(consecutive_pieces_to_win, size, columns):
+    """
+    @return the model after playing the columns, or None if they are illegal or end the game
+    """
+    game_model = model.Model(consecutive_pieces_to_win, size)
+    for x in columns:
+        if game_model.is_column_full(x):
+            return None
+        game_model.drop_piece(game_model.current_player_piece, x)
+        game_model.end_turn()
+        if game_model.winning_player is not None:
+            return None
+    return game_model
+
+
+def play_game(first_config, second_config, opening, consecutive_pieces_to_win, size):
+    """
+    @param first_config,second_config (EngineConfig) the engines that move first and second
+    @param opening the columns played before the engines take over
+    @return (GameResult)
+
+    >>> result = play_game(EngineConfig('a', max_depth=1), EngineConfig('b', max_depth=1), (), 3, (4, 3))
+    >>> result.first_score
+    1
+    >>> result.first_stats.moves > 0 and result.second_stats.moves > 0
+    True
+    """
+    game_model = _play_opening(consecutive_pieces_to_win, size, opening)
+    engines = {model.Piece.PLAYER1: first_config.create_engine(), model.Piece.PLAYER2: second_config.create_engine()}
+    while game_model.winning_player is None:
+        piece = game_model.current_player_piece
+        x = engines[piece].choose_column(game_model)
+        game_model.drop_piece(piece, x)
+        game_model.end_turn()
+
+    if game_model.winning_player == model.Piece.PLAYER1:
+        first_score = 1
+    elif game_model.winning_player == model.Piece.PLAYER2:
+        first_score = 0
+    else:
+        first_score = 0.5
+    return GameResult(first_config.name,
+                      second_config.name,
+                      first_score,
+                      engines[model.Piece.PLAYER1].stats,
+                      engines[model.Piece.PLAYER2].stats)
+
+
+def _play_game_from_arguments(arguments):
+    return play_game(*arguments)
+
+
+def get_pairings(configs, mode):
+    """
+    @param mode (TournamentMode) in gauntlet mode, the first config plays every other config
+    @return [(config_a, config_b), ...]
+
+    >>> configs = [EngineConfig(name) for name in 'abc']
+    >>> [(a.name, b.name) for a, b in get_pairings(configs, TournamentMode.ROUND_ROBIN)]
+    [('a', 'b'), ('a', 'c'), ('b', 'c')]
+    >>> [(a.name, b.name) for a, b in get_pairings(configs, TournamentMode.GAUNTLET)]
+    [('a', 'b'), ('a', 'c')]
+    """
+    if mode == TournamentMode.GAUNTLET:
+        return [(configs[0], config) for config in configs[1:]]
+    return list(itertools.combinations(configs, 2))
+
+
+def elo_difference(score):
+    """
+    @param score the average score per game [0-1]
+    @return the Elo rating difference that predicts the score
+
+    >>> elo_difference(0.5)
+    0.0
+    >>> round(elo_difference(0.75), 1)
+    190.8
+    >>> elo_difference(1.0)
+    inf
+    """
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return 400 * math.log10(score / (1 - score))
+
+
+def elo_confidence_interval(scores, z=1.96):
+    """
+    @param scores the per-game scores (1, 0.5 or 0)
+    @param z the normal quantile of the interval; 1.96 is a 95% interval
+    @return (elo, elo_lower_bound, elo_upper_bound)
+
+    >>> elo, lower, upper = elo_confidence_interval([1, 0, 0.5, 1] * 25)
+    >>> round(elo, 1), round(lower, 1), round(upper, 1)
+    (88.7, 30.5, 152.4)
+    """
+    num_games = len(scores)
+    mean = sum(scores) / num_games
+    variance = sum((score - mean)**2 for score in scores) / num_games
+    margin = z * math.sqrt(variance / num_games)
+    return elo_difference(mean), elo_difference(mean - margin), elo_difference(mean + margin)
+
+
+class TournamentResults:
+    _REPORT_ROW_FORMAT = '{:<12}{:>6}{:>8}  {:<22}{:>9}{:>9}'
+
+    def __init__(self, names):
+        self._names = names
+        self._scores = {name: [] for name in names}
+        self._pair_scores = {}
+        self._stats = {name: engine.EngineStats() for name in names}
+
+    def add(self, result):
+        """
+        @param result (GameResult)
+        """
+        self._scores[result.first_name].append(result.first_score)
+        self._scores[result.second_name].append(1 - result.first_score)
+        self._pair_scores.setdefault((result.first_name, result.second_name), []).append(result.first_score)
+        self._pair_scores.setdefault((result.second_name, result.first_name), []).append(1 - result.first_score)
+        self._stats[result.first_name].add(result.first_stats)
+        self._stats[result.second_name].add(result.second_stats)
+
+    def get_pair_scores(self, name, opponent_name):
+        return self._pair_scores.get((name, opponent_name), [])
+
+    def get_report_lines(self):
+        """
+        >>> results = TournamentResults(['a', 'b'])
+        >>> stats = engine.EngineStats()
+        >>> stats.nodes, stats.search_time, stats.moves = 3000, 1.5, 10
+        >>> for first_score in (1, 1, 0.5, 0):
+        ...     results.add(GameResult('a', 'b', first_score, stats, stats))
+        >>> print('\\n'.join(results.get_report_lines()))
+        Engine       Games   Score  Elo (95% CI)            Nodes/s  ms/move
+        a                4   62.5%  +89 [-221, +inf]           2000    150.0
+        b                4   37.5%  -89 [-inf, +221]           2000    150.0
+        <BLANKLINE>
+        a vs b: +2 =1 -1 +89 [-221, +inf]
+        """
+        lines = [self._REPORT_ROW_FORMAT.format('Engine', 'Games', 'Score', 'Elo (95% CI)', 'Nodes/s', 'ms/move')]
+        for name in self._names:
+            scores = self._scores[name]
+            if not scores:
+                continue
+            stats = self._stats[name]
+            lines.append(self._REPORT_ROW_FORMAT.format(name,
+                                                        len(scores),
+                                                        '{:.1%}'.format(sum(scores) / len(scores)),
+                                                        self._format_elo(scores),
+                                                        '{:.0f}'.format(stats.nodes_per_second),
+                                                        '{:.1f}'.format(1000 * stats.time_per_move)))
+
+        lines.append('')
+        for name, opponent_name in itertools.combinations(self._names, 2):
+            scores = self.get_pair_scores(name, opponent_name)
+            if not scores:
+                continue
+            lines.append('{} vs {}: +{} ={} -{} {}'.format(name,
+                                                         opponent_name,
+                                                         scores.count(1),
+                                                         scores.count(0.5),
+                                                         scores.count(0),
+                                                         self._format_elo(scores)))
+        return lines
+
+    @staticmethod
+    def _format_elo(scores):
+        elo, lower, upper = elo_confidence_interval(scores)
+        return '{} [{}, {}]'.format(_format_signed(elo), _format_signed(lower), _format_signed(upper))
+
+
+def _format_signed(value):
+    if math.isinf(value):
+        return '+inf' if value > 0 else '-inf'
+    return '{:+.0f}'.format(value)
+
+
+def run_tournament(configs, mode, consecutive_pieces_to_win, size, opening_plies, workers=None):
+    """
+    @param configs [EngineConfig, ...]
+    @param mode (TournamentMode)
+    @param workers the number of processes to play games in, None for one per core, or 1 to play in this process
+    @return (TournamentResults)
+
+    >>> configs = [EngineConfig('shallow', max_depth=1), EngineConfig('deep', max_depth=4)]
+    >>> results = run_tournament(configs, TournamentMode.ROUND_ROBIN, 3, (4, 3), opening_plies=1, workers=1)
+    >>> len(results.get_pair_scores('shallow', 'deep'))
+    4
+    """
+    names = [config.name for config in configs]
+    if len(set(names)) != len(names):
+        raise ValueError('Engine names must be unique')
+
+    openings = generate_openings(consecutive_pieces_to_win, size, opening_plies)
+    games = []
+    for config_a, config_b in get_pairings(configs, mode):
+        for opening in openings:
+            games.append((config_a, config_b, opening, consecutive_pieces_to_win, size))
+            games.append((config_b, config_a, opening, consecutive_pieces_to_win, size))
+
+    results = TournamentResults(names)
+    if workers == 1:
+        for game in games:
+            results.add(_play_game_from_arguments(game))
+    else:
+        workers = workers or os.cpu_count()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            chunk_size = max(1, len(games) // (4 * workers))
+            for result in executor.map(_play_game_from_arguments, games, chunksize=chunk_size):
+                results.add(result)
+    return results
+
+
+def _main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--engine', action='append', required=True, type=EngineConfig.parse,
+                        help="'name:key=value,...' where keys are max_depth, time_limit and use_transposition_table")
+    parser.add_argument('--mode', choices=[TournamentMode.ROUND_ROBIN, TournamentMode.GAUNTLET],
+                        default=TournamentMode.ROUND_ROBIN)
+    parser.add_argument('--size', default='7x6', help='COLUMNSxROWS')
+    parser.add_argument('--connect', type=int, default=4, help='consecutive pieces to win')
+    parser.add_argument('--opening-plies', type=int, default=2)
+    parser.add_argument('--workers', type=int, default=None, help='defaults to one per core')
+    args = parser.parse_args()
+    if len(args.engine) < 2:
+        parser.error('At least two engines are required')
+
+    size = tuple(int(value) for value in args.size.split('x'))
+    results = run_tournament(args.engine, args.mode, args.connect, size, args.opening_plies, args.workers)
+    print('\n'.join(results.get_report_lines()))
+
+
+def run_tests(headless: bool) -> Tuple[Tuple[int, int], Set[ModuleType]]:
+    """
+    @return ((failure_count, test_count), tested_modules)
+    """
+    import sys
+    import test
+    return test.run_doctests(sys.modules[__name__], module_dependencies=[engine, model], headless=headless)
+
+
+if __name__ == '__main__':
+    _main()
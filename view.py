@@ -1,11 +1,16 @@
+import collections
+import itertools
 import math
 import os
+import time
 from types import ModuleType
 from typing import Set, Tuple
 
 import model
+import text_cache
 
 import pygame
+import pygame.gfxdraw
 
 
 class ViewState:
@@ -13,12 +18,14 @@ class ViewState:
     GAME_OVER = 2
 
 
-class DropAnimation:
+class DropTrajectory:
+    """
+    The motion of a dropping piece.  Pieces that start falling together from the same row share a trajectory, so a
+    whole row is advanced at once, e.g. when a large board is cleared.
+    """
     _COEFFICIENT_OF_RESTITUTION = 0.3  # Bounciness [0-1)
 
-    def __init__(self, piece, board_x, board_y_initial, board_y_final, bounce):
-        self.piece = piece
-        self.board_x = board_x
+    def __init__(self, board_y_initial, board_y_final, bounce):
         self.board_y = board_y_initial
         self.board_y_initial = board_y_initial
         self.board_y_final = board_y_final
@@ -29,6 +36,11 @@ class DropAnimation:
         self._bounce_1_time = math.sqrt(board_y_initial - board_y_final)
         self._get_y_after_1_bounce = self._create_get_y_after_1_bounces_func(board_y_initial, board_y_final)
 
+    def copy(self):
+        trajectory = DropTrajectory.__new__(DropTrajectory)
+        trajectory.__dict__.update(self.__dict__)
+        return trajectory
+
     def prevent_new_bounce(self):
         """Prevents the drop from bouncing if it hasn't started yet."""
         self._prevent_new_bounce = True
@@ -84,10 +96,210 @@ class DropAnimation:
                 and (not self._is_bouncing or self._time >= self._bounce_1_time))
 
 
+class DropAnimation:
+    def __init__(self, piece, board_x, trajectory):
+        """
+        @param trajectory (DropTrajectory) shared by the pieces that fall the same way
+        """
+        self.piece = piece
+        self.board_x = board_x
+        self.trajectory = trajectory
+
+    @property
+    def board_y(self):
+        return self.trajectory.board_y
+
+    @property
+    def board_y_final(self):
+        return self.trajectory.board_y_final
+
+
+class DropAnimationSet:
+    """
+    The active drop animations, grouped by trajectory and indexed by the opening each comes to rest in.
+
+    >>> animations = DropAnimationSet()
+    >>> animations.add(DropAnimation(model.Piece.PLAYER1, 2, DropTrajectory(6, 0, bounce=True)))
+    >>> animations.add(DropAnimation(model.Piece.PLAYER2, 3, DropTrajectory(6, -1, bounce=False)))
+    >>> len(animations), sorted(animations.get_final_positions())
+    (2, [(2, 0)])
+    >>> animation = animations.get_by_final_position(2, 0)
+    >>> animations.drop_off_board(animation)
+    >>> animations.get_by_final_position(2, 0) is None, animation.board_y_final
+    (True, -1)
+    >>> finished_animations = []
+    >>> while animations:
+    ...     finished_animations += animations.step(0.1)
+    >>> len(finished_animations)
+    2
+
+    A row that falls together is stepped as one trajectory.  A piece that changes course leaves the others on theirs.
+    >>> row = DropTrajectory(2, 0, bounce=True)
+    >>> for x in range(3):
+    ...     animations.add(DropAnimation(model.Piece.PLAYER1, x, row))
+    >>> len(animations), len(animations.get_groups())
+    (3, 1)
+    >>> animations.drop_off_board(animations.get_by_final_position(1, 0))
+    >>> len(animations), len(animations.get_groups()), row.board_y_final
+    (3, 2, 0)
+    """
+    def __init__(self):
+        # {DropTrajectory: [DropAnimation, ...], ...} in the order they were added
+        self._animations_by_trajectory = {}
+        self._num_animations = 0
+        # {(board_x, board_y_final): DropAnimation, ...} for the animations that come to rest on the board
+        self._animations_by_final_position = {}
+
+    def __len__(self):
+        return self._num_animations
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self._animations_by_trajectory.values())
+
+    def get_groups(self):
+        """
+        @return [(DropTrajectory, [DropAnimation, ...]), ...] the animations grouped by the trajectory they share
+        """
+        return list(self._animations_by_trajectory.items())
+
+    def add(self, animation):
+        self._animations_by_trajectory.setdefault(animation.trajectory, []).append(animation)
+        self._num_animations += 1
+        if animation.board_y_final >= 0:
+            self._animations_by_final_position[(animation.board_x, animation.board_y_final)] = animation
+
+    def get_by_final_position(self, x, y):
+        """
+        @return the DropAnimation that comes to rest at (x, y), or None
+        """
+        return self._animations_by_final_position.get((x, y))
+
+    def get_final_positions(self):
+        return self._animations_by_final_position.keys()
+
+    def drop_off_board(self, animation):
+        """
+        Changes the animation to fall through the bottom of the board instead of coming to rest.
+        """
+        self._remove_from_index(animation)
+        animations = self._animations_by_trajectory[animation.trajectory]
+        if len(animations) > 1:
+            animations.remove(animation)
+            animation.trajectory = animation.trajectory.copy()
+            self._animations_by_trajectory[animation.trajectory] = [animation]
+        animation.trajectory.board_y_final = -1
+        animation.trajectory.prevent_new_bounce()
+
+    def step(self, delta):
+        """
+        Advances every trajectory by delta.
+        @return [DropAnimation, ...] the animations that finished, which are removed
+        """
+        finished_animations = []
+        for trajectory in list(self._animations_by_trajectory):
+            if trajectory.drop(delta):
+                finished_animations += self._animations_by_trajectory.pop(trajectory)
+        self._num_animations -= len(finished_animations)
+        for animation in finished_animations:
+            self._remove_from_index(animation)
+        return finished_animations
+
+    def _remove_from_index(self, animation):
+        position = (animation.board_x, animation.board_y_final)
+        if self._animations_by_final_position.get(position) is animation:
+            del self._animations_by_final_position[position]
+
+
+class PieceSpriteCache:
+    """
+    Pre-rendered pieces, so that drawing a piece is a blit rather than rasterizing a circle.
+
+    >>> pygame.init() # doctest:+ELLIPSIS
+    (...)
+    >>> cache = PieceSpriteCache()
+    >>> red = pygame.Color(200, 0, 0)
+    >>> sprite = cache.get_sprite(red, 40)
+    >>> sprite.get_size()
+    (81, 81)
+    >>> cache.get_sprite(red, 40) is sprite
+    True
+
+    Blitting a sprite gives the same pixels as drawing the circle.
+    >>> drawn_surface = pygame.Surface((100, 100))
+    >>> _ = pygame.draw.circle(drawn_surface, red, (50, 50), 40)
+    >>> blitted_surface = pygame.Surface((100, 100))
+    >>> _ = blitted_surface.blit(sprite, (10, 10))
+    >>> pygame.image.tostring(drawn_surface, 'RGB') == pygame.image.tostring(blitted_surface, 'RGB')
+    True
+
+    Sprites are kept for the most recently used radii, so switching between scales does not rebuild them.
+    >>> cache.get_sprite(red, 20).get_size()
+    (41, 41)
+    >>> cache.get_sprite(red, 40) is sprite
+    True
+    """
+    _MAX_CACHED_RADII = 4
+
+    def __init__(self, antialias=False):
+        """
+        @param antialias if True, the edges of the pieces are anti-aliased
+        """
+        self._antialias = antialias
+        self._sprites_by_radius = collections.OrderedDict()  # {radius: {(r, g, b, a): Surface, ...}, ...}
+
+    def get_sprite(self, color, radius):
+        """
+        @return a Surface with a circle of the color centered at (radius, radius) on a transparent background
+        """
+        sprites = self._sprites_by_radius.get(radius)
+        if sprites is None:
+            sprites = {}
+            self._sprites_by_radius[radius] = sprites
+            if len(self._sprites_by_radius) > self._MAX_CACHED_RADII:
+                self._sprites_by_radius.popitem(last=False)
+        else:
+            self._sprites_by_radius.move_to_end(radius)
+        key = tuple(color)
+        sprite = sprites.get(key)
+        if sprite is None:
+            sprite = self._create_sprite(color, radius)
+            sprites[key] = sprite
+        return sprite
+
+    def _create_sprite(self, color, radius):
+        size = (2*radius + 1, 2*radius + 1)
+        if self._antialias:
+            sprite = pygame.Surface(size, pygame.SRCALPHA)
+            sprite.fill(pygame.Color(0, 0, 0, 0))
+            pygame.gfxdraw.aacircle(sprite, radius, radius, radius, color)
+            pygame.gfxdraw.filled_circle(sprite, radius, radius, radius, color)
+            return sprite.convert_alpha() if pygame.display.get_surface() else sprite
+
+        # A run-length encoded color key blits much faster than per-pixel alpha.
+        sprite = pygame.Surface(size)
+        color_key = self._get_color_key(color)
+        sprite.fill(color_key)
+        pygame.draw.circle(sprite, color, (radius, radius), radius)
+        sprite.set_colorkey(color_key, pygame.RLEACCEL)
+        return sprite.convert() if pygame.display.get_surface() else sprite
+
+    @staticmethod
+    def _get_color_key(color):
+        """
+        @return a color that differs from the color
+        """
+        return pygame.Color(255, 0, 255) if tuple(color)[:3] != (255, 0, 255) else pygame.Color(0, 255, 0)
+
+
 class View:
+    # The layout is designed for these window sizes, and is scaled to the actual window.
     _WINDOW_SIZE_X = 800
     _WINDOW_SIZE_Y = 700
     _DESIRED_FPS = 60
+    # Animations advance in fixed steps of measured time, independent of the frame rate.
+    _SIMULATION_STEP = 1 / 240  # seconds
+    # When a frame takes longer than this, the game slows down rather than skipping more animation.
+    _MAX_SIMULATION_TIME_PER_TICK = 0.25  # seconds
 
     _FONT_SIZE = 36
 
@@ -106,25 +318,46 @@ class View:
     _BOARD_MARGIN = 50
     _BOARD_OPENING_RADIUS = 40
     _BOARD_OPENING_MARGIN = 15
+    _MAX_CACHED_BOARD_SURFACES = 4
+    # Beyond this many dirty rects, e.g. while a large board is cleared, the whole screen is redrawn instead.
+    _MAX_REDRAW_RECTS = 32
+    _ANTIALIAS_PIECES = False
 
     _ANIMATION_SPEED_MULTIPLIER = 8
     _DRAW_DROP_X_DELAY_AFTER_DROP = 1 / _ANIMATION_SPEED_MULTIPLIER  # seconds
 
-    def __init__(self, view_model):
+    def __init__(self, view_model, surface=None):
+        """
+        @param surface the Surface to draw to, e.g. an offscreen Surface to render without a display, or None to
+            open a window
+        """
         self.reset()
         self._model = view_model
-        self._drop_animations = []
+        self._drop_animations = DropAnimationSet()
         self._additional_layers = []
-
-        pygame.init()
-        pygame.display.set_caption('Connect Four')
+        self._layer_rects = {}  # {layer: the Rect it last drew to, ...}
+        self._last_moving_rects = []  # The Rects of the pieces that can move, as last drawn.
+        self._dirty_rects = []
+        self._clip_rect = None
+        self._piece_sprites = PieceSpriteCache(self._ANTIALIAS_PIECES)
+        # {(opening radius, opening margin): Surface, ...}, the boards for the most recently used scales
+        self._board_surfaces = collections.OrderedDict()
+
+        self._is_offscreen = surface is not None
+        if not self._is_offscreen:
+            pygame.display.init()
+            pygame.display.set_caption('Connect Four')
         self._fps_clock = pygame.time.Clock()
-        self._font = pygame.font.Font(None, self._FONT_SIZE)
-
-        pygame.display.set_icon(pygame.image.load(os.path.join('data', 'icon.png')))
-        self._screen = pygame.display.set_mode((self._WINDOW_SIZE_X, self._WINDOW_SIZE_Y), pygame.DOUBLEBUF)
+        self.last_wait_time = 0.0  # seconds
+        self.last_tick_elapsed_time = 0.0  # seconds
+        self._last_tick_time = time.perf_counter()
+        self._unsimulated_time = 0.0  # seconds
 
-        self._board_surface = self._create_board_surface()
+        if self._is_offscreen:
+            self._set_screen(surface)
+        else:
+            pygame.display.set_icon(pygame.image.load(os.path.join('data', 'icon.png')))
+            self.set_window_size((self._WINDOW_SIZE_X, self._WINDOW_SIZE_Y))
 
     def reset(self):
         """
@@ -135,26 +368,130 @@ class View:
         self._last_tracked_num_drops = 0
         self._last_drop_x = -1
         self._time_since_last_drop = 1000000  # large number
+        # True to redraw the whole screen.  Otherwise only the dirty rects and the rects of moving pieces are redrawn.
         self._dirty = True
+        self._is_redraw_requested = False
+        self._invalidate_static_surface()
+
+    def set_window_size(self, size):
+        """
+        Scales the layout to the window size, e.g. when the window is resized.
+
+        >>> game_view = View(model.Model(4, (7, 6)))
+        >>> game_view._board_opening_radius, game_view._get_board_rect()
+        (40, (50, 50, 680, 585))
+        >>> game_view.set_window_size((1600, 1400))
+        >>> game_view._board_opening_radius, game_view._get_board_rect()
+        (80, (100, 100, 1360, 1170))
+
+        Boards that need more room than the default window are scaled down to fit.
+        >>> game_view = View(model.Model(4, (50, 50)))
+        >>> x, y, width, height = game_view._get_board_rect()
+        >>> game_view._board_opening_radius, x + width <= 800, y + height <= 700
+        (5, True, True)
+        """
+        self._set_screen(pygame.display.set_mode(size, pygame.DOUBLEBUF | pygame.RESIZABLE))
+
+    def _set_screen(self, surface):
+        self._screen = surface
+        window_size_x, window_size_y = self._screen.get_size()
+
+        size_per_opening = self._BOARD_OPENING_MARGIN + 2*self._BOARD_OPENING_RADIUS
+        required_size_x = 2*self._BOARD_MARGIN + self._BOARD_OPENING_MARGIN + self._model.size_x * size_per_opening
+        required_size_y = 2*self._BOARD_MARGIN + self._BOARD_OPENING_MARGIN + self._model.size_y * size_per_opening
+        scale = min(window_size_x / max(self._WINDOW_SIZE_X, required_size_x),
+                    window_size_y / max(self._WINDOW_SIZE_Y, required_size_y))
+        self._board_margin = int(self._BOARD_MARGIN * scale)
+        self._board_opening_radius = max(1, int(self._BOARD_OPENING_RADIUS * scale))
+        self._board_opening_margin = int(self._BOARD_OPENING_MARGIN * scale)
+
+        self._board_surface = self._get_board_surface()
+        self._invalidate_static_surface()
+        self._dirty = True
+        self._layer_rects = {}
+        self._last_moving_rects = []
+        self._dirty_rects = []
+
+    def get_surface(self):
+        """
+        @return the Surface that the view draws to
+        """
+        return self._screen
+
+    def get_last_tracked_num_drops(self):
+        return self._last_tracked_num_drops
+
+    def set_last_tracked_num_drops(self, num_drops):
+        """
+        Only drops after the first num_drops are animated, e.g. when resuming a saved game.
+        """
+        self._last_tracked_num_drops = num_drops
+        self._dirty = True
+        self._invalidate_static_surface()
 
     def draw(self, drop_x):
+        """
+        Redraws only the parts of the screen that changed, unless the whole screen is dirty.
+        @return True if the view was drawn, False if the draw was skipped because nothing changed
+
+        >>> game_model = model.Model(4, (7, 6))
+        >>> game_view = View(game_model)
+        >>> game_view.draw(3)
+        True
+        >>> game_view.draw(3)
+        False
+
+        Moving the cursor only redraws where it was and where it is.
+        >>> game_view.draw(4)
+        True
+        >>> [tuple(rect) for rect in game_view._get_rects_to_redraw(5)]
+        [(444, 0, 83, 52), (444, 539, 83, 83), (539, 0, 83, 52), (539, 539, 83, 83)]
+        """
+        moving_rects = self._get_moving_rects(drop_x)
+        layer_rects = {layer: layer.get_rect(self._screen) for layer in self._additional_layers}
+        for layer in self._additional_layers:
+            if layer.is_dirty():
+                self._dirty_rects.append(self._layer_rects.get(layer, layer_rects[layer]))
+                self._dirty_rects.append(layer_rects[layer])
         # Optimization to skip the draw step if nothing changed.
         if not self._is_dirty(drop_x):
-            return
+            return False
 
+        # Clipping changes how the thick winning line is rasterized, so the game over screen is always drawn whole.
+        if self._dirty or self._state == ViewState.GAME_OVER:
+            rects = [self._screen.get_rect()]
+        else:
+            rects = self._get_rects_to_redraw(drop_x, moving_rects)
         self._dirty = False
+        self._is_redraw_requested = False
+        self._dirty_rects = []
+
+        for rect in rects:
+            self._clip_rect = rect
+            self._screen.set_clip(rect)
+            self._draw_scene(drop_x)
+        self._clip_rect = None
+        self._screen.set_clip(None)
+
+        if not self._is_offscreen:
+            if len(rects) == 1 and rects[0] == self._screen.get_rect():
+                pygame.display.flip()
+            else:
+                pygame.display.update(rects)
+        self._last_drop_x = drop_x
+        self._last_moving_rects = moving_rects
+        self._layer_rects = layer_rects
+        return True
 
-        self._screen.fill(self._BACKGROUND_COLOR)
-
-        self._draw_pieces_at_rest()
+    def _draw_scene(self, drop_x):
+        self._screen.blit(self._get_static_surface(), (0, 0))
         self._draw_dropping_pieces()
-        self._draw_board()
 
         if self._state == ViewState.PLAYING:
             if self._time_since_last_drop >= self._DRAW_DROP_X_DELAY_AFTER_DROP:
                 self._draw_drop_x(drop_x)
             else:
-                self._dirty = True
+                self._is_redraw_requested = True
             if not self._drop_animations:
                 self._draw_drop_preview(drop_x)
         elif self._state == ViewState.GAME_OVER:
@@ -163,24 +500,154 @@ class View:
         for layer in self._additional_layers:
             layer.draw(self._screen)
 
-        pygame.display.flip()
-        self._last_drop_x = drop_x
+    def is_idle(self):
+        """
+        @return True if nothing changes until the next input, so the game loop can wait for events instead of ticking
+
+        >>> game_model = model.Model(4, (7, 6))
+        >>> game_view = View(game_model)
+        >>> game_view.draw(3)
+        True
+        >>> game_view.is_idle()
+        True
+        >>> game_model.drop_piece(model.Piece.PLAYER1, 3)
+        >>> game_view.is_idle()
+        False
+        >>> while not game_view.is_idle():
+        ...     game_view.tick()
+        ...     _ = game_view.draw(3)
+        """
+        return not (self._drop_animations
+                    or self._dirty
+                    or self._is_redraw_requested
+                    or self._dirty_rects
+                    or self._time_since_last_drop < self._DRAW_DROP_X_DELAY_AFTER_DROP
+                    or self._last_tracked_num_drops != len(self._get_drop_history())
+                    or (self._model.winning_player is not None) != (self._state == ViewState.GAME_OVER)
+                    or any(layer.is_dirty() or layer.is_animating() for layer in self._additional_layers))
 
     def _is_dirty(self, drop_x):
         return (len(self._drop_animations) > 0
                 or drop_x != self._last_drop_x
                 or self._dirty
-                or any([layer.is_dirty() for layer in self._additional_layers]))
+                or self._is_redraw_requested
+                or len(self._dirty_rects) > 0)
+
+    def _get_moving_rects(self, drop_x):
+        """
+        @return the Rects of the cursor, the drop preview and the dropping pieces, or None if there are too many
+            pieces dropping to redraw them separately
+        """
+        if len(self._drop_animations) > self._MAX_REDRAW_RECTS:
+            return None
+        rects = [self._get_piece_rect(drop_x, self._model.size_y)]
+        drop_y = self._model.get_drop_row(drop_x)
+        if drop_y >= 0:
+            rects.append(self._get_piece_rect(drop_x, drop_y))
+        for drop_animation in self._drop_animations:
+            rects.append(self._get_piece_rect(drop_animation.board_x, drop_animation.board_y))
+        return rects
 
-    def _draw_pieces_at_rest(self):
+    def _get_rects_to_redraw(self, drop_x, moving_rects=None):
+        """
+        @return the dirty Rects, merged so that none overlap, and clipped to the screen.  The whole screen if there
+            are too many to merge, e.g. while a large board is cleared.
+        """
+        if moving_rects is None:
+            moving_rects = self._get_moving_rects(drop_x)
+        screen_rect = self._screen.get_rect()
+        if moving_rects is None or self._last_moving_rects is None:
+            return [screen_rect]
+        dirty_rects = self._last_moving_rects + moving_rects + self._dirty_rects
+        # Merging is quadratic in the number of rects.
+        if len(dirty_rects) > self._MAX_REDRAW_RECTS:
+            return [screen_rect]
+        rects = []
+        for rect in dirty_rects:
+            rect = rect.clip(screen_rect)
+            if rect.width == 0 or rect.height == 0:
+                continue
+            # Merge overlapping rects, so no area is drawn twice.
+            collision_index = rect.collidelist(rects)
+            while collision_index >= 0:
+                rect.union_ip(rects.pop(collision_index))
+                collision_index = rect.collidelist(rects)
+            rects.append(rect)
+        return sorted(rects, key=tuple)
+
+    def _invalidate_static_surface(self):
+        self._static_surface = None
+
+    def _get_static_surface(self):
+        """
+        @return a Surface with the background, the pieces at rest and the board.  It is rebuilt only when
+            invalidated; pieces that come to rest are composited into it as they do.
+        """
+        if self._static_surface is None:
+            # In the screen's pixel format, for fast blits, without needing an initialized display.
+            self._static_surface = pygame.Surface(self._screen.get_size(), 0, self._screen)
+            self._static_surface.fill(self._BACKGROUND_COLOR)
+            self._draw_pieces_at_rest(self._static_surface)
+            self._static_surface.blit(self._board_surface, self._get_board_position())
+        return self._static_surface
+
+    def _draw_pieces_at_rest(self, surface):
+        radius = self._board_opening_radius
+        sprites = [self._piece_sprites.get_sprite(self._get_piece_color(piece, False), radius)
+                   for piece in (model.Piece.NONE, model.Piece.PLAYER1, model.Piece.PLAYER2)]
+        board_position = self._get_board_position()
+        # Pieces that are still dropping, or have not started to, are not at rest.
+        moving_piece_positions = set(self._drop_animations.get_final_positions())
+        moving_piece_positions.update((x, y) for _, x, y in self._get_drop_history()[self._last_tracked_num_drops:])
+        piece_blits = []
         for x in range(self._model.size_x):
             for y in range(self._model.size_y):
-                if self._has_dropping_piece_with_final_position(x, y):
-                    continue
                 piece = self._model.get_piece_at_opening(x, y)
-                if piece == model.Piece.NONE:
+                if piece == model.Piece.NONE or (x, y) in moving_piece_positions:
                     continue
-                self._draw_piece(piece, x, y)
+                center_x, center_y = self._get_opening_center(x, y, board_position)
+                piece_blits.append((sprites[piece], (center_x - radius, center_y - radius)))
+        surface.blits(piece_blits, doreturn=False)
+
+    def _composite_piece_at_rest(self, piece, x, y):
+        """
+        Adds a piece that came to rest to the static surface.
+
+        >>> game_view = View(model.Model(4, (7, 6)))
+        >>> static_surface = game_view._get_static_surface()
+        >>> game_view._model.drop_piece(model.Piece.PLAYER1, 0)
+        >>> game_view._track_newly_dropped_pieces()
+        >>> while game_view._drop_animations:
+        ...     game_view._drop_dropping_pieces()
+        >>> game_view._get_static_surface() is static_surface
+        True
+        >>> static_surface.get_at(game_view._get_opening_center(0, 0, game_view._get_board_position()))
+        (200, 0, 0, 255)
+        """
+        if self._static_surface is None:
+            return
+        sprite, position = self._get_piece_blit(piece, x, y, is_clipped=False)
+        self._static_surface.blit(sprite, position)
+        self._blit_board_over(self._static_surface, self._get_piece_rect(x, y))
+
+    def _blit_board_over(self, surface, rect):
+        """
+        Blits the part of the board within the rect, so that pieces in the rect appear behind the board.
+        """
+        board_x, board_y = self._get_board_position()
+        surface.blit(self._board_surface, rect.topleft, area=rect.move(-board_x, -board_y))
+
+    def _get_board_surface(self):
+        key = (self._board_opening_radius, self._board_opening_margin)
+        board_surface = self._board_surfaces.get(key)
+        if board_surface is None:
+            board_surface = self._create_board_surface()
+            self._board_surfaces[key] = board_surface
+            if len(self._board_surfaces) > self._MAX_CACHED_BOARD_SURFACES:
+                self._board_surfaces.popitem(last=False)
+        else:
+            self._board_surfaces.move_to_end(key)
+        return board_surface
 
     def _create_board_surface(self):
         """
@@ -200,37 +667,62 @@ class View:
         board_surface.blit(openings_surface, (0, 0), area=None, special_flags=pygame.BLEND_RGBA_SUB)
         return board_surface
 
-    def _draw_board(self):
-        x, y = self._get_board_position()
-        self._screen.blit(self._board_surface, (x, y))
-
-    def _has_dropping_piece_with_final_position(self, x, y):
+    def _draw_dropping_pieces(self):
         """
-        @return True if there is a dropping piece whose final position is (x, y), False otherwise.
+        Draws the dropping pieces with a single blits call, then the board over them, so they appear behind it.
         """
-        for drop_animation in self._drop_animations:
-            if x == drop_animation.board_x and y == drop_animation.board_y_final:
-                return True
-        return False
-
-    def _draw_dropping_pieces(self):
-        for drop_animation in self._drop_animations:
-            self._draw_piece(drop_animation.piece, drop_animation.board_x, drop_animation.board_y)
+        if not self._drop_animations:
+            return
+        radius = self._board_opening_radius
+        board_position = self._get_board_position()
+        sprites = [self._piece_sprites.get_sprite(self._get_piece_color(piece, False), radius)
+                   for piece in (model.Piece.NONE, model.Piece.PLAYER1, model.Piece.PLAYER2)]
+        column_lefts = [self._get_opening_center(x, 0, board_position)[0] - radius for x in range(self._model.size_x)]
+        piece_blits = []
+        for trajectory, drop_animations in self._drop_animations.get_groups():
+            # Every piece on a trajectory is at the same height.
+            top = self._get_opening_center(0, trajectory.board_y, board_position)[1] - radius
+            piece_blits += [(sprites[drop_animation.piece], (column_lefts[drop_animation.board_x], top))
+                            for drop_animation in drop_animations]
+        self._screen.blits(piece_blits, doreturn=False)
+
+        if len(piece_blits) > self._MAX_REDRAW_RECTS:
+            # Blitting the whole board once is cheaper than a blit per piece.
+            self._screen.blit(self._board_surface, board_position)
+        else:
+            board_x, board_y = board_position
+            board_blits = []
+            for drop_animation in self._drop_animations:
+                rect = self._get_piece_rect(drop_animation.board_x, drop_animation.board_y)
+                board_blits.append((self._board_surface, rect.topleft, rect.move(-board_x, -board_y)))
+            self._screen.blits(board_blits, doreturn=False)
 
     def _draw_piece(self, piece, x, y, potential_piece=False):
         """
         @param potential_piece (Boolean) if True, draws the piece as a potential piece
         """
-        color = self._get_piece_color(piece, potential_piece)
-        board_position = self._get_board_position()
-        self._draw_piece_onto_surface(self._screen, color, x, y, board_position)
+        piece_blit = self._get_piece_blit(piece, x, y, potential_piece)
+        if piece_blit is not None:
+            self._screen.blit(*piece_blit)
+
+    def _get_piece_blit(self, piece, x, y, potential_piece=False, is_clipped=True):
+        """
+        @param is_clipped if True, returns None for pieces outside of the clip rect
+        @return (sprite, position) to blit onto the screen, or None if the piece is outside of the clip rect
+        """
+        radius = self._board_opening_radius
+        center_x, center_y = self._get_opening_center(x, y, self._get_board_position())
+        if is_clipped and self._clip_rect is not None and not self._clip_rect.colliderect(self._get_piece_rect(x, y)):
+            return None
+        sprite = self._piece_sprites.get_sprite(self._get_piece_color(piece, potential_piece), radius)
+        return sprite, (center_x - radius, center_y - radius)
 
     def _draw_piece_onto_surface(self, surface, color, x, y, offset):
         """
         @param offset (x,y)
         """
         opening_center = self._get_opening_center(x, y, offset)
-        pygame.draw.circle(surface, color, opening_center, self._BOARD_OPENING_RADIUS)
+        pygame.draw.circle(surface, color, opening_center, self._board_opening_radius)
 
     def _draw_drop_x(self, drop_x):
         self._draw_piece(self._model.current_player_piece, drop_x, self._model.size_y)
@@ -241,16 +733,16 @@ class View:
             self._draw_piece(self._model.current_player_piece, drop_x, drop_y, potential_piece=True)
 
     def _get_board_position(self):
-        return self._BOARD_MARGIN, self._BOARD_MARGIN
+        return self._board_margin, self._board_margin
 
     def _get_board_rect(self):
         """Returns the (left, top, width, height) of the board."""
         board_x, board_y = self._get_board_position()
-        size_per_opening = self._BOARD_OPENING_MARGIN + 2*self._BOARD_OPENING_RADIUS
+        size_per_opening = self._board_opening_margin + 2*self._board_opening_radius
         return (board_x,
                 board_y,
-                self._BOARD_OPENING_MARGIN + self._model.size_x * size_per_opening,
-                self._BOARD_OPENING_MARGIN + self._model.size_y * size_per_opening)
+                self._board_opening_margin + self._model.size_x * size_per_opening,
+                self._board_opening_margin + self._model.size_y * size_per_opening)
 
     def _get_opening_center(self, x, y, offset):
         """
@@ -259,11 +751,21 @@ class View:
         offset_x, offset_y = offset
         flipped_y = self._model.size_y - y - 1
         return (int(offset_x
-                    + (x+1) * self._BOARD_OPENING_MARGIN
-                    + (2*x + 1) * self._BOARD_OPENING_RADIUS),
+                    + (x+1) * self._board_opening_margin
+                    + (2*x + 1) * self._board_opening_radius),
                 int(offset_y
-                    + (flipped_y+1) * self._BOARD_OPENING_MARGIN
-                    + (2*flipped_y + 1) * self._BOARD_OPENING_RADIUS))
+                    + (flipped_y+1) * self._board_opening_margin
+                    + (2*flipped_y + 1) * self._board_opening_radius))
+
+    def _get_piece_rect(self, x, y):
+        """
+        @param x,y the board position, which can be fractional for dropping pieces
+        @return the Rect that the piece covers on the screen
+        """
+        center_x, center_y = self._get_opening_center(x, y, self._get_board_position())
+        radius = self._board_opening_radius
+        # Leave a pixel of margin for the rasterization of the circle.
+        return pygame.Rect(center_x - radius - 1, center_y - radius - 1, 2*radius + 3, 2*radius + 3)
 
     def _get_piece_color(self, piece, potential_piece):
         if potential_piece:
@@ -279,7 +781,7 @@ class View:
     def _draw_player_won_message(self):
         message = self._get_player_won_message()
         message_color = pygame.Color(255, 255, 255)
-        message_surface = self._font.render(message, True, message_color)
+        message_surface = text_cache.render(text_cache.get_font(self._FONT_SIZE), message, True, message_color)
         message_rect = message_surface.get_rect()
         message_rect.topleft = (5, 5)
         self._screen.blit(message_surface, message_rect)
@@ -299,21 +801,70 @@ class View:
         board_position = self._get_board_position()
         line_start = self._get_opening_center(*winning_piece_positions[0], offset=board_position)
         line_end = self._get_opening_center(*winning_piece_positions[-1], offset=board_position)
-        line_width = self._BOARD_OPENING_RADIUS // 4
+        line_width = max(1, self._board_opening_radius // 4)
         pygame.draw.line(self._screen, color, line_start, line_end, line_width)
 
-    def tick(self):
-        # Wait long enough to run at a fixed FPS.
+    def wait_for_next_frame(self):
+        """
+        Waits long enough to run at a fixed FPS.  Call it before handling the frame's input rather than before
+        drawing, so that input which arrives during the wait is still drawn this frame.
+        """
+        wait_start_time = time.perf_counter()
         self._fps_clock.tick(self._DESIRED_FPS)
+        self.last_wait_time = time.perf_counter() - wait_start_time
+
+    def tick(self, elapsed_time=None):
+        """
+        Advances the animations by the time since the last tick, in fixed steps of _SIMULATION_STEP.  If frames
+        take longer, more steps run per tick, so the animations keep their speed while frames are skipped.
+        @param elapsed_time (seconds) the time to advance by, e.g. to render frames offscreen, or None to measure it
+
+        >>> game_model = model.Model(4, (7, 6))
+        >>> game_view = View(game_model)
+        >>> game_model.drop_piece(model.Piece.PLAYER1, 0)
+        >>> game_view.tick(elapsed_time=0)
+        >>> game_view._drop_animations.get_by_final_position(0, 0).board_y
+        6
+        >>> game_view.tick(elapsed_time=0.1)
+        >>> round(game_view._drop_animations.get_by_final_position(0, 0).board_y, 6)
+        5.36
+
+        Slow frames skip ahead by the same amount as several fast ones.
+        >>> fast_view, slow_view = View(model.Model(4, (7, 6))), View(model.Model(4, (7, 6)))
+        >>> for game_view in (fast_view, slow_view):
+        ...     game_view._model.drop_piece(model.Piece.PLAYER1, 0)
+        ...     game_view.tick(elapsed_time=0)
+        >>> for _ in range(6):
+        ...     fast_view.tick(elapsed_time=1 / 120)
+        >>> slow_view.tick(elapsed_time=1 / 20)
+        >>> (fast_view._drop_animations.get_by_final_position(0, 0).board_y
+        ...  == slow_view._drop_animations.get_by_final_position(0, 0).board_y)
+        True
+        """
+        if elapsed_time is None:
+            current_time = time.perf_counter()
+            elapsed_time = current_time - self._last_tick_time
+            self._last_tick_time = current_time
+        self.last_tick_elapsed_time = elapsed_time
 
         winning_player = self._model.winning_player
-        if winning_player is not None:
+        if winning_player is not None and self._state != ViewState.GAME_OVER:
             self._state = ViewState.GAME_OVER
+            self._dirty = True
 
-        self._track_newly_dropped_pieces()
-        self._drop_dropping_pieces()
+        if self._drop_animations or self._time_since_last_drop < self._DRAW_DROP_X_DELAY_AFTER_DROP:
+            self._unsimulated_time = min(self._unsimulated_time + elapsed_time, self._MAX_SIMULATION_TIME_PER_TICK)
+        else:
+            # Nothing was moving, e.g. the game loop was waiting for input, so new drops start from the top.
+            self._unsimulated_time = 0.0
 
-        self._time_since_last_drop += 1 / self._DESIRED_FPS
+        self._track_newly_dropped_pieces()
+        # Rounded, so that floating point error never drops a step.
+        num_steps = int(self._unsimulated_time / self._SIMULATION_STEP + 1e-9)
+        self._unsimulated_time = max(0.0, self._unsimulated_time - num_steps * self._SIMULATION_STEP)
+        for _ in range(num_steps):
+            self._drop_dropping_pieces()
+            self._time_since_last_drop += self._SIMULATION_STEP
 
         for layer in self._additional_layers:
             layer.tick()
@@ -324,7 +875,7 @@ class View:
         for drop_history_index in range(self._last_tracked_num_drops, num_drops):
             piece, x, y_final = drop_history[drop_history_index]
             y_initial = self._model.size_y
-            self._drop_animations.append(DropAnimation(piece, x, y_initial, y_final, bounce=True))
+            self._drop_animations.add(DropAnimation(piece, x, DropTrajectory(y_initial, y_final, bounce=True)))
             self._time_since_last_drop = 0
         self._last_tracked_num_drops = num_drops
 
@@ -332,43 +883,61 @@ class View:
         return self._model.drop_history
 
     def _drop_dropping_pieces(self):
-        delta_y = self._ANIMATION_SPEED_MULTIPLIER / self._DESIRED_FPS
-        finished_drop_animation_indices = []
-
-        for drop_animation_index, drop_animation in enumerate(self._drop_animations):
-            drop_finished = drop_animation.drop(delta_y)
-            if drop_finished:
-                finished_drop_animation_indices.append(drop_animation_index)
-
-        for drop_animation_index in reversed(finished_drop_animation_indices):
-            self._drop_animations.pop(drop_animation_index)
-
-            # This is necessary to draw the last frame of the animation.
-            # Otherwise the frame will be skipped (by optimization) when this is the last animation.
+        delta_y = self._ANIMATION_SPEED_MULTIPLIER * self._SIMULATION_STEP
+        finished_drop_animations = self._drop_animations.step(delta_y)
+        for drop_animation in finished_drop_animations:
+            if drop_animation.board_y_final >= 0:
+                self._composite_piece_at_rest(drop_animation.piece, drop_animation.board_x,
+                                              drop_animation.board_y_final)
+
+        # This is necessary to draw the last frame of the animation.
+        # Otherwise the frame will be skipped (by optimization) when this is the last animation.
+        if len(finished_drop_animations) > self._MAX_REDRAW_RECTS:
             self._dirty = True
+        else:
+            for drop_animation in finished_drop_animations:
+                self._dirty_rects.append(self._get_piece_rect(drop_animation.board_x, drop_animation.board_y_final))
 
     def drop_all_pieces_off_of_board_from_current_location(self):
-        drop_history = self._get_drop_history()
+        """
+        >>> game_model = model.Model(4, (7, 6))
+        >>> game_view = View(game_model)
+        >>> for x in (0, 0, 1):
+        ...     game_model.drop_piece(game_model.current_player_piece, x)
+        ...     game_model.end_turn()
+        >>> game_view.tick(elapsed_time=0)
+        >>> game_view.drop_all_pieces_off_of_board_from_current_location()
+        >>> len(game_view._drop_animations), len(game_view._drop_animations.get_final_positions())
+        (3, 0)
+
+        Pieces at rest fall off a row at a time.
+        >>> while game_view._drop_animations:
+        ...     game_view._drop_dropping_pieces()
+        >>> game_view.drop_all_pieces_off_of_board_from_current_location()
+        >>> len(game_view._drop_animations), len(game_view._drop_animations.get_groups())
+        (3, 2)
+        """
         y_final = -1
-        existing_drop_animations = self._drop_animations.copy()
-        for piece, x, y_initial in drop_history:
-            has_existing_drop_animation = False
-            for exiting_drop_animation in existing_drop_animations:
-                if exiting_drop_animation.board_x == x and exiting_drop_animation.board_y_final == y_initial:
-                    exiting_drop_animation.board_y_final = y_final
-                    exiting_drop_animation.prevent_new_bounce()
-                    has_existing_drop_animation = True
-                    break
-            if has_existing_drop_animation:
+        trajectories = {}  # {board_y_initial: DropTrajectory, ...}, so that each row falls as one
+        for piece, x, y_initial in self._get_drop_history():
+            existing_drop_animation = self._drop_animations.get_by_final_position(x, y_initial)
+            if existing_drop_animation is not None:
+                self._drop_animations.drop_off_board(existing_drop_animation)
                 continue
-            self._drop_animations.append(DropAnimation(piece, x, y_initial, y_final, bounce=False))
+            trajectory = trajectories.get(y_initial)
+            if trajectory is None:
+                trajectory = DropTrajectory(y_initial, y_final, bounce=False)
+                trajectories[y_initial] = trajectory
+            self._drop_animations.add(DropAnimation(piece, x, trajectory))
 
     def add_layer(self, drawable):
         """
         @param drawable is an object that contains the following methods:
             is_dirty() -> bool
+            is_animating() -> bool, True if the layer changes on its own, so the view must keep ticking
             draw(Surface) -> None
             tick() -> None
+            get_rect(Surface) -> Rect, the area that draw() covers on the Surface, which is empty if nothing
         """
         return self._additional_layers.append(drawable)
 
@@ -379,7 +948,7 @@ def run_tests(headless: bool) -> Tuple[Tuple[int, int], Set[ModuleType]]:
     """
     import sys
     import test
-    return test.run_doctests(sys.modules[__name__], module_dependencies=[model], headless=headless)
+    return test.run_doctests(sys.modules[__name__], module_dependencies=[model, text_cache], headless=headless)
 
 
 if __name__ == '__main__':